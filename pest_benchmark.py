@@ -0,0 +1,1254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+虫害情况自动提取工具 - 性能基准
+
+每个子命令对应一项优化，输出耗时对比，并校验优化前后结果一致。
+
+使用方法：
+  python pest_benchmark.py workers --pdf report.pdf [--workers 8]
+  python pest_benchmark.py parse [--lines 100000]
+  python pest_benchmark.py backend --pdf a.pdf b.pdf
+  python pest_benchmark.py memory [--records 1000000]
+  python pest_benchmark.py startup
+  python pest_benchmark.py excel [--records 100000]
+  python pest_benchmark.py pipeline [--records 20000]
+  python pest_benchmark.py render [--records 20000]
+  python pest_benchmark.py verify [--records 100000]
+  python pest_benchmark.py export [--records 200000]
+  python pest_benchmark.py engine [--records 100000]
+  python pest_benchmark.py report [--records 100000]
+  python pest_benchmark.py cube [--records 200000]
+  python pest_benchmark.py history [--reports 100] [--records 10000]
+  python pest_benchmark.py append [--master-records 300000] [--records 5000]
+  python pest_benchmark.py trend [--reports 500] [--records 2000]
+  python pest_benchmark.py metadata --pdf report.pdf [--repeat 20]
+  python pest_benchmark.py anomaly [--records 100000] [--reports 12]
+  python pest_benchmark.py diff [--records 200000] [--pdf report.pdf]
+  python pest_benchmark.py query [--reports 100] [--records 20000]
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pest_report_extractor as pre
+
+
+@contextlib.contextmanager
+def _quiet():
+    """屏蔽被测代码的进度输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _timed(func, *args, **kwargs):
+    """执行一次并返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _print_table(title, rows):
+    """打印 (名称, 耗时, 备注) 形式的对比表"""
+    print(f"\n{title}")
+    print("-" * 60)
+    baseline = rows[0][1]
+    for name, elapsed, note in rows:
+        speedup = baseline / elapsed if elapsed else float('inf')
+        print(f"  {name:<24} {elapsed:>9.3f}s  x{speedup:<6.2f} {note}")
+
+
+def bench_workers(args):
+    """串行与多进程排版的耗时对比，并校验两种模式提取结果完全一致"""
+    rows = []
+    results = {}
+    for workers in [1] + [n for n in args.workers if n > 1]:
+        extractor = pre.PestReportExtractor()
+        with _quiet():
+            ok, elapsed = _timed(
+                extractor.extract_pest_data_from_pdf, args.pdf,
+                streaming=not args.full_scan, locate=not args.full_scan, workers=workers
+            )
+        if not ok:
+            print(f"❌ 提取失败 (workers={workers})")
+            return 1
+        results[workers] = list(extractor.pest_data)
+        rows.append((f"workers={workers}", elapsed,
+                     f"{extractor.pages_laid_out} 页, {len(extractor.pest_data)} 条"))
+
+    _print_table(f"并行页面排版: {args.pdf}", rows)
+
+    serial = results[1]
+    for workers, records in results.items():
+        if records != serial:
+            print(f"❌ workers={workers} 的提取结果与串行模式不一致")
+            return 1
+    print("✅ 所有并行模式的提取结果与串行模式完全一致")
+    return 0
+
+
+_PEST_TYPES = ["绿化飞虫", "鼠", "蟑螂", "苍蝇", "蚊子", "蚂蚁"]
+_BUILDINGS = ["A座", "B座", "C座", "D座", "地下车库"]
+_DEPARTMENTS = ["厨房", "仓库", "大堂", "办公区", "垃圾房", "配电房"]
+
+
+def synthetic_records(count, seed=0):
+    """生成可复现的合成虫害记录"""
+    rnd = random.Random(seed)
+    return [
+        {
+            '建筑物': rnd.choice(_BUILDINGS),
+            '楼层': f"{rnd.randint(1, 30)}F",
+            '部门': rnd.choice(_DEPARTMENTS),
+            '检查/发现监测点位': f"粘鼠板-{rnd.randint(1, 500)}",
+            '虫害类型': rnd.choice(_PEST_TYPES),
+            '发现虫害活动': rnd.randint(1, 50),
+        }
+        for _ in range(count)
+    ]
+
+
+def synthetic_section(lines, wrap_ratio=0.0, seed=0):
+    """生成约 lines 行的合成虫害情况文本；wrap_ratio 比例的记录详情折成两行
+
+    折行的记录一半在"检查/发现监测点位"标签之前折行，一半在监测点位的值中间折行。
+    """
+    rnd = random.Random(seed)
+    out = ["虫害情况"]
+    for record in synthetic_records(lines // 2, seed):
+        out.append(f"{record['虫害类型']} 发现虫害活动 - {record['发现虫害活动']}")
+        detail = (f"建筑物: {record['建筑物']}, 楼层: {record['楼层']}, 部门: {record['部门']}, "
+                  f"检查/发现监测点位: {record['检查/发现监测点位']}")
+        if rnd.random() < wrap_ratio:
+            if rnd.random() < 0.5:
+                cut = detail.index("检查/发现监测点位")
+            else:
+                cut = len(detail) - rnd.randint(1, len(record['检查/发现监测点位']) - 1)
+            out.extend([detail[:cut], detail[cut:]])
+        else:
+            out.append(detail)
+    return "\n".join(out) + "\n"
+
+
+def _legacy_parse_pest_records(text):
+    """优化前的逐行解析实现（循环内按模式字符串匹配，只向后看一行），作为对比基线"""
+    records = []
+    text = text.replace('\x01', ' ')
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        line = line.strip()
+        pest_match = re.match(r'^([\u4e00-\u9fa5]+)\s+发现虫害活动\s*[-–—]\s*(\d+)', line)
+        if pest_match:
+            pest_type = pest_match.group(1)
+            count = int(pest_match.group(2))
+            if i + 1 < len(lines):
+                next_line = lines[i + 1].strip()
+                building_match = re.search(
+                    r'建筑物:\s*([^,]+),\s*楼层:\s*([^,]+),\s*部门:\s*([^,]+),\s*检查/发现监测点位:\s*(.+)',
+                    next_line
+                )
+                if building_match:
+                    records.append({
+                        '建筑物': building_match.group(1).strip(),
+                        '楼层': building_match.group(2).strip(),
+                        '部门': building_match.group(3).strip(),
+                        '检查/发现监测点位': building_match.group(4).strip(),
+                        '虫害类型': pest_type,
+                        '发现虫害活动': count
+                    })
+    return records
+
+
+def bench_parse(args):
+    """虫害记录解析器微基准：旧的逐行解析 vs 预编译单次遍历解析"""
+    section = synthetic_section(args.lines, args.wrap_ratio)
+    best_legacy = best_new = float('inf')
+    for _ in range(args.repeat):
+        legacy, elapsed = _timed(_legacy_parse_pest_records, section)
+        best_legacy = min(best_legacy, elapsed)
+        rejects = []
+        records, elapsed = _timed(lambda: list(pre.iter_pest_records(section, rejects)))
+        best_new = min(best_new, elapsed)
+
+    _print_table(f"虫害记录解析: {args.lines} 行（折行比例 {args.wrap_ratio:.0%}，取 {args.repeat} 次最优）", [
+        ("逐行解析（旧）", best_legacy, f"{len(legacy)} 条"),
+        ("单次遍历解析", best_new, f"{len(records)} 条, {len(rejects)} 行未解析"),
+    ])
+
+    if args.wrap_ratio == 0 and records != legacy:
+        print("❌ 无折行时新旧解析结果不一致")
+        return 1
+    expected = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.lines // 2)]
+    if records != expected:
+        print(f"❌ 解析结果与生成的 {len(expected)} 条记录不一致（共解析出 {len(records)} 条）")
+        return 1
+    print("✅ 解析结果校验通过")
+    return 0
+
+
+def _record_key(record):
+    return tuple(record[field] for field in pre.PEST_FIELDS)
+
+
+def bench_backend(args):
+    """text 与 words 两种页面文本提取后端的速度及记录召回率对比（以 text 后端为基准）"""
+    totals = collections.defaultdict(float)
+    found = collections.Counter()
+    for pdf_path in args.pdf:
+        records = {}
+        rows = []
+        for backend in ('text', 'words'):
+            extractor = pre.PestReportExtractor()
+            with _quiet():
+                _, elapsed = _timed(
+                    extractor.extract_pest_data_from_pdf, pdf_path,
+                    streaming=not args.full_scan, locate=not args.full_scan, backend=backend
+                )
+            records[backend] = collections.Counter(_record_key(record) for record in extractor.pest_data)
+            totals[backend] += elapsed
+            rows.append([backend, elapsed, extractor])
+
+        baseline = records['text']
+        for row in rows:
+            backend, extractor = row[0], row.pop()
+            matched = sum((records[backend] & baseline).values())
+            found[backend] += matched
+            recall = matched / sum(baseline.values()) if baseline else 1.0
+            row.append(f"{len(extractor.pest_data)} 条, 召回率 {recall:.1%}, "
+                       f"{len(extractor.parse_rejects)} 行未解析")
+        _print_table(f"提取后端: {pdf_path}", rows)
+
+    if len(args.pdf) > 1:
+        expected = found['text']
+        _print_table(f"合计 {len(args.pdf)} 个PDF", [
+            (backend, totals[backend],
+             f"召回率 {found[backend] / expected:.1%}" if expected else "")
+            for backend in ('text', 'words')
+        ])
+    return 0
+
+
+def _iter_parsed_fields(count, seed=0):
+    """模拟解析过程逐条产出字段：每条记录的字符串都是新建对象（与正则分组结果一样）"""
+    for record in synthetic_records(count, seed):
+        yield tuple((value + "\0")[:-1] if isinstance(value, str) else value
+                    for value in record.values())
+
+
+def _retained_memory(build):
+    """返回 build() 结果常驻的内存字节数"""
+    tracemalloc.start()
+    try:
+        result = build()
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return retained
+
+
+def bench_memory(args):
+    """字典记录与 PestRecord 紧凑记录的内存占用对比"""
+    count = args.records
+    dict_bytes = _retained_memory(
+        lambda: [dict(zip(pre.PEST_FIELDS, fields)) for fields in _iter_parsed_fields(count)]
+    )
+    record_bytes = _retained_memory(
+        lambda: [pre.PestRecord(*fields) for fields in _iter_parsed_fields(count)]
+    )
+
+    scale = 1_000_000 / count
+    print(f"\n记录内存占用: {count} 条（换算为每100万条）")
+    print("-" * 60)
+    for name, retained in (("dict 记录", dict_bytes), ("PestRecord", record_bytes)):
+        print(f"  {name:<24} {retained * scale / 1024 / 1024:>9.1f} MB  "
+              f"{retained / count:>7.1f} 字节/条")
+    print(f"  节省 {1 - record_bytes / dict_bytes:.1%}")
+    return 0
+
+
+_HEAVY_MODULES = ('pandas', 'pdfplumber', 'openpyxl', 'tkinter', 'numpy')
+
+# 启动耗时测量的入口：(名称, 命令行参数)
+_STARTUP_ENTRIES = [
+    ("pest_report_extractor.py --help", ["pest_report_extractor.py", "--help"]),
+    ("import pest_report_extractor", ["-c", "import pest_report_extractor"]),
+]
+
+
+def _importtime(argv):
+    """用 python -X importtime 运行一次，返回 (墙钟耗时, 导入总耗时秒数, 已导入的重量级依赖)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, cwd=here,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+
+    total_us = 0
+    heavy = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        module = name.strip()
+        if not name[1:].startswith(" "):
+            # 顶层导入的累计耗时之和即总导入耗时
+            total_us += int(cumulative)
+        if module.split(".")[0] in _HEAVY_MODULES:
+            heavy.add(module.split(".")[0])
+    return wall, total_us / 1e6, heavy
+
+
+def bench_startup(args):
+    """各入口的启动耗时（python -X importtime），并列出启动时加载了哪些重量级依赖"""
+    print(f"\n启动耗时（每个入口运行 {args.repeat} 次取中位数）")
+    print("-" * 60)
+    for name, argv in _STARTUP_ENTRIES:
+        runs = [_importtime(argv) for _ in range(args.repeat)]
+        wall = statistics.median(run[0] for run in runs)
+        imports = statistics.median(run[1] for run in runs)
+        heavy = sorted(set().union(*(run[2] for run in runs)))
+        print(f"  {name:<34} 墙钟 {wall:>6.3f}s  导入 {imports:>6.3f}s  "
+              f"重量级依赖: {', '.join(heavy) if heavy else '无'}")
+    return 0
+
+
+def _max_rss_mb():
+    """当前进程的峰值常驻内存（MB）"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_child(argv):
+    """在独立子进程中运行一个测量，返回其输出的 JSON 结果（峰值内存互不干扰）"""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__)] + argv,
+                          stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def excel_child(args):
+    """子进程：用指定模式和引擎写出 Excel，输出耗时和峰值内存增量"""
+    extractor = pre.PestReportExtractor()
+    extractor.pest_data = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    # 预先导入写出引擎（生成报告时还有 pandas），避免把导入开销计入写出耗时
+    import openpyxl  # noqa: F401
+    if args.engine == 'xlsxwriter':
+        import xlsxwriter  # noqa: F401
+    if args.report:
+        import pandas  # noqa: F401
+    baseline = _max_rss_mb()
+    with _quiet():
+        _, elapsed = _timed(extractor.create_excel, args.output,
+                            filename=f"{args.engine}_{args.mode}.xlsx",
+                            write_only=args.mode == 'write_only', with_report=args.report,
+                            engine=args.engine)
+    print(json.dumps({'elapsed': elapsed, 'peak_mb': _max_rss_mb() - baseline}))
+    return 0
+
+
+def bench_excel(args):
+    """普通工作簿与流式（write-only）工作簿写出数据表的耗时和峰值内存对比"""
+    rows = []
+    with tempfile.TemporaryDirectory() as output:
+        for mode, name in (('normal', "普通工作簿"), ('write_only', "流式工作簿")):
+            result = _run_child(['_excel-child', '--mode', mode, '--records', str(args.records),
+                                 '--output', output])
+            rows.append((name, result['elapsed'], f"峰值内存增量 {result['peak_mb']:.1f} MB"))
+    _print_table(f"Excel数据表写出: {args.records} 条记录", rows)
+    return 0
+
+
+def bench_engine(args):
+    """openpyxl 与 xlsxwriter（constant_memory）写出数据表和分析报告的耗时和峰值内存对比"""
+    rows = []
+    with tempfile.TemporaryDirectory() as output:
+        for engine, mode, name in (('openpyxl', 'normal', "openpyxl 普通工作簿"),
+                                   ('openpyxl', 'write_only', "openpyxl 流式工作簿"),
+                                   ('xlsxwriter', 'write_only', "xlsxwriter constant_memory")):
+            result = _run_child(['_excel-child', '--mode', mode, '--engine', engine, '--report',
+                                 '--records', str(args.records), '--output', output])
+            rows.append((name, result['elapsed'], f"峰值内存增量 {result['peak_mb']:.1f} MB"))
+    _print_table(f"Excel写出引擎（含分析报告）: {args.records} 条记录", rows)
+    return 0
+
+
+# 分析报告统计各项的名称（与 _pandas_report_stats 返回值的顺序一致）
+_REPORT_STATS_NAMES = ['总记录数', '虫害总数', '平均密度', '最大单点', '虫害类型统计', '建筑物统计', 'TOP10']
+
+
+def _pandas_report_stats(records):
+    """原先基于 pandas 的分析报告统计（groupby / sum / nlargest），作为对照"""
+    import pandas as pd
+
+    df = pd.DataFrame([record.astuple() for record in records], columns=pre.PEST_FIELDS)
+    total_records = len(df)
+    total_pests = df['发现虫害活动'].sum()
+    avg_density = total_pests / total_records if total_records > 0 else 0
+    max_single = df['发现虫害活动'].max()
+
+    def group(column):
+        stats = df.groupby(column).agg({
+            column: 'count',
+            '发现虫害活动': 'sum'
+        }).rename(columns={column: '记录数', '发现虫害活动': '总数量'})
+        stats['占比'] = (stats['总数量'] / total_pests * 100).round(1)
+        stats = stats.sort_values('总数量', ascending=False)
+        rows = [(key, int(data['记录数']), int(data['总数量']), f"{data['占比']}%")
+                for key, data in stats.iterrows()]
+        # sort_values 默认的 quicksort 不稳定，总数量并列的分组顺序随 numpy 的排序实现而变；
+        # 聚合器固定按键升序排列并列分组，对照时按同样规则整理
+        return sorted(rows, key=lambda row: (-row[2], row[0]))
+
+    top = df.nlargest(10, '发现虫害活动')
+    return (total_records, f'{total_pests}', f'{avg_density:.1f}', f'{max_single}',
+            group('虫害类型'), group('建筑物'), [tuple(row) for row in top.itertuples(index=False)])
+
+
+def _aggregated_report_stats(records):
+    """aggregate_records 的结果，整理成与 _pandas_report_stats 相同的形式（按报告中的显示格式）"""
+    stats = pre.aggregate_records(records)
+    return (stats.total_records, f'{stats.total_pests}', f'{stats.avg_density:.1f}', f'{stats.max_single}',
+            [(g.key, g.records, g.total, f"{g.share}%") for g in stats.pest_types],
+            [(g.key, g.records, g.total, f"{g.share}%") for g in stats.buildings],
+            [record.astuple() for record in stats.top])
+
+
+def _random_report_case(rnd):
+    """随机生成一组记录：分组数和数量范围都很小，制造大量并列"""
+    buildings = [f"{chr(65 + i)}座" for i in range(rnd.randint(1, 12))]
+    pest_types = rnd.sample(_PEST_TYPES, rnd.randint(1, len(_PEST_TYPES)))
+    max_count = rnd.choice([1, 2, 3, 10, 1000])
+    return [
+        pre.PestRecord(rnd.choice(buildings), f"{rnd.randint(1, 5)}F", rnd.choice(_DEPARTMENTS),
+                       f"粘鼠板-{i}", rnd.choice(pest_types), rnd.randint(0, max_count))
+        for i in range(rnd.randint(1, 300))
+    ]
+
+
+def bench_report(args):
+    """分析报告统计：pandas 与单次遍历聚合器的耗时和导入开销，并校验结果一致
+
+    随机用例的逐项一致性校验见 tests/test_report_stats.py。
+    """
+    records = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    expected, pandas_elapsed = _timed(_pandas_report_stats, records)
+    _, aggregate_elapsed = _timed(pre.aggregate_records, records)
+    if _aggregated_report_stats(records) != expected:
+        print("❌ 聚合器统计结果与 pandas 不一致")
+        return 1
+    _print_table(f"分析报告统计: {args.records} 条记录（pandas 已预先导入）", [
+        ("pandas groupby/nlargest", pandas_elapsed, "含构造 DataFrame"),
+        ("单次遍历聚合器", aggregate_elapsed, ""),
+    ])
+    print("✅ 聚合器统计结果与 pandas 完全一致")
+
+    pandas_import = statistics.median(_importtime(['-c', 'import pandas'])[1] for _ in range(3))
+    print(f"\n  import pandas 耗时 {pandas_import:.3f}s（聚合器无需导入）")
+    return 0
+
+
+def _scan_group(records, *attributes):
+    """对原始记录做一次完整扫描，按属性分组累加 [记录数, 总数量]"""
+    groups = {}
+    for record in records:
+        key = tuple(getattr(record, attribute) for attribute in attributes)
+        key = key[0] if len(key) == 1 else key
+        group = groups.setdefault(key, [0, 0])
+        group[0] += 1
+        group[1] += record.count
+    return groups
+
+
+def _per_section_scans(records):
+    """每个报告部分各自扫描一遍原始记录（概览、四个维度统计、TOP10、建筑物×虫害类型矩阵）"""
+    total_pests = sum(record.count for record in records)
+    max_single = max(record.count for record in records)
+    sections = {attribute: _scan_group(records, attribute) for attribute in pre.RollupCube.DIMENSIONS}
+    sections['matrix'] = _scan_group(records, 'building', 'pest_type')
+    top = [record.astuple() for record in
+           sorted(records, key=lambda record: record.count, reverse=True)[:10]]
+    return len(records), total_pests, max_single, sections, top
+
+
+def _cube_sections(records):
+    """构建一次统计立方体，各报告部分都从立方体上卷得到"""
+    cube = pre.RollupCube.from_records(records)
+    sections = {dimension: cube.rollup(dimension) for dimension in pre.RollupCube.DIMENSIONS}
+    sections['matrix'] = cube.rollup('building', 'pest_type')
+    top = [record.astuple() for record in cube.top()]
+    return cube.total_records, cube.total_pests, cube.max_single, sections, top
+
+
+def bench_cube(args):
+    """逐部分扫描原始记录与一次构建统计立方体后上卷的耗时对比，并校验结果一致"""
+    records = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    scans, scan_elapsed = _timed(_per_section_scans, records)
+    cube, cube_elapsed = _timed(_cube_sections, records)
+    if scans != cube:
+        print("❌ 统计立方体上卷结果与逐部分扫描不一致")
+        return 1
+    cells = len(pre.RollupCube.from_records(records).cells)
+    _print_table(f"报告各部分统计: {args.records} 条记录", [
+        ("逐部分扫描（7次）", scan_elapsed, ""),
+        ("统计立方体（1次）", cube_elapsed, f"{cells} 个组合"),
+    ])
+
+    cube = pre.RollupCube.from_records(records)
+    extractor = pre.PestReportExtractor()
+    _, pivot_elapsed = _timed(extractor._draw_pivot_sheet, pre.SheetCanvas(), cube)
+    print(f"\n  从已有立方体绘制透视工作表: {pivot_elapsed * 1000:.1f}ms（不再访问原始记录）")
+    print("✅ 统计立方体上卷结果与逐部分扫描一致")
+    return 0
+
+
+def _history_trend(reports, **filters):
+    """直接遍历内存中的记录计算趋势，作为 SQLite 查询结果的对照"""
+    trend = collections.defaultdict(lambda: [0, 0])
+    for report_date, records in reports:
+        for record in records:
+            if all(getattr(record, column) == value for column, value in filters.items()):
+                trend[report_date][0] += 1
+                trend[report_date][1] += record.count
+    return [(report_date, records, total) for report_date, (records, total) in sorted(trend.items())]
+
+
+def bench_history(args):
+    """SQLite 历史库的入库与趋势查询吞吐量，并校验查询结果与内存中直接汇总一致"""
+    import datetime
+    import sqlite3
+
+    records = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    start_date = datetime.date(2024, 1, 1)
+    reports = []
+    for index in range(args.reports):
+        # 每份报告打乱一次数量，模拟不同日期的监测结果
+        rng = random.Random(index)
+        report = [pre.PestRecord(*record.astuple()[:5], rng.randint(0, 30)) for record in records]
+        reports.append(((start_date + datetime.timedelta(days=7 * index)).isoformat(), report))
+    total_rows = args.reports * args.records
+
+    with tempfile.TemporaryDirectory() as output:
+        store = pre.HistoryStore(os.path.join(output, "history.db"))
+        start = time.perf_counter()
+        for index, (report_date, report) in enumerate(reports):
+            store.ingest(report, f"report_{index}.pdf", f"hash_{index}", report_date)
+        ingest_elapsed = time.perf_counter() - start
+        size_mb = sum(os.path.getsize(path) for path in (store.db_path, f"{store.db_path}-wal")
+                      if os.path.exists(path)) / 1024 / 1024
+
+        # 对照：逐条自动提交（每条记录一个事务）
+        sample = reports[0][1][:min(2000, args.records)]
+        conn = sqlite3.connect(os.path.join(output, "autocommit.db"), isolation_level=None)
+        conn.executescript(pre.HistoryStore.SCHEMA)
+        start = time.perf_counter()
+        for record in sample:
+            conn.execute(
+                "INSERT INTO records (report_id, building, floor, department, location, pest_type, count)"
+                " VALUES (1, ?, ?, ?, ?, ?, ?)", record.astuple()
+            )
+        autocommit_elapsed = time.perf_counter() - start
+        conn.close()
+
+        print(f"\n历史库入库: {args.reports} 份报告 × {args.records} 条 = {total_rows:,} 条记录")
+        print("-" * 60)
+        print(f"  每份报告一个事务        {ingest_elapsed:>9.3f}s  {total_rows / ingest_elapsed:>12,.0f} 条/秒  {size_mb:.1f}MB")
+        print(f"  逐条自动提交（{len(sample)}条）  {autocommit_elapsed:>9.3f}s  "
+              f"{len(sample) / autocommit_elapsed:>12,.0f} 条/秒")
+
+        building, pest_type, location = records[0].building, records[0].pest_type, records[0].location
+        queries = [
+            ("全部", {}),
+            (f"建筑物={building}", {'building': building}),
+            (f"虫害类型={pest_type}", {'pest_type': pest_type}),
+            (f"点位={location}", {'location': location}),
+        ]
+        print("\n趋势查询（按报告日期汇总）")
+        print("-" * 60)
+        for name, filters in queries:
+            result, elapsed = _timed(store.trend, **filters)
+            expected, scan_elapsed = _timed(_history_trend, reports, **filters)
+            if result != expected:
+                print(f"❌ 趋势查询结果与直接汇总不一致: {name}")
+                return 1
+            rows = sum(row[1] for row in result)
+            plan = " ".join(row[-1] for row in store.conn.execute(
+                "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM records WHERE "
+                + (" AND ".join(f"{column} = ?" for column in filters) or "1"),
+                list(filters.values())
+            ))
+            index = re.search(r"INDEX (\w+)", plan)
+            print(f"  {name:<28} {elapsed:>9.3f}s  命中 {rows:>9,} 条  "
+                  f"内存直接汇总 {scan_elapsed:.3f}s  {index.group(1) if index else '全表扫描'}")
+
+        # 同一内容哈希重新入库时替换旧数据，不产生重复记录
+        report_date, report = reports[0]
+        store.ingest(report, "report_0.pdf", "hash_0", report_date)
+        stored = store.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        store.close()
+    if stored != total_rows:
+        print(f"❌ 重复入库后记录数为 {stored}，应为 {total_rows}")
+        return 1
+    print("✅ 趋势查询结果与直接汇总一致，重复入库不产生重复记录")
+    return 0
+
+
+# 报告信息解析用例：(首页文本, 期望的 (报告编号, 客户名称, 服务日期))
+_METADATA_CASES = [
+    ("服务报告\n报告编号: SR-2025-0042\n客户名称: 星光购物中心\n服务日期: 2025-10-15\n",
+     ("SR-2025-0042", "星光购物中心", "2025-10-15")),
+    ("报 告 编 号：A/2024/7\r\n客 户：滨江 酒店\r\n服务日期：2024年3月5日\r\n",
+     ("A/2024/7", "滨江酒店", "2024-03-05")),
+    ("客户名称: 一号仓库 服务日期: 2023/12/01\n", (None, "一号仓库", "2023-12-01")),
+    ("服务日期: 2023-02-30\n报告编号: X1\n", ("X1", None, None)),
+    ("其他内容\n", (None, None, None)),
+]
+
+
+def _full_raw_scan(extractor, pdf_path):
+    """遍历全部页面的原始文本（作为“整份文档扫描一遍”的耗时对照）"""
+    return sum(1 for _ in extractor._iter_raw_page_texts(pdf_path))
+
+
+def bench_metadata(args):
+    """报告信息提取：只读前几页与遍历整份文档的耗时对比，并校验解析用例"""
+    for text, expected in _METADATA_CASES:
+        result = tuple(pre.parse_report_metadata([text]))
+        if result != expected:
+            print(f"❌ 报告信息解析结果 {result} 与期望 {expected} 不一致: {text!r}")
+            return 1
+
+    extractor = pre.PestReportExtractor()
+    with _quiet():
+        metadata = extractor.extract_report_metadata(args.pdf)
+    header_times = [_timed(extractor.extract_report_metadata, args.pdf)[1] for _ in range(args.repeat)]
+    scan_times = []
+    for _ in range(args.repeat):
+        pages, elapsed = _timed(_full_raw_scan, extractor, args.pdf)
+        scan_times.append(elapsed)
+    _print_table(f"报告信息提取: {os.path.basename(args.pdf)}（{pages} 页，各 {args.repeat} 次取中位数）", [
+        ("遍历全部页面原始文本", statistics.median(scan_times), ""),
+        (f"只读前 {pre.HEADER_PAGES} 页", statistics.median(header_times), ""),
+    ])
+    print(f"\n  {metadata}")
+    print(f"✅ {len(_METADATA_CASES)} 个解析用例全部通过")
+    return 0
+
+
+def _python_scores(current, history):
+    """逐点位用 statistics.median 计算稳健 z 分数，作为 score_anomalies 的对照"""
+    scores = []
+    for value, row in zip(current, history):
+        baseline = statistics.median(row)
+        mad = statistics.median(abs(count - baseline) for count in row)
+        scores.append((value - baseline) / max(mad * 1.4826, pre.ANOMALY_MIN_SCALE))
+    return scores
+
+
+def bench_anomaly(args):
+    """异常点位检测：逐点位 Python 循环与 NumPy 向量化打分的耗时对比，并校验结果一致、注入的异常全部检出"""
+    import numpy as np
+
+    rng = random.Random(0)
+    history = [[rng.randint(0, 20) for _ in range(args.reports)] for _ in range(args.records)]
+    current = [rng.randint(0, 40) for _ in range(args.records)]
+    expected, python_elapsed = _timed(_python_scores, current, history)
+    history_matrix = np.array(history, dtype=float)
+    current_array = np.array(current, dtype=float)
+    (_, _, scores), numpy_elapsed = _timed(pre.score_anomalies, current_array, history_matrix)
+    if not np.allclose(scores, expected):
+        print("❌ 向量化打分与逐点位计算的结果不一致")
+        return 1
+    _print_table(f"打分: {args.records:,} 个点位 × {args.reports} 期历史", [
+        ("逐点位 statistics.median", python_elapsed, ""),
+        ("NumPy 向量化", numpy_elapsed, f"{args.records / numpy_elapsed:,.0f} 点位/秒"),
+    ])
+
+    # 端到端：从历史库读出最近几期的点位矩阵并为新报告打分，每1000个点位注入一个异常
+    import datetime
+
+    base = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    start_date = datetime.date(2020, 1, 1)
+    with tempfile.TemporaryDirectory() as output:
+        db_path = os.path.join(output, "history.db")
+        store = pre.HistoryStore(db_path)
+        for index in range(args.reports):
+            rng = random.Random(index)
+            report = [pre.PestRecord(*record.astuple()[:5], rng.randint(0, 5)) for record in base]
+            store.ingest(report, f"report_{index}.pdf", f"hash_{index}",
+                         (start_date + datetime.timedelta(days=7 * index)).isoformat())
+        store.close()
+
+        extractor = pre.PestReportExtractor()
+        extractor.metadata = pre.ReportMetadata(None, None, "2099-01-01")
+        extractor.pest_data = [pre.PestRecord(*record.astuple()[:5], 100 if index % 1000 == 0 else 0)
+                               for index, record in enumerate(base)]
+        injected = {pre.point_key(record.astuple()) for record in extractor.pest_data if record.count}
+        store = pre.HistoryStore(db_path)
+        keys = [pre.point_key(record.astuple()) for record in extractor.pest_data]
+        _, load_elapsed = _timed(store.point_history, keys, "2099-01-01")
+        store.close()
+        with _quiet():
+            anomalies, elapsed = _timed(extractor.detect_anomalies, db_path)
+    _print_table(f"端到端检测: {args.records:,} 条记录，历史库 {args.reports} 期", [
+        ("读取历史点位矩阵", load_elapsed, ""),
+        ("detect_anomalies 合计", elapsed, f"{len(anomalies)} 个异常点位"),
+    ])
+    if {pre.point_key(anomaly.record.astuple()) for anomaly in anomalies} != injected:
+        print(f"❌ 检出的异常点位与注入的 {len(injected)} 个不一致")
+        return 1
+    print(f"✅ 向量化打分与逐点位计算一致，注入的 {len(injected)} 个异常点位全部检出且没有误报")
+    return 0
+
+
+def _pandas_diff(old_records, new_records):
+    """用 pandas 分组后外连接对比两份报告，作为 diff_records 的对照"""
+    import pandas as pd
+
+    keys = list(pre.PEST_FIELDS[:5])
+    frames = []
+    for records in (old_records, new_records):
+        frame = pd.DataFrame([record.astuple() for record in records], columns=pre.PEST_FIELDS)
+        frames.append(frame.groupby(keys, sort=False)[pre.PEST_FIELDS[5]].sum())
+    merged = pd.concat(frames, axis=1, keys=['old', 'new'], join='outer')
+    added = {key: int(row.new) for key, row in merged[merged.old.isna()].iterrows()}
+    removed = {key: int(row.old) for key, row in merged[merged.new.isna()].iterrows()}
+    both = merged.dropna()
+    changed = {key: (int(row.old), int(row.new)) for key, row in both[both.old != both.new].iterrows()}
+    return added, removed, changed, int((both.old == both.new).sum())
+
+
+_DIFF_CHILD = """
+import sys
+import pest_report_extractor as pre
+extractor = pre.PestReportExtractor(cache=pre.ExtractionCache(sys.argv[1]))
+ok = extractor.diff_reports(sys.argv[2], sys.argv[2], output_dir=sys.argv[3])
+print(ok, 'pdfplumber' in sys.modules)
+"""
+
+
+def bench_diff(args):
+    """报告对比：哈希连接与 pandas 外连接的耗时对比并校验结果一致；给定PDF时对比冷/热提取缓存"""
+    old = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    # 新报告：去掉5%的记录、改动10%的数量、加入5%的新记录
+    rng = random.Random(1)
+    new = []
+    for record in old:
+        roll = rng.random()
+        if roll < 0.05:
+            continue
+        if roll < 0.15:
+            record = pre.PestRecord(*record.astuple()[:5], record.count + rng.randint(1, 20))
+        new.append(record)
+    new.extend(pre.PestRecord.from_dict(record) for record in synthetic_records(args.records // 20, seed=1))
+
+    diff, hash_elapsed = _timed(pre.diff_records, old, new)
+    expected, pandas_elapsed = _timed(_pandas_diff, old, new)
+    result = (dict(diff.added), dict(diff.removed),
+              {key: (before, after) for key, before, after in diff.changed}, diff.unchanged)
+    if result != expected:
+        print("❌ 哈希连接与 pandas 外连接的对比结果不一致")
+        return 1
+    _print_table(f"按点位对比: {len(old):,} 条 vs {len(new):,} 条记录", [
+        ("pandas 分组 + 外连接", pandas_elapsed, ""),
+        ("哈希连接 diff_records", hash_elapsed, f"{(len(old) + len(new)) / hash_elapsed:,.0f} 条/秒"),
+    ])
+    print(f"  新增 {len(diff.added):,}，消除 {len(diff.removed):,}，变化 {len(diff.changed):,}，"
+          f"不变 {diff.unchanged:,}")
+
+    if args.pdf:
+        rows = []
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for name in ("冷缓存（解析PDF）", "热缓存"):
+                start = time.perf_counter()
+                proc = subprocess.run([sys.executable, "-c", _DIFF_CHILD, cache_dir, args.pdf, cache_dir],
+                                      stdout=subprocess.PIPE, text=True, check=True,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+                elapsed = time.perf_counter() - start
+                ok, pdfplumber_loaded = proc.stdout.split()[-2:]
+                if ok != "True":
+                    print(f"❌ {name}对比失败")
+                    return 1
+                rows.append((name, elapsed, "导入了 pdfplumber" if pdfplumber_loaded == "True"
+                             else "未导入 pdfplumber"))
+        _print_table(f"对比两份PDF（进程启动到写出工作簿）: {os.path.basename(args.pdf)}", rows)
+        if not rows[-1][2].startswith("未导入"):
+            print("❌ 热缓存对比仍导入了 pdfplumber")
+            return 1
+    print("✅ 哈希连接与 pandas 外连接的对比结果一致")
+    return 0
+
+
+def _full_scan_query(store, filters, group_by, top):
+    """同一查询强制不使用 records 表的索引（NOT INDEXED）且不从 series 表汇总，作为对照"""
+    sql, params, _, _ = store._query_sql(filters, group_by, top, rollup=False)
+    sql = sql.replace("FROM records JOIN", "FROM records NOT INDEXED JOIN")
+    return store.conn.execute(sql, params).fetchall()
+
+
+def bench_query(args):
+    """历史库查询：索引与全表扫描的耗时对比，校验结果一致并确认执行计划使用了索引"""
+    import datetime
+
+    start_date = datetime.date(2024, 1, 1)
+    dates = [(start_date + datetime.timedelta(days=7 * index)).isoformat() for index in range(args.reports)]
+    with tempfile.TemporaryDirectory() as output:
+        db_path = os.path.join(output, "history.db")
+        store = pre.HistoryStore(db_path)
+        start = time.perf_counter()
+        for index, report_date in enumerate(dates):
+            report = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records, seed=index)]
+            store.ingest(report, f"report_{index}.pdf", f"hash_{index}", report_date)
+        ingest_elapsed = time.perf_counter() - start
+        total_rows = args.reports * args.records
+        print(f"\n历史库: {args.reports} 份报告 × {args.records:,} 条 = {total_rows:,} 条记录"
+              f"（入库 {ingest_elapsed:.1f}s，{total_rows / ingest_elapsed:,.0f} 条/秒）")
+
+        year = dates[-1][:4]
+        quarter = pre.parse_period(f"{dates[-1][:4]}Q{(int(dates[-1][5:7]) - 1) // 3 + 1}")
+        queries = [
+            ("鼠 A座 3-5层 最近一个季度",
+             pre.QueryFilters(buildings=["A座"], floors=(3, 5), pest_types=["鼠"],
+                              since=quarter[0], until=quarter[1]), (), None),
+            (f"{year}年数量前20的点位",
+             pre.QueryFilters(since=f"{year}-01-01", until=f"{year}-12-31"), ('point',), 20),
+            ("蟑螂 B座 按月汇总",
+             pre.QueryFilters(buildings=["B座"], pest_types=["蟑螂"]), ('month',), None),
+            ("A座 10-12层 按部门汇总",
+             pre.QueryFilters(buildings=["A座"], floors=(10, 12)), ('department',), None),
+            ("鼠 单个点位 前50条",
+             pre.QueryFilters(locations=["粘鼠板-42"], pest_types=["鼠"]), (), 50),
+            ("厨房 按楼层汇总",
+             pre.QueryFilters(departments=["厨房"]), ('floor',), None),
+            ("3-5层 按建筑物汇总",
+             pre.QueryFilters(floors=(3, 5)), ('building',), None),
+            ("仓库 20-22层 前50条",
+             pre.QueryFilters(departments=["仓库"], floors=(20, 22)), (), 50),
+        ]
+        print("-" * 60)
+        for name, filters, group_by, top in queries:
+            (headers, rows), elapsed = _timed(store.query, filters, group_by, top)
+            rows, fetch_elapsed = _timed(list, rows)
+            elapsed += fetch_elapsed
+            expected, scan_elapsed = _timed(_full_scan_query, store, filters, group_by, top)
+            if rows != expected:
+                print(f"❌ 查询结果与全表扫描不一致: {name}")
+                return 1
+            plan = " ".join(store.query_plan(filters, group_by, top))
+            if re.search(r"\bSCAN (records|series)\b", plan):
+                print(f"❌ 查询没有使用索引: {name}: {plan}")
+                return 1
+            index = re.search(r"USING (?:COVERING )?(INDEX \w+|PRIMARY KEY)", plan).group(1)
+            print(f"  {name:<24} {elapsed:>7.3f}s  {len(rows):>5} 行  全表扫描 {scan_elapsed:.3f}s  {index}")
+        store.close()
+    print("✅ 各查询使用了索引，结果与全表扫描一致")
+    return 0
+
+
+def _series_from_records(store, dimension):
+    """直接从 records 表按 (报告日期, 键) 汇总，作为增量维护的 series 表的对照"""
+    key = pre.HistoryStore.SERIES_KEY_SQL[dimension]
+    return sorted(store.conn.execute(
+        f"SELECT reports.report_date, {key}, COUNT(*), SUM(records.count)"
+        " FROM records JOIN reports ON reports.id = records.report_id"
+        f" GROUP BY reports.report_date, {key}"
+    ))
+
+
+def bench_trend(args):
+    """逐份报告入库并生成趋势工作表：第5份与第N份报告的耗时对比，并校验增量序列与重新汇总一致"""
+    import datetime
+
+    base = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    start_date = datetime.date(2020, 1, 1)
+    extractor = pre.PestReportExtractor()
+    timings = []
+    with tempfile.TemporaryDirectory() as output:
+        db_path = os.path.join(output, "history.db")
+        store = pre.HistoryStore(db_path)
+        for index in range(args.reports):
+            rng = random.Random(index)
+            report = [pre.PestRecord(*record.astuple()[:5], rng.randint(0, 30)) for record in base]
+            report_date = (start_date + datetime.timedelta(days=7 * index)).isoformat()
+            start = time.perf_counter()
+            store.ingest(report, f"report_{index}.pdf", f"hash_{index}", report_date)
+            ingest_elapsed = time.perf_counter() - start
+            with _quiet():
+                _, render_elapsed = _timed(extractor._trend_canvas, db_path)
+            timings.append((ingest_elapsed, render_elapsed))
+
+        # 同一内容哈希以新的报告日期重新入库：先减去旧报告的汇总再累加
+        rng = random.Random(0)
+        report = [pre.PestRecord(*record.astuple()[:5], rng.randint(0, 30)) for record in base]
+        store.ingest(report, "report_0.pdf", "hash_0", "2019-12-25")
+        for dimension in pre.HistoryStore.SERIES_DIMENSIONS:
+            series = sorted(store.conn.execute(
+                "SELECT report_date, key, records, total FROM series WHERE dimension = ?", (dimension,)
+            ))
+            if series != _series_from_records(store, dimension):
+                print(f"❌ 增量维护的 {dimension} 序列与重新汇总不一致")
+                return 1
+        store.close()
+
+    def window(number):
+        # 以第 number 份报告为中心取5份，取中位数减少抖动
+        around = timings[max(0, number - 3):number + 2]
+        return (statistics.median(item[0] for item in around),
+                statistics.median(item[1] for item in around))
+
+    print(f"\n逐份入库并生成趋势工作表: {args.reports} 份报告，每份 {args.records} 条记录")
+    print("-" * 60)
+    for number in (5, args.reports // 2, args.reports):
+        ingest_elapsed, render_elapsed = window(number)
+        print(f"  第 {number:>4} 份报告: 入库 {ingest_elapsed * 1000:7.1f}ms  "
+              f"趋势工作表 {render_elapsed * 1000:6.1f}ms")
+    print("✅ 增量维护的时间序列与从全部记录重新汇总的结果一致")
+    return 0
+
+
+def _read_sheet_values(path, title):
+    """用只读模式读回一个工作表的全部单元格值"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    ws = wb[title]
+    ws.reset_dimensions()
+    values = [tuple(row) for row in ws.iter_rows(values_only=True)]
+    wb.close()
+    return values
+
+
+def bench_append(args):
+    """向总表追加一份报告：增量拼接与完整重建的耗时对比，并校验两种方式得到的总表一致"""
+    import shutil
+
+    extractor = pre.PestReportExtractor()
+    history = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.master_records)]
+    rng = random.Random(1)
+    new = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    new = [pre.PestRecord(*record.astuple()[:5], rng.randint(0, 30)) for record in new]
+
+    with tempfile.TemporaryDirectory() as output:
+        master = os.path.join(output, "master.xlsx")
+        with _quiet():
+            _, create_elapsed = _timed(extractor.append_to_master, master,
+                                       [("history.pdf", "history", history)], with_pivot=True)
+        size_mb = os.path.getsize(master) / 1024 / 1024
+        print(f"\n总表: {args.master_records:,} 行（{size_mb:.1f}MB），新建耗时 {create_elapsed:.2f}s")
+
+        rebuilt = os.path.join(output, "rebuilt.xlsx")
+        shutil.copy(master, rebuilt)
+        rows = []
+        with _quiet():
+            ok, elapsed = _timed(extractor.append_to_master, rebuilt, [("new.pdf", "new", new)])
+        if not ok:
+            print("❌ 完整重建失败")
+            return 1
+        rows.append(("完整重建（读回全部记录）", elapsed, ""))
+
+        with _quiet():
+            ok, elapsed = _timed(extractor.append_to_master, master, [("new.pdf", "new", new)])
+        if not ok:
+            print("❌ 增量追加失败")
+            return 1
+        rows.append(("增量追加", elapsed, f"{args.records / elapsed:,.0f} 条/秒"))
+        _print_table(f"追加 {args.records:,} 条记录到 {args.master_records:,} 行的总表", rows)
+
+        for title in ("虫害分析", "虫害透视", "虫害情况"):
+            if _read_sheet_values(master, title) != _read_sheet_values(rebuilt, title):
+                print(f"❌ 增量追加与完整重建的 {title} 工作表不一致")
+                return 1
+
+        # 总表继续增长时，每次追加一份小报告的耗时
+        appends = []
+        for index in range(args.rounds):
+            with _quiet():
+                _, elapsed = _timed(extractor.append_to_master, master,
+                                    [(f"extra_{index}.pdf", f"extra_{index}", new[:100])])
+            appends.append(elapsed)
+        if appends:
+            print(f"  之后每次追加100条: 中位数 {statistics.median(appends):.3f}s")
+    print("✅ 增量追加与完整重建得到的总表一致")
+    return 0
+
+
+def _two_pass_pipeline(extractor, output):
+    """优化前的流程：保存数据表后重新打开文件、读回数据生成分析报告，再保存一次"""
+    extractor.create_excel(output, filename="two_pass.xlsx")
+    records, extractor.pest_data = extractor.pest_data, []
+    try:
+        extractor.generate_analysis_report()
+    finally:
+        extractor.pest_data = records
+
+
+def bench_pipeline(args):
+    """数据表 + 分析报告：保存后读回再保存 vs 基于内存记录一次写出"""
+    records = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    import openpyxl  # noqa: F401
+    import pandas  # noqa: F401
+
+    rows = []
+    with tempfile.TemporaryDirectory() as output:
+        extractor = pre.PestReportExtractor()
+        extractor.pest_data = records
+        with _quiet():
+            _, elapsed = _timed(_two_pass_pipeline, extractor, output)
+        rows.append(("保存-读回-再保存（旧）", elapsed, "写2次 读2次"))
+        for write_only, name in ((False, "一次写出"), (True, "一次写出（流式工作簿）")):
+            with _quiet():
+                _, elapsed = _timed(extractor.create_excel, output, filename=f"single_{write_only}.xlsx",
+                                    write_only=write_only, with_report=True)
+            rows.append((name, elapsed, "写1次"))
+    _print_table(f"生成数据表和分析报告: {args.records} 条记录", rows)
+    return 0
+
+
+def bench_render(args):
+    """数据表和分析报告的渲染耗时与保存耗时（分别统计 Workbook.save 内外的时间）"""
+    from openpyxl.workbook.workbook import Workbook
+    import pandas  # noqa: F401
+
+    records = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    save_times = []
+    original_save = Workbook.save
+
+    def timed_save(self, filename):
+        _, elapsed = _timed(original_save, self, filename)
+        save_times.append(elapsed)
+
+    rows = []
+    Workbook.save = timed_save
+    try:
+        with tempfile.TemporaryDirectory() as output:
+            for write_only, name in ((False, "普通工作簿"), (True, "流式工作簿")):
+                best_render = best_save = float('inf')
+                for _ in range(args.repeat):
+                    extractor = pre.PestReportExtractor()
+                    extractor.pest_data = records
+                    save_times.clear()
+                    with _quiet():
+                        _, elapsed = _timed(extractor.create_excel, output, filename="render.xlsx",
+                                            write_only=write_only, with_report=True)
+                    best_save = min(best_save, sum(save_times))
+                    best_render = min(best_render, elapsed - sum(save_times))
+                rows.append((f"{name} 渲染", best_render, ""))
+                rows.append((f"{name} 保存", best_save, ""))
+    finally:
+        Workbook.save = original_save
+    _print_table(f"渲染与保存: {args.records} 条记录（取 {args.repeat} 次最优）", rows)
+    return 0
+
+
+def bench_verify(args):
+    """各数据验证方式的耗时对比，并校验流式验证能定位到被篡改的行和字段"""
+    from openpyxl import load_workbook
+
+    extractor = pre.PestReportExtractor()
+    extractor.pest_data = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    rows = []
+    with tempfile.TemporaryDirectory() as output:
+        with _quiet():
+            extractor.create_excel(output, filename="verify.xlsx", write_only=True)
+        for mode in ('full', 'digest', 'sample'):
+            with _quiet():
+                ok, elapsed = _timed(extractor.verify_data, mode)
+            rows.append((mode, elapsed, "通过" if ok else "失败"))
+        _print_table(f"数据验证: {args.records} 条记录", rows)
+
+        # 篡改一个单元格，流式验证应报告到该行该字段
+        wb = load_workbook(extractor.output_path)
+        target_row = args.records // 2
+        wb['虫害情况'].cell(row=target_row + 1, column=3).value = "篡改"
+        wb.save(extractor.output_path)
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            extractor.verify_data('digest')
+        expected = f"第{target_row}条 - {pre.PEST_FIELDS[2]}"
+        if expected not in log.getvalue():
+            print(f"❌ 行摘要验证未报告篡改的单元格: {expected}")
+            return 1
+    print(f"✅ 行摘要验证报告了篡改的单元格: {expected}")
+    return 0
+
+
+def _read_back_export(fmt, path):
+    """读回导出文件，返回字段元组列表（数量为整数）"""
+    if fmt == 'csv':
+        import csv
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))[1:]
+        return [tuple(row[:-1]) + (int(row[-1]),) for row in rows]
+    if fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            return [tuple(json.loads(line).values()) for line in f]
+    import pyarrow.parquet as pq
+    table = pq.read_table(path)
+    return list(zip(*(table.column(field).to_pylist() for field in pre.PEST_FIELDS)))
+
+
+def bench_export(args):
+    """各输出格式的写出吞吐量（条/秒），并校验读回的数据与原始记录一致"""
+    extractor = pre.PestReportExtractor()
+    extractor.pest_data = [pre.PestRecord.from_dict(record) for record in synthetic_records(args.records)]
+    expected = [record.astuple() for record in extractor.pest_data]
+    rows = []
+    with tempfile.TemporaryDirectory() as output:
+        with _quiet():
+            _, elapsed = _timed(extractor.create_excel, output, filename="export.xlsx", write_only=True)
+        rows.append(("xlsx（流式工作簿）", elapsed, f"{args.records / elapsed:,.0f} 条/秒"))
+        for fmt in ('csv', 'jsonl', 'parquet'):
+            # 与提取时一样逐条写入输出端
+            with _quiet():
+                exporters = extractor.open_exporters([fmt], output, "export")
+            if not exporters:
+                print(f"⏭️  跳过 {fmt}（缺少依赖）")
+                continue
+            start = time.perf_counter()
+            for record in extractor.pest_data:
+                exporters[0].write(record)
+            with _quiet():
+                extractor.close_exporters(exporters)
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(exporters[0].path) / 1024 / 1024
+            rows.append((fmt, elapsed, f"{args.records / elapsed:,.0f} 条/秒, {size_mb:.1f}MB"))
+            if _read_back_export(fmt, exporters[0].path) != expected:
+                print(f"❌ {fmt} 读回的数据与原始记录不一致")
+                return 1
+    _print_table(f"导出吞吐量: {args.records} 条记录", rows)
+    print("✅ 各格式读回的数据与原始记录一致")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='虫害情况自动提取工具 - 性能基准')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    workers_parser = subparsers.add_parser('workers', help='串行与多进程页面排版对比')
+    workers_parser.add_argument('--pdf', required=True, help='PDF文件路径')
+    workers_parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8],
+                                help='要对比的进程数（默认 2 4 8）')
+    workers_parser.add_argument('--full-scan', action='store_true',
+                                help='不做页码预定位和流式提前结束，排版全部页面')
+    workers_parser.set_defaults(func=bench_workers)
+
+    parse_parser = subparsers.add_parser('parse', help='虫害记录解析器微基准')
+    parse_parser.add_argument('--lines', type=int, default=100000, help='合成文本行数（默认100000）')
+    parse_parser.add_argument('--wrap-ratio', type=float, default=0.0,
+                              help='详情折行的记录比例（默认0，此时校验新旧结果完全一致）')
+    parse_parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最优）')
+    parse_parser.set_defaults(func=bench_parse)
+
+    backend_parser = subparsers.add_parser('backend', help='text 与 words 提取后端的速度和召回率对比')
+    backend_parser.add_argument('--pdf', required=True, nargs='+', help='PDF文件路径（可多个）')
+    backend_parser.add_argument('--full-scan', action='store_true',
+                                help='不做页码预定位和流式提前结束，排版全部页面')
+    backend_parser.set_defaults(func=bench_backend)
+
+    memory_parser = subparsers.add_parser('memory', help='字典记录与紧凑记录的内存占用对比')
+    memory_parser.add_argument('--records', type=int, default=1000000, help='记录条数（默认1000000）')
+    memory_parser.set_defaults(func=bench_memory)
+
+    startup_parser = subparsers.add_parser('startup', help='各入口的启动耗时（python -X importtime）')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='每个入口运行次数（取中位数）')
+    startup_parser.set_defaults(func=bench_startup)
+
+    excel_parser = subparsers.add_parser('excel', help='普通与流式工作簿写出的耗时和峰值内存对比')
+    excel_parser.add_argument('--records', type=int, default=100000, help='记录条数（默认100000）')
+    excel_parser.set_defaults(func=bench_excel)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help='两次读写与一次写出分析报告的端到端对比')
+    pipeline_parser.add_argument('--records', type=int, default=20000, help='记录条数（默认20000）')
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    render_parser = subparsers.add_parser('render', help='数据表和分析报告的渲染与保存耗时')
+    render_parser.add_argument('--records', type=int, default=20000, help='记录条数（默认20000）')
+    render_parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最优）')
+    render_parser.set_defaults(func=bench_render)
+
+    verify_parser = subparsers.add_parser('verify', help='full、digest、sample 三种数据验证方式的耗时对比')
+    verify_parser.add_argument('--records', type=int, default=100000, help='记录条数（默认100000）')
+    verify_parser.set_defaults(func=bench_verify)
+
+    export_parser = subparsers.add_parser('export', help='xlsx、CSV、JSONL、Parquet 的写出吞吐量')
+    export_parser.add_argument('--records', type=int, default=200000, help='记录条数（默认200000）')
+    export_parser.set_defaults(func=bench_export)
+
+    engine_parser = subparsers.add_parser('engine', help='openpyxl 与 xlsxwriter 写出引擎的耗时和峰值内存对比')
+    engine_parser.add_argument('--records', type=int, default=100000, help='记录条数（默认100000）')
+    engine_parser.set_defaults(func=bench_engine)
+
+    report_parser = subparsers.add_parser('report', help='分析报告统计：pandas 与单次遍历聚合器的一致性和耗时')
+    report_parser.add_argument('--records', type=int, default=100000, help='计时用的记录条数（默认100000）')
+    report_parser.set_defaults(func=bench_report)
+
+    cube_parser = subparsers.add_parser('cube', help='逐部分扫描与统计立方体上卷的耗时对比')
+    cube_parser.add_argument('--records', type=int, default=200000, help='记录条数（默认200000）')
+    cube_parser.set_defaults(func=bench_cube)
+
+    history_parser = subparsers.add_parser('history', help='SQLite 历史库的入库和趋势查询吞吐量')
+    history_parser.add_argument('--reports', type=int, default=100, help='报告份数（默认100）')
+    history_parser.add_argument('--records', type=int, default=10000, help='每份报告的记录条数（默认10000）')
+    history_parser.set_defaults(func=bench_history)
+
+    append_parser = subparsers.add_parser('append', help='总表增量追加与完整重建的耗时对比')
+    append_parser.add_argument('--master-records', type=int, default=300000,
+                               help='总表已有记录条数（默认300000）')
+    append_parser.add_argument('--records', type=int, default=5000, help='追加的记录条数（默认5000）')
+    append_parser.add_argument('--rounds', type=int, default=5, help='增量追加次数（默认5）')
+    append_parser.set_defaults(func=bench_append)
+
+    trend_parser = subparsers.add_parser('trend', help='逐份报告入库与趋势工作表的耗时随报告数的变化')
+    trend_parser.add_argument('--reports', type=int, default=500, help='报告份数（默认500）')
+    trend_parser.add_argument('--records', type=int, default=2000, help='每份报告的记录条数（默认2000）')
+    trend_parser.set_defaults(func=bench_trend)
+
+    metadata_parser = subparsers.add_parser('metadata', help='报告信息提取：只读前几页与遍历整份文档的耗时对比')
+    metadata_parser.add_argument('--pdf', required=True, help='PDF文件路径')
+    metadata_parser.add_argument('--repeat', type=int, default=20, help='重复次数（默认20）')
+    metadata_parser.set_defaults(func=bench_metadata)
+
+    anomaly_parser = subparsers.add_parser('anomaly', help='异常点位检测：逐点位循环与 NumPy 向量化打分的耗时对比')
+    anomaly_parser.add_argument('--records', type=int, default=100000, help='点位数（默认100000）')
+    anomaly_parser.add_argument('--reports', type=int, default=12, help='历史报告期数（默认12）')
+    anomaly_parser.set_defaults(func=bench_anomaly)
+
+    diff_parser = subparsers.add_parser('diff', help='报告对比：哈希连接与 pandas 外连接、冷/热提取缓存的耗时对比')
+    diff_parser.add_argument('--records', type=int, default=200000, help='旧报告的记录条数（默认200000）')
+    diff_parser.add_argument('--pdf', help='PDF文件路径（给定时对比冷/热提取缓存下的端到端耗时）')
+    diff_parser.set_defaults(func=bench_diff)
+
+    query_parser = subparsers.add_parser('query', help='历史库查询：索引与全表扫描的耗时对比')
+    query_parser.add_argument('--reports', type=int, default=100, help='报告份数（默认100）')
+    query_parser.add_argument('--records', type=int, default=20000, help='每份报告的记录条数（默认20000）')
+    query_parser.set_defaults(func=bench_query)
+
+    excel_child_parser = subparsers.add_parser('_excel-child')
+    excel_child_parser.add_argument('--mode', choices=['normal', 'write_only'], required=True)
+    excel_child_parser.add_argument('--records', type=int, required=True)
+    excel_child_parser.add_argument('--output', required=True)
+    excel_child_parser.add_argument('--engine', choices=sorted(pre.EXCEL_ENGINES), default='openpyxl')
+    excel_child_parser.add_argument('--report', action='store_true')
+    excel_child_parser.set_defaults(func=excel_child)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,37 +8,2103 @@
 1. GUI模式（macOS/Windows）：直接运行 python pest_report_extractor.py
 2. 命令行模式：python pest_report_extractor.py --pdf <pdf文件路径> [--output <输出目录>] [--report]
 3. 命令行模式示例：python pest_report_extractor.py --pdf report.pdf --output ~/Desktop --report
+4. 批量模式：python pest_report_extractor.py --pdf-dir <目录> [--glob "*.pdf"] [--workers N] [--consolidate]
 """
 
 import re
+import io
+import os
 import sys
+import json
+import hashlib
+import heapq
+import time
 import argparse
+import contextlib
+import unicodedata
+from array import array
+from collections import namedtuple
+from collections.abc import Mapping
+from importlib.util import find_spec
 from pathlib import Path
-import pdfplumber
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-import pandas as pd
 from datetime import datetime
 import subprocess
 import platform
 
-# 尝试导入tkinter（用于GUI模式）
-try:
-    import tkinter as tk
-    from tkinter import filedialog, messagebox
-    HAS_GUI = True
-except ImportError:
-    HAS_GUI = False
+# pdfplumber、openpyxl、pandas（仅 --verify full 使用）、numpy（仅异常点位检测使用）、tkinter
+# 都较重，只在用到它们的步骤里导入，
+# 使 --help、文件选择对话框和错误提示等路径无需等待这些依赖加载
+
+# 检查tkinter是否可用（用于GUI模式），实际导入推迟到弹出对话框时
+HAS_GUI = find_spec("tkinter") is not None and find_spec("_tkinter") is not None
+
+# 虫害情况部分的开始/结束标记
+PEST_SECTION_START = "虫害情况"
+PEST_SECTION_END = "服务总结"
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# 虫害情况所在的页码范围（从0开始，包含两端）
+SectionRange = namedtuple('SectionRange', ['start_page', 'end_page'])
+
+# 分析报告的统计结果（见 RollupCube.report_stats）
+ReportStats = namedtuple('ReportStats', ['total_records', 'total_pests', 'avg_density', 'max_single',
+                                         'pest_types', 'buildings', 'top'])
+# 分组统计的一行：(分组键, 记录数, 总数量, 占比%)
+GroupStat = namedtuple('GroupStat', ['key', 'records', 'total', 'share'])
+# 异常点位：(本期点位记录（同一点位的数量已相加）, 历史中位数, 尺度, 稳健 z 分数)，见 score_anomalies
+AnomalyPoint = namedtuple('AnomalyPoint', ['record', 'baseline', 'scale', 'score'])
+# 两份报告按点位对比的结果，见 diff_records
+ReportDiff = namedtuple('ReportDiff', ['added', 'removed', 'changed', 'unchanged'])
+# 历史库查询（query 子命令）的筛选条件，None 表示不筛选：buildings/departments/locations/pest_types
+# 为可选值列表，floors 为 (最低楼层号, 最高楼层号)，since/until 为报告日期范围（ISO 格式，含两端）
+QueryFilters = namedtuple('QueryFilters', ['buildings', 'floors', 'departments', 'locations', 'pest_types',
+                                           'customer', 'since', 'until'], defaults=(None,) * 8)
+
+
+class ReportMetadata(namedtuple('ReportMetadata', ['report_number', 'customer', 'service_date'])):
+    """报告首页的报告信息：报告编号、客户名称、服务日期（ISO 格式）；未找到的字段为 None"""
+    
+    __slots__ = ()
+    
+    # 各字段在报告和输出文件中的名称
+    LABELS = {'report_number': '报告编号', 'customer': '客户名称', 'service_date': '服务日期'}
+    
+    def natural_key(self):
+        """报告的自然键 "客户名称|报告编号"；没有报告编号时返回 None（改用内容哈希区分报告）"""
+        if not self.report_number:
+            return None
+        return f"{self.customer or ''}|{self.report_number}"
+    
+    def labeled(self):
+        """[(字段名称, 值)]，跳过未找到的字段"""
+        return [(self.LABELS[field], value) for field, value in zip(self._fields, self) if value]
+
+
+# 虫害记录的字段（同时也是Excel表头）
+PEST_FIELDS = ["建筑物", "楼层", "部门", "检查/发现监测点位", "虫害类型", "发现虫害活动"]
+
+
+_intern = sys.intern
+
+
+class PestRecord(Mapping):
+    """紧凑的虫害记录
+
+    用 __slots__ 存储六个字段，文本字段经 sys.intern 驻留，大量记录中重复的
+    建筑物、楼层、部门等取值只保留一份字符串。同时实现只读映射接口，
+    record['建筑物']、keys()/items() 等原有按字典访问的写法保持可用。
+    """
+    
+    __slots__ = ('building', 'floor', 'department', 'location', 'pest_type', 'count')
+    
+    def __init__(self, building, floor, department, location, pest_type, count):
+        self.building = _intern(building)
+        self.floor = _intern(floor)
+        self.department = _intern(department)
+        self.location = _intern(location)
+        self.pest_type = _intern(pest_type)
+        self.count = int(count)
+    
+    @classmethod
+    def from_dict(cls, record):
+        """从按 PEST_FIELDS 命名的字典构造"""
+        return cls(*(record[field] for field in PEST_FIELDS))
+    
+    def astuple(self):
+        """按 PEST_FIELDS 顺序返回字段值"""
+        return (self.building, self.floor, self.department, self.location, self.pest_type, self.count)
+    
+    def to_dict(self):
+        """返回按 PEST_FIELDS 命名的普通字典"""
+        return dict(zip(PEST_FIELDS, self.astuple()))
+    
+    def __getitem__(self, field):
+        try:
+            return getattr(self, _PEST_FIELD_SLOTS[field])
+        except KeyError:
+            raise KeyError(field) from None
+    
+    def __iter__(self):
+        return iter(PEST_FIELDS)
+    
+    def __len__(self):
+        return len(PEST_FIELDS)
+    
+    def __eq__(self, other):
+        if isinstance(other, PestRecord):
+            return self.astuple() == other.astuple()
+        return super().__eq__(other)
+    
+    __hash__ = None
+    
+    def __reduce__(self):
+        return (PestRecord, self.astuple())
+    
+    def __repr__(self):
+        return f"PestRecord{self.astuple()!r}"
+
+
+_PEST_FIELD_SLOTS = dict(zip(PEST_FIELDS, PestRecord.__slots__))
+
+# 解析器版本：解析逻辑或提取缓存条目格式变化时递增，旧的提取缓存随之失效
+# （3：缓存条目附带报告信息 metadata；4：监测点位的值折行时拼接完整）
+PARSER_VERSION = 4
+
+# 数据表（虫害情况）的列宽
+DATA_COLUMN_WIDTHS = {'A': 15, 'B': 12, 'C': 15, 'D': 20, 'E': 15, 'F': 15}
+
+# 提取缓存默认上限
+DEFAULT_CACHE_MAX_MB = 256
+
+# 输出格式：xlsx 为带样式的工作簿，其余由 EXPORTERS 中的导出器写出
+EXPORT_FORMATS = ('xlsx', 'csv', 'jsonl', 'parquet')
+# Parquet 导出每个行组的记录数
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# 数据验证方式（见 PestReportExtractor.verify_data）
+VERIFY_MODES = ('full', 'digest', 'sample', 'off')
+# sample 验证方式抽查的行数
+VERIFY_SAMPLE_SIZE = 200
+
+# 趋势工作表显示最近多少个报告日期
+TREND_REPORT_DATES = 12
+# 趋势工作表每个维度最多显示的键数（按最近一期数量排序）
+TREND_TOP_KEYS = 20
+
+# 异常点位检测：基线取本期之前最近多少期报告
+ANOMALY_WINDOW = 12
+# 至少有多少期历史报告才进行检测
+ANOMALY_MIN_HISTORY = 3
+# 稳健 z 分数（(本期数量 - 历史中位数) / (1.4826 × MAD)）达到该值判为异常
+ANOMALY_THRESHOLD = 3.5
+# 尺度下限：历史数量几乎不变（MAD 接近0）时，避免一两只的波动就被判为异常
+ANOMALY_MIN_SCALE = 1.0
+# 分析报告中最多列出的异常点位数
+ANOMALY_MAX_ROWS = 50
+
+# 历史库查询可分组的维度：名称 → (SQL 表达式, 表头)；point 为完整点位
+# （建筑物、楼层、部门、监测点位、虫害类型），输出为五列
+QUERY_DIMENSIONS = {
+    'building': (('records.building',), ('建筑物',)),
+    'floor': (('records.floor',), ('楼层',)),
+    'department': (('records.department',), ('部门',)),
+    'location': (('records.location',), ('监测点位',)),
+    'pest_type': (('records.pest_type',), ('虫害类型',)),
+    'point': (('records.building', 'records.floor', 'records.department', 'records.location',
+               'records.pest_type'), ('建筑物', '楼层', '部门', '监测点位', '虫害类型')),
+    'report_date': (('reports.report_date',), ('报告日期',)),
+    'month': (('substr(reports.report_date, 1, 7)',), ('月份',)),
+    'customer': (('reports.customer',), ('客户名称',)),
+}
+# 查询结果输出到终端时最多显示的行数（CSV、xlsx 输出全部行）
+QUERY_PRINT_ROWS = 50
+
+# 只在报告前几页查找报告编号、客户名称、服务日期等报告信息
+HEADER_PAGES = 2
+# 报告信息的各行（匹配前已去除行内空白），如 "报告编号: SR-2025-0042"、"客户名称：星光购物中心"、
+# "服务日期: 2025-10-15"、"服务日期：2025年10月15日"
+_REPORT_NUMBER_RE = re.compile(r'(?:报告编号|报告单号|报告号)[:：]([A-Za-z0-9][A-Za-z0-9_\-/]*)')
+_CUSTOMER_RE = re.compile(r'(?:客户名称|客户|服务地点|项目名称)[:：](.+?)(?=报告编号|服务日期|$)')
+_REPORT_DATE_RE = re.compile(r'服务日期[:：]?(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})')
+
+
+# 虫害类型和数量：如 "绿化飞虫 发现虫害活动 - 5"，支持多种分隔符和空格
+_PEST_HEADER_RE = re.compile(r'^([\u4e00-\u9fa5]+)\s+发现虫害活动\s*[-–—]\s*(\d+)')
+# 建筑物详情：如 "建筑物: A座, 楼层: 3F, 部门: 厨房, 检查/发现监测点位: 粘板-12"
+_PEST_DETAIL_RE = re.compile(
+    r'建筑物:\s*([^,]+),\s*楼层:\s*([^,]+),\s*部门:\s*([^,]+),\s*检查/发现监测点位:\s*(.+)'
+)
+# 虫害类型行之后最多向后查找多少行来补全建筑物详情（详情可能折行）
+_DETAIL_LOOKAHEAD = 3
+# 监测点位值折行的后半部分：不含空白、冒号和逗号（如 "粘鼠板-" 之后的 "12"）
+_LOCATION_CONTINUATION_RE = re.compile(r'^[^\s:：,，]+$')
+
+
+def _is_location_continuation(line):
+    """建筑物详情已匹配完整后，下一行是否是监测点位值折行的后半部分"""
+    return (_LOCATION_CONTINUATION_RE.match(line) is not None
+            and '发现虫害活动' not in line and '建筑物' not in line)
+
+
+def parse_report_metadata(texts):
+    """从报告前几页的文本中逐行查找报告信息（每个字段取第一次出现的值）
+
+    Args:
+        texts: 页面文本的可迭代对象（原始文本或排版文本均可）
+
+    Returns:
+        ReportMetadata
+    """
+    found = {}
+    for text in texts:
+        for line in text.splitlines():
+            line = _WHITESPACE_RE.sub('', line)
+            if not line:
+                continue
+            if 'report_number' not in found:
+                match = _REPORT_NUMBER_RE.match(line)
+                if match:
+                    found['report_number'] = match.group(1)
+            if 'customer' not in found:
+                match = _CUSTOMER_RE.match(line)
+                if match:
+                    found['customer'] = match.group(1)
+            if 'service_date' not in found:
+                match = _REPORT_DATE_RE.search(line)
+                if match:
+                    try:
+                        found['service_date'] = datetime(*map(int, match.groups())).date().isoformat()
+                    except ValueError:
+                        pass
+        if len(found) == len(ReportMetadata._fields):
+            break
+    return ReportMetadata(**{field: found.get(field) for field in ReportMetadata._fields})
+
+
+def iter_pest_records(text, rejects=None):
+    """单次遍历虫害情况文本，逐条产出虫害记录（PestRecord）
+
+    每条记录由一行虫害类型/数量和随后的建筑物详情组成。详情因排版折行
+    被拆成多行时，会把后续行拼接起来再匹配；监测点位的值本身折行时，详情在第一行
+    就已能匹配，因此匹配后先看下一行，是值的后半部分（见 _is_location_continuation）
+    就接到监测点位后面，再产出记录。
+
+    Args:
+        text: 虫害情况部分的文本
+        rejects: 可选列表，追加疑似记录但未能解析的 (行号, 行文本)
+    """
+    # 清理文本中的特殊字符
+    text = text.replace('\x01', ' ')
+    
+    pending = None  # (行号, 虫害类型行, 虫害类型, 数量)
+    detail = ""
+    waited = 0
+    parsed = None  # 详情已匹配、等待确认监测点位是否折行的记录字段
+    
+    for line_no, line in enumerate(text.split('\n'), 1):
+        line = line.strip()
+        
+        if parsed is not None:
+            if _is_location_continuation(line):
+                parsed[3] += line
+                continue
+            yield PestRecord(*parsed)
+            parsed = None
+        
+        header_match = _PEST_HEADER_RE.match(line)
+        if header_match:
+            if pending is not None and rejects is not None:
+                rejects.append(pending[:2])
+            pending = (line_no, line, header_match.group(1), int(header_match.group(2)))
+            detail = ""
+            waited = 0
+            continue
+        
+        if pending is None:
+            if rejects is not None and '发现虫害活动' in line:
+                rejects.append((line_no, line))
+            continue
+        
+        waited += 1
+        if detail or '建筑物' in line:
+            detail += line
+            detail_match = _PEST_DETAIL_RE.search(detail)
+            if detail_match:
+                building, floor, department, location = detail_match.groups()
+                parsed = [building.strip(), floor.strip(), department.strip(), location.strip(),
+                          pending[2], pending[3]]
+                pending = None
+                continue
+        
+        if waited >= _DETAIL_LOOKAHEAD:
+            if rejects is not None:
+                rejects.append(pending[:2])
+            pending = None
+    
+    if parsed is not None:
+        yield PestRecord(*parsed)
+    if pending is not None and rejects is not None:
+        rejects.append(pending[:2])
+
+
+def _layout_page_text(page):
+    """排版单个页面并释放其对象缓存，避免大文件内存持续增长"""
+    text = page.extract_text() or ""
+    page.flush_cache()
+    return text
+
+
+def _find_marker_char(chars, marker):
+    """在页面字符流中查找标记文字，返回标记首字符（未找到时返回 None）"""
+    marker_len = len(marker)
+    for i in range(len(chars) - marker_len + 1):
+        if chars[i]['text'] == marker[0] and \
+                "".join(char['text'] for char in chars[i:i + marker_len]) == marker:
+            return chars[i]
+    return None
+
+
+def _layout_page_words(page, line_tolerance=3):
+    """按单词坐标重建页面文本行（words 后端）
+
+    先用字符坐标把页面裁剪到虫害情况开始/结束标记之间（保留标记所在行），
+    再按单词的纵坐标聚成行、行内按横坐标排序，不依赖内容流的书写顺序。
+    """
+    chars = page.chars
+    top, bottom = 0, page.height
+    start_char = _find_marker_char(chars, PEST_SECTION_START)
+    if start_char is not None:
+        top = start_char['top']
+    end_char = _find_marker_char(chars, PEST_SECTION_END)
+    if end_char is not None and end_char['top'] >= top:
+        bottom = end_char['bottom']
+    
+    region = page
+    if top > 0 or bottom < page.height:
+        region = page.crop((0, top, page.width, bottom), strict=False)
+    words = region.extract_words(keep_blank_chars=False)
+    page.flush_cache()
+    
+    rows = []
+    for word in sorted(words, key=lambda word: word['top']):
+        if rows and word['top'] - rows[-1][0] <= line_tolerance:
+            rows[-1][1].append(word)
+        else:
+            rows.append((word['top'], [word]))
+    
+    return "\n".join(
+        " ".join(word['text'] for word in sorted(row, key=lambda word: word['x0']))
+        for _, row in rows
+    )
+
+
+# 页面文本提取后端：text 为 pdfplumber 整页排版，words 为基于单词坐标重建文本行
+PAGE_BACKENDS = {
+    'text': _layout_page_text,
+    'words': _layout_page_words,
+}
+
+
+def _extract_page_range_texts(pdf_path, start, stop, backend='text'):
+    """进程池工作函数：打开PDF并排版 [start, stop) 范围内的页面"""
+    import pdfplumber
+    
+    layout = PAGE_BACKENDS[backend]
+    with pdfplumber.open(pdf_path) as pdf:
+        return [layout(page) for page in pdf.pages[start:stop]]
+
+
+def _split_page_ranges(start, stop, parts):
+    """把 [start, stop) 尽量均匀地切分为不超过 parts 段连续区间"""
+    total = stop - start
+    parts = max(1, min(parts, total))
+    size, extra = divmod(total, parts)
+    ranges = []
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def format_point_key(key):
+    """点位键（见 point_key）→ 便于阅读的文本，如 'A座 3F 厨房 粘板-12（鼠）'"""
+    building, floor, department, location, pest_type = key.split('\x1f')
+    return f"{building} {floor} {department} {location}（{pest_type}）"
+
+
+def point_key(values):
+    """点位键：建筑物、楼层、部门、监测点位、虫害类型按 \x1f 拼接（与 HistoryStore.POINT_KEY_SQL 一致）"""
+    return '\x1f'.join(values[:5])
+
+
+def score_anomalies(current, history):
+    """按行向量化计算稳健 z 分数
+
+    每行（点位）以历史数量的中位数为基线、1.4826 × MAD（中位数绝对偏差）为尺度，
+    尺度不低于 ANOMALY_MIN_SCALE。
+
+    Args:
+        current: 长度为 K 的本期数量（numpy 数组）
+        history: K × W 的历史数量矩阵，未出现的期记为0
+
+    Returns:
+        (基线, 尺度, 分数) 三个长度为 K 的 numpy 数组
+    """
+    import numpy as np
+    
+    baseline = np.median(history, axis=1)
+    mad = np.median(np.abs(history - baseline[:, None]), axis=1)
+    scale = np.maximum(mad * 1.4826, ANOMALY_MIN_SCALE)
+    return baseline, scale, (current - baseline) / scale
+
+
+def floor_number(floor):
+    """楼层 → 楼层号：3F → 3，B2 → -2；不以数字或 B+数字开头时返回 None（与 HistoryStore.FLOOR_NUMBER_SQL 一致）"""
+    match = re.match(r'(B?)(\d+)', floor)
+    if match is None:
+        return None
+    return -int(match.group(2)) if match.group(1) else int(match.group(2))
+
+
+def parse_floor_range(text):
+    """命令行楼层范围 → (最低楼层号, 最高楼层号)，如 '3-5'、'3F~5F'、'B2-1'、'3'"""
+    parts = re.split(r'[-~]', text.strip().upper())
+    numbers = [floor_number(part) for part in parts]
+    if len(parts) > 2 or None in numbers:
+        raise argparse.ArgumentTypeError(f"无法识别的楼层范围: {text}（示例: 3-5、B2-1、3）")
+    return min(numbers), max(numbers)
+
+
+def parse_report_date(text):
+    """命令行日期（YYYY-MM-DD）校验后原样返回"""
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的日期: {text}（格式 YYYY-MM-DD）")
+
+
+def parse_period(text):
+    """命令行时间段 → (起始日期, 结束日期)：2025 为全年，2025Q3 为季度，2025-10 为月份"""
+    import calendar
+    
+    match = re.fullmatch(r'(\d{4})(?:[Qq]([1-4])|-(\d{1,2}))?', text.strip())
+    if match is None or (match.group(3) and not 1 <= int(match.group(3)) <= 12):
+        raise argparse.ArgumentTypeError(f"无法识别的时间段: {text}（示例: 2025、2025Q3、2025-10）")
+    year = int(match.group(1))
+    if match.group(2):
+        first, last = int(match.group(2)) * 3 - 2, int(match.group(2)) * 3
+    elif match.group(3):
+        first = last = int(match.group(3))
+    else:
+        first, last = 1, 12
+    return f"{year:04d}-{first:02d}-01", f"{year:04d}-{last:02d}-{calendar.monthrange(year, last)[1]:02d}"
+
+
+def _display_width(text):
+    """终端显示宽度：全角和宽字符（中文）占两列"""
+    return sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+
+
+def format_table(headers, rows):
+    """把表头和行格式化为按显示宽度对齐的文本行（数字右对齐）"""
+    cells = [[str(value) if value is not None else '' for value in row] for row in [headers] + rows]
+    widths = [max(_display_width(row[col]) for row in cells) for col in range(len(headers))]
+    numeric = [all(isinstance(row[col], (int, float)) for row in rows) and bool(rows)
+               for col in range(len(headers))]
+    lines = []
+    for index, row in enumerate(cells):
+        padded = []
+        for col, text in enumerate(row):
+            padding = ' ' * (widths[col] - _display_width(text))
+            padded.append(padding + text if numeric[col] and index > 0 else text + padding)
+        lines.append('  '.join(padded).rstrip())
+        if index == 0:
+            lines.append('  '.join('-' * width for width in widths))
+    return lines
+
+
+def diff_records(old_records, new_records):
+    """按点位（建筑物、楼层、部门、监测点位、虫害类型）对比两份报告的记录
+
+    哈希连接：旧报告按点位建哈希表，新报告的每个点位在表中探测一次；
+    同一份报告中重复出现的点位数量相加。
+
+    Returns:
+        ReportDiff：added 为 [(点位, 新数量)]、removed 为 [(点位, 旧数量)]，均按数量降序；
+        changed 为 [(点位, 旧数量, 新数量)]，按增减量降序（增加最多的在前）；
+        unchanged 为数量不变的点位数。点位为五个字段的元组，数量相同时按点位排序。
+    """
+    def point_totals(records):
+        totals = {}
+        for record in records:
+            key = (record.building, record.floor, record.department, record.location, record.pest_type)
+            totals[key] = totals.get(key, 0) + record.count
+        return totals
+    
+    old = point_totals(old_records)
+    added = []
+    changed = []
+    unchanged = 0
+    for key, count in point_totals(new_records).items():
+        previous = old.pop(key, None)
+        if previous is None:
+            added.append((key, count))
+        elif previous != count:
+            changed.append((key, previous, count))
+        else:
+            unchanged += 1
+    removed = list(old.items())
+    
+    added.sort(key=lambda item: (-item[1], item[0]))
+    removed.sort(key=lambda item: (-item[1], item[0]))
+    changed.sort(key=lambda item: (item[1] - item[2], item[0]))
+    return ReportDiff(added, removed, changed, unchanged)
+
+
+def row_digest(values):
+    """数据表一行的摘要：各字段按字符串拼接后取 BLAKE2b（8字节）
+
+    写入时对记录计算，验证时对从工作簿读回的单元格值计算；
+    字段统一转为字符串，因此数量写入为整数、读回仍为整数时摘要一致。
+    """
+    return hashlib.blake2b('\x1f'.join(map(str, values)).encode('utf-8'), digest_size=8).digest()
+
+
+def file_digest(path):
+    """计算文件内容的 SHA-256 哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 提取缓存条目的文件名（与 ExtractionCache._entry_path 一致）；淘汰时只处理这类文件，
+# 缓存目录中的其他文件即使是 JSON 也不会被删除
+_CACHE_ENTRY_RE = re.compile(r'^[0-9a-f]+\.\w+\.v\d+\.json$')
+
+
+def default_cache_dir():
+    """默认的提取缓存目录（遵循 XDG_CACHE_HOME）"""
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / ".cache"
+    return Path(base) / "pest_report_extractor"
+
+
+class ExtractionCache:
+    """按PDF内容哈希 + 解析器版本缓存解析结果的磁盘缓存
+
+    每个PDF对应一个JSON文件，命中时刷新其修改时间；写入后若总大小超过上限，
+    按修改时间从旧到新淘汰（LRU）。
+    """
+    
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+    
+    def _entry_path(self, content_hash, backend):
+        return self.cache_dir / f"{content_hash}.{backend}.v{PARSER_VERSION}.json"
+    
+    def get(self, content_hash, backend='text'):
+        """读取缓存条目，未命中（或条目损坏）时返回 None"""
+        path = self._entry_path(content_hash, backend)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+    
+    def put(self, content_hash, entry, backend='text'):
+        """原子写入缓存条目，然后按大小上限淘汰最久未使用的条目"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(content_hash, backend)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self._evict()
+    
+    def _evict(self):
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            if not _CACHE_ENTRY_RE.match(path.name):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+class PageCheckpoint:
+    """页级断点文件：PDF旁的 JSON Lines 边车文件
+
+    第一行记录PDF内容哈希、解析器版本和提取后端，之后每排版完一页追加一行页面文本，
+    解析完成后再追加一行解析出的记录。重新运行同一文件时从已完成的页继续；
+    PDF内容（哈希）、解析器版本或后端变化时断点自动作废。
+    """
+    
+    SUFFIX = ".pest-checkpoint"
+    
+    def __init__(self, pdf_path, content_hash, backend='text'):
+        self.path = Path(str(pdf_path) + self.SUFFIX)
+        self.header = {
+            'content_hash': content_hash,
+            'parser_version': PARSER_VERSION,
+            'backend': backend,
+        }
+        self.pages = {}
+        self.records = None
+        self._file = None
+        # 断点文件中完整有效的前缀长度（字节），恢复后从这里继续追加
+        self._valid_size = 0
+    
+    def load(self):
+        """读取已有断点，有效时返回 True；无效的断点会被删除"""
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                if not header.endswith(b"\n") or json.loads(header) != self.header:
+                    raise ValueError("checkpoint does not match this PDF")
+                self._valid_size = len(header)
+                for line in f:
+                    # 进程被杀时最后一行可能只写了一半（没有换行符或不是完整的JSON）
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if 'records' in entry:
+                        self.records = [PestRecord(*row) for row in entry['records']]
+                    else:
+                        self.pages[entry['page']] = entry['text']
+                    self._valid_size += len(line)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError):
+            self.discard()
+            return False
+        return True
+    
+    def _write(self, entry):
+        if self._file is None:
+            exists = self.path.exists() and bool(self.pages or self.records)
+            if exists:
+                # 截掉最后半行，否则新的一行会接在半行后面，整行都无法读取
+                os.truncate(self.path, self._valid_size)
+            self._file = open(self.path, 'a' if exists else 'w', encoding='utf-8')
+            if not exists:
+                self._file.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        # 每页写完立即落盘到系统缓冲区，进程被杀也不会丢失已完成的页
+        self._file.flush()
+    
+    def add_page(self, index, text):
+        self.pages[index] = text
+        self._write({'page': index, 'text': text})
+    
+    def add_records(self, records):
+        self.records = list(records)
+        self._write({'records': [record.astuple() for record in self.records]})
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def discard(self):
+        """关闭并删除断点文件"""
+        self.close()
+        self.pages = {}
+        self.records = None
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class HistoryStore:
+    """SQLite 历史库：保存每次提取的报告元数据和全部记录，便于跨报告查询趋势
+
+    reports 表每份报告一行（来源文件、内容哈希、报告日期、入库时间，以及报告首页的
+    报告编号、客户名称），records 表每条虫害记录一行。同一内容哈希或同一自然键
+    （客户名称|报告编号，见 ReportMetadata.natural_key）重复入库时替换旧数据，
+    因此重复运行或重新导出的同一份报告都不会产生重复记录。
+
+    series 表按 (维度, 报告日期, 键) 保存建筑物、虫害类型和完整点位（point_key）的时间序列，
+    入库时只把本份报告的分组汇总累加进去（替换旧数据时先减去旧报告的汇总），
+    因此入库和读取最近几期趋势的开销只与单份报告的大小有关，与历史报告数无关。
+
+    points 表为每个点位（见 point_key）分配整数ID，point_counts 表每份报告一行，
+    以两个 int64 数组（按点位ID升序）保存该报告各点位的数量，异常点位检测读取
+    最近几期报告时只需读出几行二进制数组，不必逐行读回全部记录。
+
+    query 按筛选条件查询记录：records 表在 (建筑物, 楼层号)、(虫害类型, 建筑物, 楼层号)、
+    (部门, 楼层号) 和楼层号上建有索引，报告日期经 reports 表的索引按报告ID定位记录；只按日期筛选、
+    按单个 series 维度分组的查询直接从 series 表汇总。
+    """
+    
+    # 库结构版本（PRAGMA user_version），旧库打开时升级（见 _migrate）：
+    #   1 - 增加 series 表，从 records 表回填一次
+    #   2 - reports 表增加报告编号、客户名称和自然键列
+    #   3 - 增加 points、point_counts 表，从 records 表回填一次
+    #   4 - 建筑物、虫害类型的单列索引换成含楼层号的复合索引
+    #   5 - series 表的点位序列改按完整点位键（point），不再只按监测点位名称（location）
+    #   6 - 增加 (部门, 楼层号) 和楼层号索引（由 SCHEMA 创建，无需迁移数据）
+    SCHEMA_VERSION = 6
+    # series 表维护的维度
+    SERIES_DIMENSIONS = ('building', 'pest_type', 'point')
+    # 在 SQL 中拼出点位键（与 point_key 一致，char(31) 即 \x1f）
+    POINT_KEY_SQL = ("records.building || char(31) || records.floor || char(31) || records.department"
+                     " || char(31) || records.location || char(31) || records.pest_type")
+    # series 表各维度的键在 records 表上的 SQL 表达式
+    SERIES_KEY_SQL = {
+        'building': 'records.building',
+        'pest_type': 'records.pest_type',
+        'point': POINT_KEY_SQL,
+    }
+    # 楼层号（与 floor_number 一致，不以数字或 B+数字开头时为 NULL）；查询中的表达式
+    # 必须与索引定义中的完全相同才能使用索引
+    FLOOR_NUMBER_SQL = ("(CASE WHEN floor GLOB 'B[0-9]*' THEN -CAST(substr(floor, 2) AS INTEGER)"
+                        " WHEN floor GLOB '[0-9]*' THEN CAST(floor AS INTEGER) END)")
+    
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY,
+            source_file TEXT NOT NULL,
+            content_hash TEXT NOT NULL UNIQUE,
+            report_date TEXT NOT NULL,
+            ingested_at TEXT NOT NULL,
+            record_count INTEGER NOT NULL,
+            report_number TEXT,
+            customer TEXT,
+            report_key TEXT
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+            building TEXT NOT NULL,
+            floor TEXT NOT NULL,
+            department TEXT NOT NULL,
+            location TEXT NOT NULL,
+            pest_type TEXT NOT NULL,
+            count INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_reports_report_date ON reports(report_date);
+        CREATE INDEX IF NOT EXISTS idx_records_report_id ON records(report_id);
+        CREATE INDEX IF NOT EXISTS idx_records_building_floor ON records(building, {FLOOR_NUMBER_SQL});
+        CREATE INDEX IF NOT EXISTS idx_records_pest_type_building
+            ON records(pest_type, building, {FLOOR_NUMBER_SQL});
+        CREATE INDEX IF NOT EXISTS idx_records_department_floor
+            ON records(department, {FLOOR_NUMBER_SQL});
+        CREATE INDEX IF NOT EXISTS idx_records_floor ON records({FLOOR_NUMBER_SQL});
+        CREATE INDEX IF NOT EXISTS idx_records_location ON records(location);
+        CREATE TABLE IF NOT EXISTS series (
+            dimension TEXT NOT NULL,
+            report_date TEXT NOT NULL,
+            key TEXT NOT NULL,
+            records INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (dimension, report_date, key)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS points (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS point_counts (
+            report_id INTEGER PRIMARY KEY REFERENCES reports(id) ON DELETE CASCADE,
+            point_ids BLOB NOT NULL,
+            counts BLOB NOT NULL
+        );
+    """
+    
+    def __init__(self, db_path):
+        import sqlite3
+        
+        self.db_path = Path(db_path).expanduser()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # 批量模式下多个进程可能同时写入，等待锁而不是立即报错
+        self.conn = sqlite3.connect(str(self.db_path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            self._migrate()
+    
+    def _migrate(self):
+        """把旧版本的库升级到 SCHEMA_VERSION（加写锁后重新读取版本，多个进程同时打开时只升级一次）"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 5:
+                # 同名监测点位可能分属不同建筑物/楼层/部门，改按完整点位键重建点位序列
+                self.conn.execute("DELETE FROM series WHERE dimension IN ('location', 'point')")
+                self._rebuild_series('point')
+            if version < 4:
+                # 复合索引的前缀可以替代原来的单列索引
+                self.conn.execute("DROP INDEX IF EXISTS idx_records_building")
+                self.conn.execute("DROP INDEX IF EXISTS idx_records_pest_type")
+            if version < 3:
+                # 从 records 表为每份报告生成点位数量数组
+                self.conn.execute("DELETE FROM point_counts")
+                self.conn.execute(f"INSERT OR IGNORE INTO points (key) SELECT {self.POINT_KEY_SQL} FROM records")
+                for (report_id,) in self.conn.execute("SELECT id FROM reports").fetchall():
+                    self._store_point_counts(report_id)
+            if version < 2:
+                columns = {row[1] for row in self.conn.execute("PRAGMA table_info(reports)")}
+                for column in ('report_number', 'customer', 'report_key'):
+                    if column not in columns:
+                        self.conn.execute(f"ALTER TABLE reports ADD COLUMN {column} TEXT")
+                self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reports_report_key"
+                                  " ON reports(report_key)")
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_reports_customer ON reports(customer)")
+            if version < 1:
+                # 从 records 表重建 series 表
+                self.conn.execute("DELETE FROM series")
+                for dimension in self.SERIES_DIMENSIONS:
+                    self._rebuild_series(dimension)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+    
+    def _rebuild_series(self, dimension):
+        """从 records 表汇总某一维度的全部时间序列写入 series 表（调用前先删除该维度的旧行）"""
+        key = self.SERIES_KEY_SQL[dimension]
+        self.conn.execute(
+            "INSERT INTO series (dimension, report_date, key, records, total)"
+            f" SELECT ?, reports.report_date, {key}, COUNT(*), SUM(records.count)"
+            " FROM records JOIN reports ON reports.id = records.report_id"
+            f" GROUP BY reports.report_date, {key}",
+            (dimension,)
+        )
+    
+    def _report_groups(self, report_id):
+        """一份报告按各维度的分组汇总：[(维度, 键, 记录数, 总数量)]"""
+        groups = []
+        for dimension in self.SERIES_DIMENSIONS:
+            key = self.SERIES_KEY_SQL[dimension]
+            groups.extend(self.conn.execute(
+                f"SELECT ?, {key}, COUNT(*), SUM(records.count) FROM records"
+                f" WHERE records.report_id = ? GROUP BY {key}",
+                (dimension, report_id)
+            ))
+        return groups
+    
+    def _add_to_series(self, groups, report_date, sign=1):
+        """把分组汇总累加到 series 表（sign=-1 时减去，并删除减到零的行）"""
+        self.conn.executemany(
+            "INSERT INTO series (dimension, report_date, key, records, total) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (dimension, report_date, key) DO UPDATE SET"
+            " records = records + excluded.records, total = total + excluded.total",
+            ((dimension, report_date, key, sign * records, sign * total)
+             for dimension, key, records, total in groups)
+        )
+        if sign < 0:
+            for dimension in self.SERIES_DIMENSIONS:
+                self.conn.execute("DELETE FROM series WHERE dimension = ? AND report_date = ? AND records <= 0",
+                                  (dimension, report_date))
+    
+    def _store_point_counts(self, report_id):
+        """登记一份报告中新出现的点位，并写入该报告按点位ID升序的 (点位ID数组, 数量数组)
+
+        数组以本机字节序的 int64 保存（array('q')），同一点位在报告中重复出现时数量相加。
+        """
+        self.conn.execute(
+            f"INSERT OR IGNORE INTO points (key) SELECT {self.POINT_KEY_SQL} FROM records WHERE report_id = ?",
+            (report_id,)
+        )
+        point_ids = array('q')
+        counts = array('q')
+        for point_id, count in self.conn.execute(
+            f"SELECT points.id, SUM(records.count) FROM records JOIN points ON points.key = {self.POINT_KEY_SQL}"
+            " WHERE records.report_id = ? GROUP BY points.id ORDER BY points.id",
+            (report_id,)
+        ):
+            point_ids.append(point_id)
+            counts.append(count)
+        self.conn.execute("INSERT OR REPLACE INTO point_counts (report_id, point_ids, counts) VALUES (?, ?, ?)",
+                          (report_id, point_ids.tobytes(), counts.tobytes()))
+    
+    def ingest(self, records, source_file, content_hash, report_date=None, metadata=None):
+        """在一个事务中写入一份报告的元数据和全部记录
+
+        Args:
+            records: PestRecord 可迭代对象
+            source_file: 来源PDF路径
+            content_hash: PDF内容哈希（同一哈希再次入库时替换旧数据）
+            report_date: 报告日期（ISO 格式 YYYY-MM-DD），为None时取 metadata 中的服务日期，
+                仍未知时使用入库日期
+            metadata: 报告首页的 ReportMetadata；有报告编号时同一自然键再次入库也替换旧数据
+
+        Returns:
+            (报告ID, 写入的记录数)
+        """
+        metadata = metadata or ReportMetadata(None, None, None)
+        ingested_at = datetime.now().isoformat(timespec='seconds')
+        if report_date is None:
+            report_date = metadata.service_date or ingested_at[:10]
+        report_key = metadata.natural_key()
+        
+        with self.conn:
+            old_reports = self.conn.execute(
+                "SELECT id, report_date FROM reports WHERE content_hash = ? OR report_key = ?",
+                (content_hash, report_key)
+            ).fetchall()
+            for old_id, old_date in old_reports:
+                self._add_to_series(self._report_groups(old_id), old_date, sign=-1)
+                self.conn.execute("DELETE FROM reports WHERE id = ?", (old_id,))
+            cursor = self.conn.execute(
+                "INSERT INTO reports (source_file, content_hash, report_date, ingested_at, record_count,"
+                " report_number, customer, report_key) VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+                (str(source_file), content_hash, report_date, ingested_at,
+                 metadata.report_number, metadata.customer, report_key)
+            )
+            report_id = cursor.lastrowid
+            cursor = self.conn.executemany(
+                "INSERT INTO records (report_id, building, floor, department, location, pest_type, count)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((report_id,) + record.astuple() for record in records)
+            )
+            count = cursor.rowcount
+            self.conn.execute("UPDATE reports SET record_count = ? WHERE id = ?", (count, report_id))
+            self._add_to_series(self._report_groups(report_id), report_date)
+            self._store_point_counts(report_id)
+        return report_id, count
+    
+    def trend(self, building=None, pest_type=None, location=None):
+        """按报告日期汇总虫害数量：[(报告日期, 记录数, 总数量)]，可按建筑物、虫害类型、点位筛选"""
+        conditions = []
+        params = []
+        for column, value in (('building', building), ('pest_type', pest_type), ('location', location)):
+            if value is not None:
+                conditions.append(f"records.{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.conn.execute(
+            "SELECT reports.report_date, COUNT(*), SUM(records.count)"
+            " FROM records JOIN reports ON reports.id = records.report_id"
+            f" {where} GROUP BY reports.report_date ORDER BY reports.report_date",
+            params
+        ).fetchall()
+    
+    def series(self, dimension, last=TREND_REPORT_DATES):
+        """某维度最近 last 个报告日期的时间序列
+
+        Returns:
+            (报告日期列表（升序）, {键: {报告日期: (记录数, 总数量)}})
+        """
+        if dimension not in self.SERIES_DIMENSIONS:
+            raise ValueError(f"不支持的趋势维度: {dimension}")
+        dates = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT report_date FROM reports ORDER BY report_date DESC LIMIT ?", (last,)
+        )][::-1]
+        series = {}
+        if dates:
+            for key, report_date, records, total in self.conn.execute(
+                "SELECT key, report_date, records, total FROM series"
+                " WHERE dimension = ? AND report_date >= ?",
+                (dimension, dates[0])
+            ):
+                series.setdefault(key, {})[report_date] = (records, total)
+        return dates, series
+    
+    def find_report(self, ref):
+        """按报告ID（可带 # 前缀）或报告编号查找已入库的报告（同一报告编号取报告日期最近的一份）
+
+        Returns:
+            (报告ID, 来源文件, 报告日期, ReportMetadata)；找不到时返回 None
+        """
+        columns = "SELECT id, source_file, report_date, report_number, customer FROM reports"
+        row = None
+        if ref.lstrip('#').isdigit():
+            row = self.conn.execute(f"{columns} WHERE id = ?", (int(ref.lstrip('#')),)).fetchone()
+        if row is None:
+            row = self.conn.execute(
+                f"{columns} WHERE report_number = ? ORDER BY report_date DESC, id DESC LIMIT 1", (ref,)
+            ).fetchone()
+        if row is None:
+            return None
+        report_id, source_file, report_date, report_number, customer = row
+        return report_id, source_file, report_date, ReportMetadata(report_number, customer, report_date)
+    
+    def report_records(self, report_id):
+        """读回一份报告的全部记录（PestRecord 列表，按入库顺序）"""
+        return [PestRecord(*row) for row in self.conn.execute(
+            "SELECT building, floor, department, location, pest_type, count FROM records"
+            " WHERE report_id = ? ORDER BY rowid",
+            (report_id,)
+        )]
+    
+    def _series_query_sql(self, filters, group_by, top):
+        """只按报告日期（和分组维度本身）筛选、按单个 series 维度（可再加报告日期/月份）分组时，
+        从 series 表汇总的 SQL；不满足条件时返回 None。point 维度的键为拼接的点位键，由 query 拆成五列
+        """
+        dimensions = [dimension for dimension in group_by if dimension in self.SERIES_DIMENSIONS]
+        if len(dimensions) != 1 or filters.floors is not None or filters.customer is not None:
+            return None
+        dimension = dimensions[0]
+        if any(other not in (dimension, 'report_date', 'month') for other in group_by):
+            return None
+        values = {'building': filters.buildings, 'department': filters.departments,
+                  'location': filters.locations, 'pest_type': filters.pest_types}
+        if any(wanted for name, wanted in values.items() if name != dimension):
+            return None
+        
+        expressions = {dimension: 'key', 'report_date': 'report_date', 'month': 'substr(report_date, 1, 7)'}
+        conditions = ["dimension = ?"]
+        params = [dimension]
+        if values.get(dimension):
+            conditions.append(f"key IN ({', '.join('?' * len(values[dimension]))})")
+            params.extend(values[dimension])
+        if filters.since is not None:
+            conditions.append("report_date >= ?")
+            params.append(filters.since)
+        if filters.until is not None:
+            conditions.append("report_date <= ?")
+            params.append(filters.until)
+        keys = ', '.join(expressions[name] for name in group_by)
+        order = f"SUM(total) DESC, {keys}" if top is not None else keys
+        sql = (f"SELECT {keys}, SUM(records), SUM(total) FROM series WHERE {' AND '.join(conditions)}"
+               f" GROUP BY {keys} ORDER BY {order}")
+        return sql, params
+    
+    def _query_sql(self, filters, group_by, top, rollup=True):
+        """query 的 SQL、参数和表头"""
+        if group_by:
+            headers = [header for dimension in group_by for header in QUERY_DIMENSIONS[dimension][1]]
+            headers += ['记录数', '总数量']
+        else:
+            headers = ['报告日期', '客户名称'] + list(PEST_FIELDS)
+        series_sql = self._series_query_sql(filters, group_by, top) if rollup and group_by else None
+        if series_sql is not None:
+            sql, params = series_sql
+            series_sql = True
+        else:
+            conditions = []
+            params = []
+            for column, values in (('records.building', filters.buildings),
+                                   ('records.department', filters.departments),
+                                   ('records.location', filters.locations),
+                                   ('records.pest_type', filters.pest_types)):
+                if values:
+                    conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                    params.extend(values)
+            if filters.floors is not None:
+                conditions.append(f"{self.FLOOR_NUMBER_SQL} BETWEEN ? AND ?")
+                params.extend(filters.floors)
+            for condition, value in (("reports.customer = ?", filters.customer),
+                                     ("reports.report_date >= ?", filters.since),
+                                     ("reports.report_date <= ?", filters.until)):
+                if value is not None:
+                    conditions.append(condition)
+                    params.append(value)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            
+            if group_by:
+                keys = ', '.join(expression for dimension in group_by for expression in QUERY_DIMENSIONS[dimension][0])
+                order = f"SUM(records.count) DESC, {keys}" if top is not None else keys
+                sql = (f"SELECT {keys}, COUNT(*), SUM(records.count)"
+                       " FROM records JOIN reports ON reports.id = records.report_id"
+                       f"{where} GROUP BY {keys} ORDER BY {order}")
+            else:
+                order = "reports.report_date, records.rowid"
+                if top is not None:
+                    order = f"records.count DESC, {order}"
+                sql = ("SELECT reports.report_date, reports.customer, records.building, records.floor,"
+                       " records.department, records.location, records.pest_type, records.count"
+                       " FROM records JOIN reports ON reports.id = records.report_id"
+                       f"{where} ORDER BY {order}")
+        if top is not None:
+            sql += " LIMIT ?"
+            params.append(top)
+        return sql, params, headers, series_sql is not None
+    
+    def query(self, filters, group_by=(), top=None, rollup=True):
+        """按筛选条件查询入库的记录
+
+        Args:
+            filters: QueryFilters
+            group_by: QUERY_DIMENSIONS 中的维度名；为空时逐条返回记录（报告日期、客户名称和各字段），
+                否则返回各分组的记录数和总数量
+            top: 不为 None 时按数量（分组时为总数量）降序只取前 top 行，否则按报告日期或分组键排序
+            rollup: 是否允许从 series 表汇总（False 时总是查询 records 表）
+
+        Returns:
+            (表头列表, 结果行迭代器)
+        """
+        sql, params, headers, from_series = self._query_sql(filters, group_by, top, rollup)
+        cursor = self.conn.execute(sql, params)
+        if not (from_series and 'point' in group_by):
+            return headers, cursor
+        # series 表中的点位键拆回五列
+        position = list(group_by).index('point')
+        return headers, (row[:position] + tuple(row[position].split('\x1f')) + row[position + 1:]
+                         for row in cursor)
+    
+    def query_plan(self, filters, group_by=(), top=None, rollup=True):
+        """query 的执行计划（EXPLAIN QUERY PLAN 的说明列），用于确认查询使用了索引"""
+        sql, params, _, _ = self._query_sql(filters, group_by, top, rollup)
+        return [row[-1] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    
+    def point_history(self, keys, before_date, window=ANOMALY_WINDOW):
+        """给定点位在报告日期早于 before_date 的最近 window 期报告中的数量矩阵
+
+        Args:
+            keys: 点位键列表（见 point_key）
+            before_date: 只取报告日期早于该日期（ISO 格式）的报告
+            window: 最多取多少期报告
+
+        Returns:
+            len(keys) × W 的 numpy 矩阵（W ≤ window，按报告日期从近到远），
+            某期报告中没有出现的点位记为0
+        """
+        import numpy as np
+        
+        reports = self.conn.execute(
+            "SELECT point_counts.point_ids, point_counts.counts FROM reports"
+            " JOIN point_counts ON point_counts.report_id = reports.id"
+            " WHERE reports.report_date < ? ORDER BY reports.report_date DESC, reports.id DESC LIMIT ?",
+            (before_date, window)
+        ).fetchall()
+        matrix = np.zeros((len(keys), len(reports)))
+        if not reports:
+            return matrix
+        
+        point_ids = dict(self.conn.execute("SELECT key, id FROM points"))
+        wanted = np.fromiter((point_ids.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        for column, (ids_blob, counts_blob) in enumerate(reports):
+            ids = np.frombuffer(ids_blob, dtype=np.int64)
+            if not len(ids):
+                continue
+            counts = np.frombuffer(counts_blob, dtype=np.int64)
+            # 报告中的点位ID已升序排列，二分查找每个给定点位的位置
+            positions = np.minimum(np.searchsorted(ids, wanted), len(ids) - 1)
+            found = ids[positions] == wanted
+            matrix[found, column] = counts[positions[found]]
+        return matrix
+    
+    def close(self):
+        self.conn.close()
+
+
+def _group_stats(groups, total_pests):
+    """分组 {键: [记录数, 总数量]} → 按总数量降序的 GroupStat 列表
+
+    先按键排序再做稳定的降序排序，总数量相同的分组按键升序排列；
+    占比先乘10再按“四舍六入五成双”取整后除以10，与 pandas 的 round(1) 结果一致。
+    """
+    stats = []
+    for key in sorted(groups):
+        records, total = groups[key]
+        share = round(total / total_pests * 100 * 10) / 10 if total_pests else float('nan')
+        stats.append(GroupStat(key, records, total, share))
+    stats.sort(key=lambda stat: stat.total, reverse=True)
+    return stats
+
+
+class RollupCube:
+    """按 建筑物 × 楼层 × 部门 × 虫害类型 预聚合的统计立方体
+
+    一次遍历记录，为每个维度组合累加记录数和总数量，同时用容量为 top_n 的
+    最小堆保留数量最多的记录。报告的各个部分（概览、虫害类型、建筑物、TOP10）
+    以及透视表都从立方体上卷得到，不再重新扫描原始记录。
+    """
+    
+    # 维度名即 PestRecord 的属性名
+    DIMENSIONS = ('building', 'floor', 'department', 'pest_type')
+    
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        # {(建筑物, 楼层, 部门, 虫害类型): [记录数, 总数量]}
+        self.cells = {}
+        self.total_records = 0
+        self.total_pests = 0
+        self.max_single = None
+        # 堆元素 (数量, -序号, 记录)：序号唯一，不会比较到记录本身
+        self._top_heap = []
+    
+    @classmethod
+    def from_records(cls, records, top_n=10):
+        cube = cls(top_n)
+        cube.add_records(records)
+        return cube
+    
+    def add_records(self, records):
+        """累加记录（可多次调用）；数量相同时先加入的记录在 TOP 中排在前面"""
+        cells = self.cells
+        heap = self._top_heap
+        top_n = self.top_n
+        index = self.total_records
+        total_pests = self.total_pests
+        max_single = self.max_single
+        
+        for record in records:
+            count = record.count
+            total_pests += count
+            if max_single is None or count > max_single:
+                max_single = count
+            
+            key = (record.building, record.floor, record.department, record.pest_type)
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, count]
+            else:
+                cell[0] += 1
+                cell[1] += count
+            
+            if len(heap) < top_n:
+                heapq.heappush(heap, (count, -index, record))
+            elif count > heap[0][0]:
+                heapq.heapreplace(heap, (count, -index, record))
+            index += 1
+        
+        self.total_records = index
+        self.total_pests = total_pests
+        self.max_single = max_single
+    
+    def rollup(self, *dimensions):
+        """按给定维度上卷：{键: [记录数, 总数量]}
+
+        只给一个维度时键为该维度的取值，多个维度时键为取值元组。
+        """
+        positions = [self.DIMENSIONS.index(dimension) for dimension in dimensions]
+        groups = {}
+        for cell_key, (records, total) in self.cells.items():
+            if len(positions) == 1:
+                key = cell_key[positions[0]]
+            else:
+                key = tuple(cell_key[position] for position in positions)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [records, total]
+            else:
+                group[0] += records
+                group[1] += total
+        return groups
+    
+    def group_stats(self, dimension):
+        """单个维度的 GroupStat 列表（按总数量降序）"""
+        return _group_stats(self.rollup(dimension), self.total_pests)
+    
+    def top(self):
+        """数量最多的 top_n 条记录（按数量降序，数量相同时先出现的记录优先）"""
+        return [record for _, _, record in sorted(self._top_heap, key=lambda item: item[:2],
+                                                  reverse=True)]
+    
+    def pivot(self, row_dimension, column_dimension):
+        """二维透视：返回 (行键列表, 列键列表, {(行键, 列键): 总数量})
+
+        行和列都按各自的总数量降序排列（并列时按键升序）。
+        """
+        matrix = {key: total for key, (_, total) in self.rollup(row_dimension, column_dimension).items()}
+        rows = [stat.key for stat in self.group_stats(row_dimension)]
+        columns = [stat.key for stat in self.group_stats(column_dimension)]
+        return rows, columns, matrix
+    
+    def report_stats(self):
+        """分析报告所需的全部统计（ReportStats）"""
+        return ReportStats(
+            total_records=self.total_records,
+            total_pests=self.total_pests,
+            avg_density=self.total_pests / self.total_records if self.total_records > 0 else 0,
+            max_single=self.max_single,
+            pest_types=self.group_stats('pest_type'),
+            buildings=self.group_stats('building'),
+            top=self.top(),
+        )
+    
+    def to_state(self):
+        """可 JSON 序列化的立方体状态（见 from_state），用于在两次运行之间保存聚合结果"""
+        return {
+            'top_n': self.top_n,
+            'total_records': self.total_records,
+            'total_pests': self.total_pests,
+            'max_single': self.max_single,
+            'cells': [[*key, records, total] for key, (records, total) in self.cells.items()],
+            'top': [[count, order, *record.astuple()] for count, order, record in self._top_heap],
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        """从 to_state() 的结果恢复立方体，之后可继续 add_records() 增量累加"""
+        cube = cls(state['top_n'])
+        cube.total_records = state['total_records']
+        cube.total_pests = state['total_pests']
+        cube.max_single = state['max_single']
+        cube.cells = {tuple(cell[:-2]): cell[-2:] for cell in state['cells']}
+        cube._top_heap = [(item[0], item[1], PestRecord(*item[2:])) for item in state['top']]
+        heapq.heapify(cube._top_heap)
+        return cube
+
+
+def aggregate_records(records, top_n=10):
+    """一次遍历记录，计算分析报告所需的全部统计（不依赖 pandas）
+
+    Returns:
+        ReportStats
+    """
+    return RollupCube.from_records(records, top_n).report_stats()
+
+
+class RecordExporter:
+    """记录导出器基类：open() 后逐条 write(record)，close() 完成文件
+
+    提取时作为输出端（sink）传给 extract_pest_data_from_pdf，记录一解析出来就写出，
+    不必等整份报告提取完成。写出失败或提取失败时调用 discard() 删除不完整的文件。
+    """
+    
+    suffix = ''
+    label = ''
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self.metadata = None
+    
+    def open(self):
+        """打开输出文件；缺少依赖等无法导出时打印原因并返回 False"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        return True
+    
+    def set_metadata(self, metadata):
+        """设置报告信息（ReportMetadata），在写出记录之前调用；支持的格式写入文件级元数据"""
+        self.metadata = metadata
+    
+    def write(self, record):
+        raise NotImplementedError
+    
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+    
+    def close(self):
+        pass
+    
+    def discard(self):
+        """关闭并删除（不完整的）输出文件"""
+        self.close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class CsvExporter(RecordExporter):
+    """CSV 导出：UTF-8，首行为字段名，逐行写出"""
+    
+    suffix = '.csv'
+    label = 'CSV'
+    
+    def open(self):
+        import csv
+        
+        super().open()
+        self._file = open(self.path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(PEST_FIELDS)
+        return True
+    
+    def write(self, record):
+        self._writer.writerow(record.astuple())
+        self.count += 1
+    
+    def write_all(self, records):
+        rows = [record.astuple() for record in records]
+        self._writer.writerows(rows)
+        self.count += len(rows)
+    
+    def close(self):
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+
+class JsonlExporter(RecordExporter):
+    """JSON Lines 导出：每行一个以字段名为键的 JSON 对象"""
+    
+    suffix = '.jsonl'
+    label = 'JSONL'
+    
+    def open(self):
+        super().open()
+        self._file = open(self.path, 'w', encoding='utf-8')
+        return True
+    
+    def write(self, record):
+        self._file.write(json.dumps(record.to_dict(), ensure_ascii=False))
+        self._file.write('\n')
+        self.count += 1
+    
+    def close(self):
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetExporter(RecordExporter):
+    """Parquet 导出（需要 pyarrow）：记录按列缓冲，每满一个行组写出一次"""
+    
+    suffix = '.parquet'
+    label = 'Parquet'
+    
+    def open(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("❌ 导出Parquet需要安装 pyarrow: pip install pyarrow")
+            return False
+        
+        super().open()
+        self._pa = pa
+        self._schema = pa.schema([(field, pa.string()) for field in PEST_FIELDS[:-1]]
+                                 + [(PEST_FIELDS[-1], pa.int64())])
+        self._writer = pq.ParquetWriter(str(self.path), self._schema)
+        self._rows = []
+        return True
+    
+    def write(self, record):
+        self._rows.append(record.astuple())
+        self.count += 1
+        if len(self._rows) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+    
+    def _flush(self):
+        if not self._rows:
+            return
+        columns = [list(column) for column in zip(*self._rows)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+        self._rows = []
+    
+    def close(self):
+        if getattr(self, '_writer', None) is not None:
+            self._flush()
+            # 报告信息作为文件级键值元数据写入，不增加数据列
+            if self.metadata is not None and self.metadata.labeled():
+                self._writer.add_key_value_metadata(dict(self.metadata.labeled()))
+            self._writer.close()
+            self._writer = None
+
+
+# 各输出格式（xlsx 除外）对应的导出器
+EXPORTERS = {
+    'csv': CsvExporter,
+    'jsonl': JsonlExporter,
+    'parquet': ParquetExporter,
+}
+
+
+# 数据表和分析报告共用的命名样式
+STYLE_HEADER = "pest_header"
+STYLE_HEADER_ACCENT = "pest_header_accent"
+STYLE_BODY = "pest_body"
+STYLE_BODY_HIGHLIGHT = "pest_body_highlight"
+STYLE_TITLE = "pest_title"
+STYLE_SECTION_TITLE = "pest_section_title"
+STYLE_SECTION_TITLE_LARGE = "pest_section_title_large"
+STYLE_CARD_LABEL = "pest_card_label"
+STYLE_CARD_VALUE = "pest_card_value"
+STYLE_CARD_VALUE_HIGHLIGHT = "pest_card_value_highlight"
+
+# 命名样式定义（与 Excel 库无关）：size 为加粗字体的字号（缺省为常规字体），
+# color 为字体颜色，fill 为纯色底色，align 为水平对齐（垂直均居中），border 为四周细边框
+NAMED_STYLES = {
+    STYLE_HEADER: {'size': 11, 'fill': "D3D3D3", 'align': 'center', 'border': True},
+    STYLE_HEADER_ACCENT: {'size': 11, 'color': "FFFFFF", 'fill': "4472C4", 'align': 'center',
+                          'border': True},
+    STYLE_BODY: {'align': 'center', 'border': True},
+    STYLE_BODY_HIGHLIGHT: {'fill': "FFF3CD", 'align': 'center', 'border': True},
+    STYLE_TITLE: {'size': 16, 'align': 'left'},
+    STYLE_SECTION_TITLE: {'size': 13, 'fill': "E7E6E6", 'align': 'left'},
+    STYLE_SECTION_TITLE_LARGE: {'size': 14, 'fill': "E7E6E6", 'align': 'left'},
+    STYLE_CARD_LABEL: {'size': 11, 'align': 'left'},
+    STYLE_CARD_VALUE: {'size': 13, 'align': 'left'},
+    STYLE_CARD_VALUE_HIGHLIGHT: {'size': 13, 'fill': "FFF3CD", 'align': 'left'},
+}
+
+
+def _openpyxl_named_style(name, spec):
+    """把 NAMED_STYLES 中的一项转换为 openpyxl 的 NamedStyle"""
+    from openpyxl.styles import NamedStyle, Font, Alignment, PatternFill, Border, Side
+    from openpyxl.styles.fonts import DEFAULT_FONT
+    
+    style = NamedStyle(name=name)
+    if 'size' in spec:
+        style.font = Font(bold=True, size=spec['size'], color=spec.get('color'))
+    else:
+        style.font = DEFAULT_FONT
+    if 'fill' in spec:
+        style.fill = PatternFill(start_color=spec['fill'], end_color=spec['fill'], fill_type="solid")
+    if spec.get('border'):
+        thin = Side(style='thin')
+        style.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    style.alignment = Alignment(horizontal=spec['align'], vertical='center')
+    return style
+
+
+def _xlsxwriter_format(workbook, spec):
+    """把 NAMED_STYLES 中的一项转换为 xlsxwriter 的 Format"""
+    properties = {'align': spec['align'], 'valign': 'vcenter'}
+    if 'size' in spec:
+        properties.update(bold=True, font_size=spec['size'])
+    if 'color' in spec:
+        properties['font_color'] = f"#{spec['color']}"
+    if 'fill' in spec:
+        properties.update(pattern=1, bg_color=f"#{spec['fill']}")
+    if spec.get('border'):
+        properties['border'] = 1
+    return workbook.add_format(properties)
+
+
+def register_named_styles(wb):
+    """在 openpyxl 工作簿中注册共用的命名样式（每个工作簿一次，已存在的样式跳过）
+
+    单元格随后只按名称引用样式（cell.style = STYLE_BODY），不再逐个单元格
+    创建 Font/Border/PatternFill/Alignment 对象，保存时也无需再去重。
+    """
+    existing = set(wb.named_styles)
+    for name, spec in NAMED_STYLES.items():
+        if name not in existing:
+            wb.add_named_style(_openpyxl_named_style(name, spec))
+    return wb
+
+
+def _column_letter(column):
+    """列号（从1开始）→ Excel 列字母，如 1 → 'A'，27 → 'AA'"""
+    letters = ''
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class SheetCanvas:
+    """与 Excel 库无关的工作表草稿：单元格值和命名样式、合并区域、列宽
+
+    分析报告先绘制到草稿上，再由 ExcelWriter 后端写出。绘制顺序不限，
+    写出时按行顺序输出，因此只能顺序追加行的流式后端也能使用。
+    """
+    
+    def __init__(self):
+        self.cells = {}
+        self.merged = []
+        self.column_widths = {}
+    
+    def write(self, row, column, value, style=None):
+        """写入单元格（行号、列号从1开始）"""
+        self.cells[row, column] = (value, style)
+    
+    def merge(self, ref):
+        """合并单元格区域，如 'A1:G2'；值和样式写在左上角单元格"""
+        self.merged.append(ref)
+    
+    def set_width(self, letter, width):
+        self.column_widths[letter] = width
+    
+    def iter_rows(self):
+        """按行号顺序返回 (行号, [(列号, 值, 样式), ...])，行内按列号排序"""
+        rows = {}
+        for (row, column), (value, style) in self.cells.items():
+            rows.setdefault(row, []).append((column, value, style))
+        for row in sorted(rows):
+            yield row, sorted(rows[row], key=lambda cell: cell[0])
+
+
+class ExcelWriter:
+    """Excel 写出后端基类
+
+    工作表按添加顺序排列：add_canvas_sheet 写出绘制在 SheetCanvas 上的工作表，
+    add_data_sheet 逐行写出数据表，close() 完成并保存文件。
+    """
+    
+    def __init__(self, path, write_only=False):
+        self.path = Path(path)
+        self.write_only = write_only
+    
+    def add_data_sheet(self, title, rows, header=PEST_FIELDS, column_widths=DATA_COLUMN_WIDTHS):
+        raise NotImplementedError
+    
+    def add_canvas_sheet(self, title, canvas):
+        raise NotImplementedError
+    
+    def set_metadata(self, metadata):
+        """把报告信息（ReportMetadata）写入工作簿的文档属性（标题和自定义属性）"""
+        raise NotImplementedError
+    
+    def close(self):
+        raise NotImplementedError
+
+
+class OpenpyxlExcelWriter(ExcelWriter):
+    """openpyxl 后端：普通工作簿，或 write_only 时的流式工作簿"""
+    
+    def __init__(self, path, write_only=False):
+        from openpyxl import Workbook
+        
+        super().__init__(path, write_only)
+        self.workbook = register_named_styles(Workbook(write_only=write_only))
+        # 普通工作簿自带一个空工作表，第一个工作表直接使用它
+        self._reuse_active = not write_only
+    
+    def _create_sheet(self, title):
+        if self._reuse_active:
+            self._reuse_active = False
+            ws = self.workbook.active
+            ws.title = title
+            return ws
+        return self.workbook.create_sheet(title)
+    
+    def add_data_sheet(self, title, rows, header=PEST_FIELDS, column_widths=DATA_COLUMN_WIDTHS):
+        from openpyxl.cell import WriteOnlyCell
+        
+        ws = self._create_sheet(title)
+        # 流式工作表的列宽必须在写入行之前设置
+        for letter, width in column_widths.items():
+            ws.column_dimensions[letter].width = width
+        
+        if not self.write_only:
+            ws.append(header)
+            for cell in ws[1]:
+                cell.style = STYLE_HEADER
+            for values in rows:
+                ws.append(values)
+            for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
+                for cell in row:
+                    cell.style = STYLE_BODY
+            return
+        
+        header_cells = []
+        for value in header:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = STYLE_HEADER
+            header_cells.append(cell)
+        ws.append(header_cells)
+        
+        # 每列一个预设样式的单元格，逐行只替换值后追加
+        row_cells = []
+        for _ in header:
+            cell = WriteOnlyCell(ws)
+            cell.style = STYLE_BODY
+            row_cells.append(cell)
+        for values in rows:
+            for cell, value in zip(row_cells, values):
+                cell.value = value
+            ws.append(row_cells)
+    
+    def add_canvas_sheet(self, title, canvas):
+        ws = self._create_sheet(title)
+        if self.write_only:
+            self._append_canvas(ws, canvas)
+        else:
+            self.draw_canvas(ws, canvas)
+    
+    @staticmethod
+    def draw_canvas(ws, canvas):
+        """把草稿绘制到普通 openpyxl 工作表上（工作簿需已注册命名样式）"""
+        for letter, width in canvas.column_widths.items():
+            ws.column_dimensions[letter].width = width
+        for (row, column), (value, style) in canvas.cells.items():
+            cell = ws.cell(row=row, column=column, value=value)
+            if style:
+                cell.style = style
+        for ref in canvas.merged:
+            ws.merge_cells(ref)
+    
+    @staticmethod
+    def _append_canvas(ws, canvas):
+        """把草稿按行追加到流式工作表"""
+        from openpyxl.cell import WriteOnlyCell
+        
+        for letter, width in canvas.column_widths.items():
+            ws.column_dimensions[letter].width = width
+        for ref in canvas.merged:
+            ws.merged_cells.add(ref)
+        
+        next_row = 1
+        for row, cells in canvas.iter_rows():
+            while next_row < row:
+                ws.append([])
+                next_row += 1
+            line = []
+            for column, value, style in cells:
+                line.extend([None] * (column - 1 - len(line)))
+                cell = WriteOnlyCell(ws, value=value)
+                if style:
+                    cell.style = style
+                line.append(cell)
+            ws.append(line)
+            next_row += 1
+    
+    def set_metadata(self, metadata):
+        from openpyxl.packaging.custom import StringProperty
+        
+        if metadata.report_number:
+            self.workbook.properties.title = f"虫害情况报告 {metadata.report_number}"
+        for label, value in metadata.labeled():
+            self.workbook.custom_doc_props.append(StringProperty(name=label, value=value))
+    
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class XlsxwriterExcelWriter(ExcelWriter):
+    """xlsxwriter 后端（constant_memory 模式）：每行写完即落盘，内存占用与行数无关
+
+    constant_memory 模式下行必须按顺序写出，因此总是流式写出，write_only 不起作用。
+    """
+    
+    def __init__(self, path, write_only=True):
+        import xlsxwriter
+        
+        super().__init__(path, write_only)
+        self.workbook = xlsxwriter.Workbook(str(self.path), {
+            'constant_memory': True,
+            # 单元格内容按原样写为文本，不识别为公式或链接
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+        })
+        self.formats = {name: _xlsxwriter_format(self.workbook, spec)
+                        for name, spec in NAMED_STYLES.items()}
+    
+    @staticmethod
+    def _set_column_widths(ws, column_widths):
+        # openpyxl 把列宽原样写入文件，xlsxwriter 会再加上 5 像素的单元格边距；
+        # 先减去边距，两种引擎写出的列宽才一致
+        for letter, width in column_widths.items():
+            ws.set_column(f"{letter}:{letter}", width - 5 / 7)
+    
+    def add_data_sheet(self, title, rows, header=PEST_FIELDS, column_widths=DATA_COLUMN_WIDTHS):
+        ws = self.workbook.add_worksheet(title)
+        self._set_column_widths(ws, column_widths)
+        ws.write_row(0, 0, header, self.formats[STYLE_HEADER])
+        body = self.formats[STYLE_BODY]
+        for index, values in enumerate(rows, 1):
+            ws.write_row(index, 0, values, body)
+    
+    def add_canvas_sheet(self, title, canvas):
+        from xlsxwriter.utility import xl_cell_to_rowcol
+        
+        ws = self.workbook.add_worksheet(title)
+        self._set_column_widths(ws, canvas.column_widths)
+        
+        # 合并区域在写到其左上角单元格时一并写出
+        merged = {}
+        for ref in canvas.merged:
+            first, last = ref.split(':')
+            merged[xl_cell_to_rowcol(first)] = xl_cell_to_rowcol(last)
+        
+        for row, cells in canvas.iter_rows():
+            for column, value, style in cells:
+                position = (row - 1, column - 1)
+                fmt = self.formats.get(style)
+                if position in merged:
+                    ws.merge_range(*position, *merged[position], value, fmt)
+                else:
+                    ws.write(*position, value, fmt)
+    
+    def set_metadata(self, metadata):
+        if metadata.report_number:
+            self.workbook.set_properties({'title': f"虫害情况报告 {metadata.report_number}"})
+        for label, value in metadata.labeled():
+            self.workbook.set_custom_property(label, value)
+    
+    def close(self):
+        self.workbook.close()
+
+
+# Excel 写出引擎
+EXCEL_ENGINES = {
+    'openpyxl': OpenpyxlExcelWriter,
+    'xlsxwriter': XlsxwriterExcelWriter,
+}
+
+# 总表（--append-to）旁的增量状态文件：总表路径 + 该后缀
+MASTER_STATE_SUFFIX = '.state.json'
+# 状态文件格式版本：结构变化时递增，旧状态文件随之失效（触发一次完整重建）
+MASTER_STATE_VERSION = 1
+
+_SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_RELATIONSHIP_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_RELATIONSHIP_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_DIMENSION_RE = re.compile(rb'<dimension ref="([A-Z]+\d+)(?::([A-Z]+)\d+)?"')
+
+
+def _column_index(letters):
+    """Excel 列字母 → 列号（从1开始），如 'A' → 1，'AA' → 27"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index
+
+
+def _xml_text(value):
+    """inlineStr 单元格的 <is> 部分；首尾有空白时保留空白"""
+    text = _xml_escape(str(value))
+    if text != text.strip():
+        return f'<is><t xml:space="preserve">{text}</t></is>'
+    return f'<is><t>{text}</t></is>'
+
+
+def _xml_escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _canvas_sheet_xml(canvas, style_ids):
+    """把 SheetCanvas 直接序列化为工作表 XML（字符串写为 inlineStr，样式按 style_ids 映射为 s 属性）"""
+    parts = [f'<worksheet xmlns="{_SHEET_NS}">']
+    if canvas.column_widths:
+        parts.append('<cols>')
+        for column, width in sorted((_column_index(letter), width)
+                                    for letter, width in canvas.column_widths.items()):
+            parts.append(f'<col min="{column}" max="{column}" width="{width}" customWidth="1"/>')
+        parts.append('</cols>')
+    
+    parts.append('<sheetData>')
+    for row, cells in canvas.iter_rows():
+        parts.append(f'<row r="{row}">')
+        for column, value, style in cells:
+            ref = f"{_column_letter(column)}{row}"
+            s = f' s="{style_ids[style]}"' if style else ''
+            if value is None:
+                parts.append(f'<c r="{ref}"{s}/>')
+            elif isinstance(value, (int, float)):
+                parts.append(f'<c r="{ref}"{s} t="n"><v>{value}</v></c>')
+            else:
+                parts.append(f'<c r="{ref}"{s} t="inlineStr">{_xml_text(value)}</c>')
+        parts.append('</row>')
+    parts.append('</sheetData>')
+    
+    if canvas.merged:
+        parts.append(f'<mergeCells count="{len(canvas.merged)}">')
+        parts.extend(f'<mergeCell ref="{ref}"/>' for ref in canvas.merged)
+        parts.append('</mergeCells>')
+    parts.append('<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/>')
+    parts.append('</worksheet>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _data_rows_xml(records, first_row, style_id):
+    """数据表新行的 XML（文本列为 inlineStr，数量列为数字，全部使用 style_id 样式）"""
+    letters = [_column_letter(column) for column in range(1, len(PEST_FIELDS) + 1)]
+    count_letter = letters.pop()
+    # 建筑物、部门等取值大量重复，转义结果按取值缓存
+    texts = {}
+    parts = []
+    append = parts.append
+    s = f' s="{style_id}"'
+    for row, record in enumerate(records, first_row):
+        values = record.astuple()
+        append(f'<row r="{row}">')
+        for letter, value in zip(letters, values):
+            text = texts.get(value)
+            if text is None:
+                text = texts[value] = _xml_text(value)
+            append(f'<c r="{letter}{row}"{s} t="inlineStr">{text}</c>')
+        append(f'<c r="{count_letter}{row}"{s} t="n"><v>{values[-1]}</v></c></row>')
+    return ''.join(parts).encode('utf-8')
+
+
+class MasterWorkbook:
+    """持续汇集各份报告的总表工作簿（--append-to）
+
+    总表旁保存一个状态文件：统计立方体（RollupCube.to_state）、数据表最后一行的行号、
+    已追加报告的内容哈希，以及总表写出后的大小和修改时间。追加新记录时：
+      - 新行直接拼接到数据表 XML 的 </sheetData> 之前，已有的行只做流式复制，不解析；
+      - 新记录累加到状态中的立方体，分析/透视工作表从立方体重新绘制，不再读取历史记录。
+    因此追加的耗时主要取决于新记录数，而不是总表已有的行数。
+    总表在别处被修改过（如在 Excel 中保存）时立方体和行号不再可用，需完整重建，
+    但已追加报告的内容哈希仍然有效，重建时照样据此去重。
+    """
+    
+    DATA_SHEET = "虫害情况"
+    # 数据表 XML 流式复制的块大小
+    CHUNK_SIZE = 1024 * 1024
+    # 重写数据表时的压缩级别：每次追加都要重新压缩整个数据表，
+    # 级别1比默认级别快约3倍，文件只大约20%
+    COMPRESS_LEVEL = 1
+    
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        self.state_path = Path(f"{self.path}{MASTER_STATE_SUFFIX}")
+    
+    def load_state(self):
+        """读取状态文件；缺失、版本不符或总表不存在时返回 None
+
+        返回的状态中 'current' 表示总表当前的大小/修改时间与状态一致，即立方体和
+        行号可用于增量拼接；不一致时只有已追加报告的内容哈希（'reports'）可用。
+        """
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            stat = self.path.stat()
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != MASTER_STATE_VERSION:
+            return None
+        state['current'] = state.get('size') == stat.st_size and state.get('mtime_ns') == stat.st_mtime_ns
+        return state
+    
+    def save_state(self, cube, last_row, reports):
+        """总表写出后保存状态（先写临时文件再替换，中断时不会留下不完整的状态）"""
+        stat = self.path.stat()
+        state = {
+            'version': MASTER_STATE_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'last_row': last_row,
+            'reports': reports,
+            'cube': cube.to_state(),
+        }
+        temp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, self.state_path)
+    
+    @staticmethod
+    def _sheet_parts(zf):
+        """工作表名 → 压缩包内的工作表 XML 路径"""
+        import xml.etree.ElementTree as ET
+        
+        workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+        rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        for rel in rels.iter(f'{{{_PACKAGE_RELATIONSHIP_NS}}}Relationship'):
+            target = rel.get('Target')
+            targets[rel.get('Id')] = target[1:] if target.startswith('/') else f"xl/{target}"
+        return {sheet.get('name'): targets.get(sheet.get(f'{{{_RELATIONSHIP_NS}}}id'))
+                for sheet in workbook.iter(f'{{{_SHEET_NS}}}sheet')}
+    
+    @staticmethod
+    def _named_style_ids(zf):
+        """命名样式名 → 引用该样式的单元格格式序号（单元格的 s 属性）"""
+        import xml.etree.ElementTree as ET
+        
+        styles = ET.fromstring(zf.read('xl/styles.xml'))
+        names = {cell_style.get('xfId'): cell_style.get('name')
+                 for cell_style in styles.iter(f'{{{_SHEET_NS}}}cellStyle')}
+        ids = {}
+        cell_xfs = styles.find(f'{{{_SHEET_NS}}}cellXfs')
+        for index, xf in enumerate(cell_xfs if cell_xfs is not None else []):
+            name = names.get(xf.get('xfId', '0'))
+            if name is not None:
+                ids.setdefault(name, index)
+        return ids
+    
+    def sheet_titles(self):
+        import zipfile
+        
+        with zipfile.ZipFile(self.path) as zf:
+            return list(self._sheet_parts(zf))
+    
+    def read_records(self):
+        """用只读模式读回数据表中的全部记录（完整重建时使用）"""
+        from openpyxl import load_workbook
+        
+        wb = load_workbook(self.path, read_only=True)
+        try:
+            if self.DATA_SHEET not in wb.sheetnames:
+                return []
+            ws = wb[self.DATA_SHEET]
+            ws.reset_dimensions()
+            return PestReportExtractor._records_from_sheet(ws)
+        finally:
+            wb.close()
+    
+    def splice(self, records, last_row, canvases):
+        """把记录追加到数据表末尾，并用 canvases（{工作表名: SheetCanvas}）替换对应的工作表
+
+        Returns:
+            成功时返回追加后数据表最后一行的行号；总表结构不符合预期（缺少工作表、
+            命名样式等）时返回 None，此时总表保持不变
+        """
+        import zipfile
+        
+        temp_path = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            with zipfile.ZipFile(self.path) as source:
+                parts = self._sheet_parts(source)
+                style_ids = self._named_style_ids(source)
+                data_part = parts.get(self.DATA_SHEET)
+                if (data_part is None or any(parts.get(title) is None for title in canvases)
+                        or any(name not in style_ids for name in NAMED_STYLES)):
+                    return None
+                replacements = {parts[title]: _canvas_sheet_xml(canvas, style_ids)
+                                for title, canvas in canvases.items()}
+                new_last_row = last_row + len(records)
+                rows_xml = _data_rows_xml(records, last_row + 1, style_ids[STYLE_BODY])
+                
+                with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED,
+                                     compresslevel=self.COMPRESS_LEVEL) as target:
+                    for info in source.infolist():
+                        if info.filename == data_part:
+                            with source.open(info) as src, target.open(info.filename, 'w') as dst:
+                                if not self._copy_with_rows(src, dst, rows_xml, new_last_row):
+                                    return None
+                        elif info.filename in replacements:
+                            target.writestr(info.filename, replacements[info.filename])
+                        else:
+                            target.writestr(info, source.read(info))
+            os.replace(temp_path, self.path)
+            return new_last_row
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+    
+    def _copy_with_rows(self, src, dst, rows_xml, last_row):
+        """流式复制数据表 XML，在 </sheetData> 前插入新行，并更新 <dimension> 的结束行"""
+        end_tag = b'</sheetData>'
+        last_column = _column_letter(len(PEST_FIELDS)).encode()
+        first = True
+        carry = b''
+        while True:
+            chunk = src.read(self.CHUNK_SIZE)
+            if not chunk:
+                return False
+            data = carry + chunk
+            if first:
+                first = False
+                data = _DIMENSION_RE.sub(
+                    lambda m: b'<dimension ref="%s:%s%d"' % (m.group(1), m.group(2) or last_column, last_row),
+                    data, count=1
+                )
+            position = data.find(end_tag)
+            if position >= 0:
+                dst.write(data[:position])
+                dst.write(rows_xml)
+                dst.write(data[position:])
+                for chunk in iter(lambda: src.read(self.CHUNK_SIZE), b''):
+                    dst.write(chunk)
+                return True
+            # 保留末尾几个字节，结束标签跨块时也能找到
+            dst.write(data[:-len(end_tag)])
+            carry = data[-len(end_tag):]
 
 
 class PestReportExtractor:
     """虫害报告提取器"""
     
-    def __init__(self):
+    def __init__(self, cache=None):
+        """
+        Args:
+            cache: ExtractionCache 实例；为 None 时不使用提取缓存
+        """
+        self.cache = cache
+        self.content_hash = None
         self.pdf_path = None
         self.pest_data = []
         self.output_path = None
+        self.page_count = 0
+        self.pages_laid_out = 0
+        # 疑似虫害记录但未能解析的行：[(行号, 行文本)]
+        self.parse_rejects = []
+        # 按文档缓存的虫害情况页码定位结果
+        self._section_index = {}
+        # 当前提取使用的页级断点（PageCheckpoint）
+        self.checkpoint = None
+        # 写入数据表时逐行计算的摘要（row_digest），供 verify_data 流式比对
+        self.row_digests = []
+        # 当前提取的记录输出端（RecordExporter），解析出的记录逐条写入
+        self.sinks = []
+        # 报告首页的报告信息（ReportMetadata），提取时读取
+        self.metadata = None
+        # 最近一次异常点位检测被跳过的原因（未跳过时为 None），写入分析报告的异常点位部分
+        self.anomaly_skip_reason = None
         
     def select_file(self, file_type="pdf"):
         """选择文件对话框（GUI模式）"""
@@ -46,6 +2112,9 @@ class PestReportExtractor:
             print("❌ GUI模式不可用，请使用命令行参数指定文件")
             return None
             
+        import tkinter as tk
+        from tkinter import filedialog
+        
         root = tk.Tk()
         root.withdraw()
         root.lift()
@@ -65,227 +2134,948 @@ class PestReportExtractor:
         root.destroy()
         return file_path
     
-    def extract_pest_data_from_pdf(self, pdf_path):
-        """从PDF中提取虫害数据"""
+    def extract_pest_data_from_pdf(self, pdf_path, streaming=True, locate=True, workers=1,
+                                   backend='text', checkpoint=True, resume=False, sinks=None):
+        """从PDF中提取虫害数据
+
+        Args:
+            pdf_path: PDF文件路径
+            streaming: 是否逐页流式提取（找到"服务总结"后即停止排版后续页面）
+            locate: 是否先用轻量文本预扫描定位虫害情况所在页码，只排版该范围
+            workers: 并行排版的进程数（大于1时按连续页码区间分配给各进程）
+            backend: 页面文本提取后端，'text'（整页排版）或 'words'（按单词坐标重建行）
+            checkpoint: 是否在PDF旁写页级断点文件，提取被中断后可恢复
+            resume: 是否从已有的断点文件恢复（否则丢弃旧断点重新提取）
+            sinks: 已打开的记录导出器列表，解析出的每条记录随即写入
+        """
         print(f"\n📄 正在读取PDF文件: {Path(pdf_path).name}")
+        self.pdf_path = pdf_path
         self.pest_data = []
+        self.pages_laid_out = 0
+        self.page_count = 0
+        self.content_hash = None
+        self.checkpoint = None
+        self.sinks = list(sinks or ())
+        self.metadata = None
+        
+        if self.cache is not None:
+            try:
+                self.content_hash = file_digest(pdf_path)
+            except OSError as e:
+                print(f"❌ PDF读取失败: {str(e)}")
+                return False
+            entry = self.cache.get(self.content_hash, backend)
+            if entry is not None:
+                self.pest_data = [PestRecord(*row) for row in entry['records']]
+                self.page_count = entry.get('page_count', 0)
+                self._load_metadata(pdf_path, entry.get('metadata'))
+                self._emit_to_sinks(self.pest_data)
+                print("⚡ 命中提取缓存，跳过PDF解析")
+                print(f"✅ 成功提取 {len(self.pest_data)} 条虫害活动记录")
+                return True
+        
+        if checkpoint:
+            try:
+                if self.content_hash is None:
+                    self.content_hash = file_digest(pdf_path)
+            except OSError as e:
+                print(f"❌ PDF读取失败: {str(e)}")
+                return False
+            self.checkpoint = PageCheckpoint(pdf_path, self.content_hash, backend)
+            if not resume:
+                self.checkpoint.discard()
+            elif self.checkpoint.load():
+                if self.checkpoint.records is not None:
+                    self.pest_data = list(self.checkpoint.records)
+                    self._load_metadata(pdf_path)
+                    self._emit_to_sinks(self.pest_data)
+                    print("⏯️ 从断点恢复已解析的记录，跳过PDF解析")
+                    print(f"✅ 成功提取 {len(self.pest_data)} 条虫害活动记录")
+                    return True
+                print(f"⏯️ 从断点恢复：已完成 {len(self.checkpoint.pages)} 页")
+        
+        import pdfplumber
+        
+        # 报告信息只读取前几页的原始文本，在记录写出之前交给各输出端
+        self._load_metadata(pdf_path)
+        
+        section_range = None
+        if streaming and locate:
+            section_range = self.locate_pest_section(pdf_path)
         
         try:
             with pdfplumber.open(pdf_path) as pdf:
-                full_text = ""
-                for page in pdf.pages:
-                    full_text += page.extract_text() + "\n"
+                self.page_count = len(pdf.pages)
                 
                 # 提取虫害情况部分
-                pest_section = self._extract_pest_section(full_text)
+                if section_range is not None:
+                    print(f"   定位到虫害情况: 第 {section_range.start_page + 1}-"
+                          f"{section_range.end_page + 1} 页")
+                    pest_section = self._read_pest_section(
+                        pdf, pdf_path, section_range.start_page, section_range.end_page + 1,
+                        streaming=True, workers=workers, backend=backend
+                    )
+                    if not pest_section:
+                        # 预扫描结果与排版文本不一致时，回退到全文流式提取
+                        print("   ⚠️ 定位范围内未找到完整的虫害情况，改为逐页扫描全文")
+                        pest_section = self._read_pest_section(
+                            pdf, pdf_path, 0, self.page_count, streaming=True, workers=workers,
+                            backend=backend
+                        )
+                else:
+                    pest_section = self._read_pest_section(
+                        pdf, pdf_path, 0, self.page_count, streaming=streaming, workers=workers,
+                        backend=backend
+                    )
+                
+                print(f"   已排版 {self.pages_laid_out}/{self.page_count} 页")
                 
                 if not pest_section:
                     print("❌ 未找到虫害情况数据")
+                    self.discard_checkpoint()
                     return False
                 
                 # 解析虫害记录
                 self._parse_pest_records(pest_section)
                 
                 print(f"✅ 成功提取 {len(self.pest_data)} 条虫害活动记录")
-                return True
+                if self.checkpoint is not None:
+                    self._save_checkpoint_records()
+            
+            if self.cache is not None:
+                self._store_in_cache(pdf_path, backend)
+            return True
                 
         except Exception as e:
             print(f"❌ PDF读取失败: {str(e)}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+    
+    def _save_checkpoint_records(self):
+        """把解析结果写入断点，之后的步骤失败时重跑可直接跳过提取"""
+        try:
+            self.checkpoint.add_records(self.pest_data)
+        except OSError as e:
+            print(f"⚠️ 写入断点文件失败: {e}")
+    
+    def discard_checkpoint(self):
+        """输出文件生成完毕后删除断点文件"""
+        if self.checkpoint is not None:
+            self.checkpoint.discard()
+            self.checkpoint = None
+    
+    def _store_in_cache(self, pdf_path, backend):
+        """把解析结果写入提取缓存（写入失败不影响本次提取）"""
+        entry = {
+            'parser_version': PARSER_VERSION,
+            'backend': backend,
+            'source_name': Path(pdf_path).name,
+            'page_count': self.page_count,
+            'metadata': self.metadata._asdict() if self.metadata is not None else None,
+            'records': [record.astuple() for record in self.pest_data],
+        }
+        try:
+            self.cache.put(self.content_hash, entry, backend)
+        except OSError as e:
+            print(f"⚠️ 写入提取缓存失败: {e}")
+    
+    def _read_pest_section(self, pdf, pdf_path, start, stop, streaming=True, workers=1,
+                           backend='text'):
+        """排版 [start, stop) 范围内的页面并取出虫害情况部分文本"""
+        if workers > 1 and stop - start > 1:
+            texts = self._extract_pages_parallel(pdf_path, start, stop, workers, backend)
+        else:
+            texts = self._iter_page_texts(pdf.pages[start:stop], backend)
+        
+        if streaming:
+            return self._collect_pest_section(texts)
+        
+        full_text = "\n".join(texts) + "\n"
+        return self._extract_pest_section(full_text)
+    
+    def _extract_pages_parallel(self, pdf_path, start, stop, workers, backend='text'):
+        """用进程池并行排版页面，每个进程各自打开PDF处理一段连续页码，结果按页码顺序产出"""
+        from concurrent.futures import ProcessPoolExecutor
+        
+        page_ranges = _split_page_ranges(start, stop, workers)
+        print(f"   使用 {len(page_ranges)} 个进程并行排版第 {start + 1}-{stop} 页")
+        
+        done = self.checkpoint.pages if self.checkpoint is not None else {}
+        executor = ProcessPoolExecutor(max_workers=len(page_ranges))
+        try:
+            jobs = []
+            for range_start, range_stop in page_ranges:
+                # 跳过断点中已完成的前缀页
+                first_missing = range_start
+                while first_missing < range_stop and first_missing in done:
+                    first_missing += 1
+                future = None
+                if first_missing < range_stop:
+                    future = executor.submit(_extract_page_range_texts, str(pdf_path),
+                                             first_missing, range_stop, backend)
+                jobs.append((range_start, first_missing, future))
+            
+            for range_start, first_missing, future in jobs:
+                for index in range(range_start, first_missing):
+                    yield done[index]
+                if future is None:
+                    continue
+                texts = future.result()
+                self.pages_laid_out += len(texts)
+                for index, text in enumerate(texts, first_missing):
+                    self._checkpoint_page(index, text)
+                    yield text
+        finally:
+            # 流式收集提前结束时，取消尚未开始的页码区间
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def extract_report_metadata(self, pdf_path):
+        """从报告前 HEADER_PAGES 页的原始文本中读取报告编号、客户名称和服务日期
+
+        只读取前几页的原始文本流，不做排版，也不会遍历整个文档。
+
+        Returns:
+            ReportMetadata（未找到的字段为 None）
+        """
+        texts = []
+        pages = self._iter_raw_page_texts(pdf_path)
+        try:
+            for index, raw_text in pages:
+                if index >= HEADER_PAGES:
+                    break
+                texts.append(raw_text)
+        except Exception as e:
+            print(f"⚠️ 读取报告信息失败: {e}")
+        finally:
+            pages.close()
+        return parse_report_metadata(texts)
+    
+    def _load_metadata(self, pdf_path, cached=None):
+        """读取报告信息（提取缓存中已有时直接使用），并交给各输出端"""
+        if cached is not None:
+            self.metadata = ReportMetadata(**cached)
+        else:
+            self.metadata = self.extract_report_metadata(pdf_path)
+        labeled = self.metadata.labeled()
+        if labeled:
+            print("🏷️ 报告信息: " + "，".join(f"{label} {value}" for label, value in labeled))
+        for sink in self.sinks:
+            sink.set_metadata(self.metadata)
+    
+    def locate_pest_section(self, pdf_path):
+        """预扫描定位虫害情况所在的页码范围（不做完整排版）
+
+        使用 pypdfium2 的原始文本流（pdfplumber 的依赖），不可用时退回到
+        pdfplumber 的字符流。结果按文档缓存，同一文件的后续提取直接复用。
+
+        Returns:
+            SectionRange(start_page, end_page)，页码从0开始且包含两端；
+            未找到开始标记时返回 None
+        """
+        try:
+            stat = Path(pdf_path).stat()
+            doc_key = (str(Path(pdf_path).resolve()), stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return None
+        
+        if doc_key in self._section_index:
+            return self._section_index[doc_key]
+        
+        start_page = end_page = None
+        last_page = -1
+        try:
+            for index, raw_text in self._iter_raw_page_texts(pdf_path):
+                last_page = index
+                # 原始字符流中汉字之间可能夹杂空白，匹配前先去除
+                text = _WHITESPACE_RE.sub('', raw_text)
+                if start_page is None:
+                    start_idx = text.find(PEST_SECTION_START)
+                    if start_idx == -1:
+                        continue
+                    start_page = index
+                    text = text[start_idx:]
+                if PEST_SECTION_END in text:
+                    end_page = index
+                    break
+        except Exception as e:
+            print(f"⚠️ 虫害情况预定位失败，将逐页扫描: {e}")
+            return None
+        
+        section_range = None
+        if start_page is not None:
+            section_range = SectionRange(start_page, end_page if end_page is not None else last_page)
+        self._section_index[doc_key] = section_range
+        return section_range
+    
+    def _iter_raw_page_texts(self, pdf_path):
+        """逐页产出未经排版的原始文本，用于快速定位"""
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            pdfium = None
+        
+        if pdfium is not None:
+            doc = pdfium.PdfDocument(str(pdf_path))
+            try:
+                for index in range(len(doc)):
+                    page = doc[index]
+                    textpage = page.get_textpage()
+                    try:
+                        yield index, textpage.get_text_range()
+                    finally:
+                        textpage.close()
+                        page.close()
+            finally:
+                doc.close()
+        else:
+            import pdfplumber
+            
+            with pdfplumber.open(pdf_path) as pdf:
+                for index, page in enumerate(pdf.pages):
+                    raw_text = "".join(char['text'] for char in page.chars)
+                    page.flush_cache()
+                    yield index, raw_text
+    
+    def _iter_page_texts(self, pages, backend='text'):
+        """逐页排版并产出页面文本，同时统计已排版页数"""
+        layout = PAGE_BACKENDS[backend]
+        done = self.checkpoint.pages if self.checkpoint is not None else {}
+        for page in pages:
+            index = page.page_number - 1
+            if index in done:
+                yield done[index]
+                continue
+            self.pages_laid_out += 1
+            text = layout(page)
+            self._checkpoint_page(index, text)
+            yield text
+    
+    def _checkpoint_page(self, index, text):
+        """把排版完成的页写入断点；写入失败时停用断点，不影响提取"""
+        if self.checkpoint is None:
+            return
+        try:
+            self.checkpoint.add_page(index, text)
+        except OSError as e:
+            print(f"⚠️ 写入断点文件失败，本次不再记录断点: {e}")
+            self.checkpoint.close()
+            self.checkpoint = None
+    
+    def _collect_pest_section(self, texts):
+        """按页顺序收集虫害情况部分：从包含开始标记的页面开始收集，遇到结束标记即停止"""
+        parts = []
+        collecting = False
+        
+        for text in texts:
+            if not collecting:
+                start_idx = text.find(PEST_SECTION_START)
+                if start_idx == -1:
+                    continue
+                collecting = True
+                text = text[start_idx:]
+            
+            end_idx = text.find(PEST_SECTION_END)
+            if end_idx != -1:
+                parts.append(text[:end_idx])
+                return "".join(parts)
+            parts.append(text + "\n")
+        
+        return None
     
     def _extract_pest_section(self, text):
         """提取虫害情况部分的文本"""
         # 查找虫害情况开始和结束的标记
-        start_marker = "虫害情况"
-        end_marker = "服务总结"
+        start_idx = text.find(PEST_SECTION_START)
+        end_idx = text.find(PEST_SECTION_END)
+        
+        if start_idx != -1 and end_idx != -1:
+            return text[start_idx:end_idx]
+        return None
+    
+    def _parse_pest_records(self, text):
+        """解析虫害记录"""
+        self.parse_rejects = []
+        records = iter_pest_records(text, self.parse_rejects)
+        if self.sinks:
+            for record in records:
+                self.pest_data.append(record)
+                for sink in self.sinks:
+                    sink.write(record)
+        else:
+            self.pest_data.extend(records)
+        
+        if self.parse_rejects:
+            print(f"⚠️ 有 {len(self.parse_rejects)} 行疑似虫害记录未能解析:")
+            for line_no, line in self.parse_rejects[:5]:  # 只显示前5个
+                print(f"   第{line_no}行: {line}")
+            if len(self.parse_rejects) > 5:
+                print(f"   ...还有 {len(self.parse_rejects) - 5} 行")
+    
+    def _emit_to_sinks(self, records):
+        """把已整体得到的记录（缓存或断点命中）写入所有输出端"""
+        for sink in self.sinks:
+            sink.write_all(records)
+    
+    def open_exporters(self, formats, output_dir=None, stem=None):
+        """为 formats 中除 xlsx 以外的格式打开导出器
+
+        Args:
+            formats: 输出格式列表（EXPORT_FORMATS 的子集）
+            output_dir: 输出目录（如果为None则使用桌面）
+            stem: 输出文件名（不含扩展名），各格式共用
+
+        Returns:
+            已打开的导出器列表；任一格式无法导出时返回 None
+        """
+        output_dir = self._resolve_output_dir(output_dir)
+        if stem is None:
+            stem = f"虫害情况报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        exporters = []
+        for fmt in formats:
+            if fmt not in EXPORTERS:
+                continue
+            exporter = EXPORTERS[fmt](output_dir / f"{stem}{EXPORTERS[fmt].suffix}")
+            if not exporter.open():
+                for opened in exporters:
+                    opened.discard()
+                return None
+            exporters.append(exporter)
+        return exporters
+    
+    def close_exporters(self, exporters, success=True):
+        """完成导出器的文件；success 为 False 时删除不完整的文件"""
+        for exporter in exporters:
+            if success:
+                exporter.close()
+                print(f"✅ {exporter.label}文件已保存: {exporter.path}（{exporter.count} 条）")
+            else:
+                exporter.discard()
+        if self.sinks is exporters:
+            self.sinks = []
+    
+    def export_records(self, formats, output_dir=None, stem=None):
+        """把内存中已有的记录一次性导出为 formats 中除 xlsx 以外的格式"""
+        if not self.pest_data:
+            print("❌ 没有数据可以导出")
+            return False
+        exporters = self.open_exporters(formats, output_dir, stem)
+        if exporters is None:
+            return False
+        try:
+            for exporter in exporters:
+                exporter.write_all(self.pest_data)
+        except Exception:
+            self.close_exporters(exporters, success=False)
+            raise
+        self.close_exporters(exporters)
+        return True
+    
+    def save_to_history(self, history_db, report_date=None):
+        """把当前提取结果写入 SQLite 历史库
+
+        Args:
+            history_db: 历史库文件路径
+            report_date: 报告日期（YYYY-MM-DD），为None时使用报告首页的服务日期，
+                仍未知时使用入库日期
+        """
+        if not self.pest_data:
+            print("❌ 没有数据可以写入历史库")
+            return False
+        
+        import sqlite3
+        
+        if self.metadata is None:
+            self.metadata = self.extract_report_metadata(self.pdf_path)
+        if report_date is None:
+            report_date = self.metadata.service_date
+            if report_date is None:
+                print("⚠️ 未在报告首页找到服务日期，按入库日期记录")
+        
+        try:
+            content_hash = self.content_hash or file_digest(self.pdf_path)
+            store = HistoryStore(history_db)
+            try:
+                report_id, count = store.ingest(self.pest_data, self.pdf_path, content_hash, report_date,
+                                                metadata=self.metadata)
+            finally:
+                store.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ 写入历史库失败: {str(e)}")
+            return False
+        print(f"🗄️ 已写入历史库: {count} 条记录（报告 #{report_id}，"
+              f"{report_date or '按入库日期'}，{history_db}）")
+        return True
+    
+    def detect_anomalies(self, history_db):
+        """找出数量明显高于自身历史基线的点位
+
+        以历史库中报告日期早于本期的最近 ANOMALY_WINDOW 期报告为历史，每个点位
+        （建筑物、楼层、部门、监测点位、虫害类型）取历史数量的中位数和 MAD 作为基线，
+        本期各点位一次向量化打分（score_anomalies），分数达到 ANOMALY_THRESHOLD 的判为异常。
+        与历史库的 point_counts 一致，同一点位的多条记录先把数量相加，每个点位至多报告一次。
+
+        Returns:
+            按分数降序的 AnomalyPoint 列表（没有异常时为空列表）；历史不足、读取失败或
+            未安装 numpy、未进行检测时返回 None，原因见 self.anomaly_skip_reason
+        """
+        import sqlite3
+        
+        self.anomaly_skip_reason = None
+        try:
+            import numpy as np
+        except ImportError:
+            print("⚠️ 异常点位检测需要安装 numpy（pip install numpy），已跳过")
+            self.anomaly_skip_reason = "未安装 numpy，未检测"
+            return None
+        
+        report_date = (self.metadata.service_date if self.metadata is not None else None) \
+            or datetime.now().date().isoformat()
+        totals = {}
+        for record in self.pest_data:
+            key = record.astuple()[:5]
+            totals[key] = totals.get(key, 0) + record.count
+        records = [PestRecord(*key, count) for key, count in totals.items()]
+        try:
+            store = HistoryStore(history_db)
+            try:
+                history = store.point_history([point_key(record.astuple()) for record in records], report_date)
+            finally:
+                store.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 读取历史库失败，跳过异常点位检测: {str(e)}")
+            self.anomaly_skip_reason = "历史库读取失败，未检测"
+            return None
         
-        start_idx = text.find(start_marker)
-        end_idx = text.find(end_marker)
+        periods = history.shape[1]
+        if periods < ANOMALY_MIN_HISTORY:
+            print(f"⏭️  历史报告只有 {periods} 期（至少需要 {ANOMALY_MIN_HISTORY} 期），跳过异常点位检测")
+            self.anomaly_skip_reason = f"历史不足 {ANOMALY_MIN_HISTORY} 期（现有 {periods} 期），未检测"
+            return None
         
-        if start_idx != -1 and end_idx != -1:
-            return text[start_idx:end_idx]
-        return None
+        current = np.fromiter((record.count for record in records), dtype=float, count=len(records))
+        
+        baseline, scale, score = score_anomalies(current, history)
+        flagged = np.flatnonzero(score >= ANOMALY_THRESHOLD)
+        flagged = flagged[np.argsort(-score[flagged], kind='stable')]
+        anomalies = [AnomalyPoint(records[i], float(baseline[i]), float(scale[i]), float(score[i]))
+                     for i in flagged]
+        if anomalies:
+            print(f"🚨 发现 {len(anomalies)} 个异常点位（基线为之前 {periods} 期报告）")
+        else:
+            print(f"✅ 未发现异常点位（基线为之前 {periods} 期报告）")
+        return anomalies
     
-    def _parse_pest_records(self, text):
-        """解析虫害记录"""
-        # 清理文本中的特殊字符
-        text = text.replace('\x01', ' ')
+    def _master_canvases(self, cube, titles):
+        """按总表中已有的分析/透视工作表，从立方体绘制对应的草稿 {工作表名: SheetCanvas}"""
+        canvases = {}
+        for title, draw in (("虫害分析", self._draw_analysis_report), ("虫害透视", self._draw_pivot_sheet)):
+            if title in titles:
+                canvases[title] = SheetCanvas()
+                draw(canvases[title], cube)
+        return canvases
+    
+    def append_to_master(self, master_path, reports=None, with_pivot=False):
+        """把记录追加到总表工作簿（--append-to），并刷新总表中的分析工作表
+
+        总表的状态文件有效时只拼接新行、增量更新统计立方体（见 MasterWorkbook）；
+        总表不存在、状态文件缺失或与总表不符时完整重建一次总表和状态文件。
+        内容哈希已追加过的报告会被跳过（总表在 Excel 中保存过、需要完整重建时也一样），
+        重复运行不会产生重复行。
+
+        Args:
+            master_path: 总表路径
+            reports: [(来源PDF, 内容哈希, 记录列表)]，为None时追加当前提取结果
+            with_pivot: 是否在总表中生成"虫害透视"工作表（已有时总会刷新）
+        """
+        import zipfile
+        import xml.etree.ElementTree as ET
         
-        # 按行分割
-        lines = text.split('\n')
+        if reports is None:
+            if not self.pest_data:
+                print("❌ 没有数据可以追加到总表")
+                return False
+            reports = [(self.pdf_path, self.content_hash or file_digest(self.pdf_path), self.pest_data)]
         
-        for i, line in enumerate(lines):
-            line = line.strip()
-            
-            # 匹配虫害类型和数量：如 "绿化飞虫 发现虫害活动 - 5"
-            # 支持多种分隔符和空格
-            pest_match = re.match(r'^([\u4e00-\u9fa5]+)\s+发现虫害活动\s*[-–—]\s*(\d+)', line)
-            if pest_match:
-                pest_type = pest_match.group(1)
-                count = int(pest_match.group(2))
-                
-                # 查找下一行的建筑物信息
-                if i + 1 < len(lines):
-                    next_line = lines[i + 1].strip()
-                    # 支持更灵活的模式匹配
-                    building_match = re.search(
-                        r'建筑物:\s*([^,]+),\s*楼层:\s*([^,]+),\s*部门:\s*([^,]+),\s*检查/发现监测点位:\s*(.+)',
-                        next_line
-                    )
-                    
-                    if building_match:
-                        building = building_match.group(1).strip()
-                        floor = building_match.group(2).strip()
-                        department = building_match.group(3).strip()
-                        location = building_match.group(4).strip()
-                        
-                        # 添加记录
-                        self.pest_data.append({
-                            '建筑物': building,
-                            '楼层': floor,
-                            '部门': department,
-                            '检查/发现监测点位': location,
-                            '虫害类型': pest_type,
-                            '发现虫害活动': count
-                        })
-    
-    def create_excel(self, output_dir=None):
-        """创建Excel文件"""
-        if not self.pest_data:
-            print("❌ 没有数据可以导出")
+        master = MasterWorkbook(master_path)
+        print(f"\n📚 正在追加到总表: {master.path}")
+        start = time.perf_counter()
+        
+        state = master.load_state()
+        appended = {report['content_hash'] for report in state['reports']} if state else set()
+        entries = []
+        records = []
+        for source, content_hash, report_records in reports:
+            if content_hash in appended:
+                print(f"⏭️  已追加过，跳过: {Path(source).name}")
+                continue
+            appended.add(content_hash)
+            entries.append({
+                'source_file': str(source),
+                'content_hash': content_hash,
+                'records': len(report_records),
+                'appended_at': datetime.now().isoformat(timespec='seconds'),
+            })
+            records.extend(report_records)
+        if not entries:
+            print("✅ 总表已包含这些报告，无需更新")
+            return True
+        
+        try:
+            last_row = None
+            if state is not None and state['current']:
+                titles = master.sheet_titles()
+                if not with_pivot or "虫害透视" in titles:
+                    cube = RollupCube.from_state(state['cube'])
+                    cube.add_records(records)
+                    last_row = master.splice(records, state['last_row'], self._master_canvases(cube, titles))
+                    reports_state = state['reports'] + entries
+                    mode = "增量追加"
+            if last_row is None:
+                mode = "完整重建" if master.path.exists() else "新建总表"
+                cube, last_row = self._rebuild_master(master, records, with_pivot)
+                reports_state = (state['reports'] if state else []) + entries
+            master.save_state(cube, last_row, reports_state)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+            # 保留旧状态文件：总表若已改动，大小/修改时间不再一致，下次会完整重建，
+            # 而已追加报告的内容哈希仍可用于去重
+            print(f"❌ 追加到总表失败: {str(e)}")
             return False
         
-        print("\n📊 正在生成Excel文件...")
+        print(f"✅ 已追加 {len(records)} 条记录到总表（{mode}，数据表共 {last_row - 1} 行，"
+              f"{time.perf_counter() - start:.2f}s）")
+        return True
+    
+    def _rebuild_master(self, master, records, with_pivot):
+        """完整重建总表：读回已有数据表的记录，与新记录一起重新写出
+
+        Returns:
+            (统计立方体, 数据表最后一行的行号)
+        """
+        existing = []
+        titles = []
+        if master.path.exists():
+            print("🔄 总表没有可用的增量状态，读回已有记录完整重建...")
+            existing = master.read_records()
+            titles = master.sheet_titles()
+            dropped = [title for title in titles
+                       if title not in ("虫害分析", "虫害透视", MasterWorkbook.DATA_SHEET)]
+            if dropped:
+                print(f"⚠️ 重建后不保留这些工作表: {', '.join(dropped)}")
+        all_records = existing + list(records)
+        cube = RollupCube.from_records(all_records)
         
-        # 创建工作簿
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "虫害情况"
+        # 写入临时文件后再替换，中断时原总表保持不变
+        temp_path = master.path.with_name(f".{master.path.name}.tmp")
+        master.path.parent.mkdir(parents=True, exist_ok=True)
+        writer = OpenpyxlExcelWriter(temp_path, write_only=True)
+        sheets = {"虫害分析"} | set(titles)
+        if with_pivot:
+            sheets.add("虫害透视")
+        for title, canvas in self._master_canvases(cube, sheets).items():
+            writer.add_canvas_sheet(title, canvas)
+        writer.add_data_sheet(MasterWorkbook.DATA_SHEET, (record.astuple() for record in all_records))
+        writer.close()
+        os.replace(temp_path, master.path)
+        return cube, len(all_records) + 1
+    
+    def _load_diff_side(self, ref, history_db=None):
+        """读取对比的一方：PDF文件（命中提取缓存时不解析PDF），或历史库中的报告ID/报告编号
+
+        Returns:
+            (显示名称, 记录列表)；读取失败时返回 None
+        """
+        import sqlite3
         
-        # 表头
-        headers = ["建筑物", "楼层", "部门", "检查/发现监测点位", "虫害类型", "发现虫害活动"]
-        ws.append(headers)
-        
-        # 设置表头样式
-        header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-        header_font = Font(bold=True, size=11)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        if Path(ref).expanduser().is_file():
+            if not self.extract_pest_data_from_pdf(Path(ref).expanduser(), checkpoint=False):
+                return None
+            details = "，".join(f"{label} {value}" for label, value in self.metadata.labeled())
+            name = Path(ref).name
+            return (f"{name}（{details}）" if details else name), list(self.pest_data)
         
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.border = border
+        if history_db is None:
+            print(f"❌ 文件不存在: {ref}（对比历史库中的报告需要指定 --history-db）")
+            return None
+        try:
+            store = HistoryStore(history_db)
+            try:
+                found = store.find_report(ref)
+                records = store.report_records(found[0]) if found is not None else None
+            finally:
+                store.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ 读取历史库失败: {str(e)}")
+            return None
+        if found is None:
+            print(f"❌ 历史库中没有报告: {ref}")
+            return None
+        report_id, source_file, report_date, metadata = found
+        print(f"\n🗄️ 从历史库读取报告 #{report_id}: {len(records)} 条记录")
+        details = "，".join(f"{label} {value}" for label, value in metadata.labeled())
+        return f"历史库报告 #{report_id} {Path(source_file).name}（{details}）", records
+    
+    def diff_reports(self, old_ref, new_ref, output_dir=None, history_db=None):
+        """对比两份报告，把新增点位、消除点位和数量变化写入"报告对比"工作簿
+
+        Args:
+            old_ref, new_ref: PDF文件路径，或历史库中的报告ID（如 7 或 #7）/报告编号
+            output_dir: 输出目录（如果为None则使用桌面）
+            history_db: SQLite 历史库路径（按报告ID/报告编号对比时需要）
+        """
+        sides = []
+        for ref in (old_ref, new_ref):
+            side = self._load_diff_side(ref, history_db)
+            if side is None:
+                return False
+            sides.append(side)
+        (old_label, old_records), (new_label, new_records) = sides
         
-        # 添加数据
-        for record in self.pest_data:
-            ws.append([
-                record['建筑物'],
-                record['楼层'],
-                record['部门'],
-                record['检查/发现监测点位'],
-                record['虫害类型'],
-                record['发现虫害活动']
-            ])
-        
-        # 设置数据行样式
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-            for cell in row:
-                cell.border = border
-                cell.alignment = Alignment(horizontal='center', vertical='center')
+        diff = diff_records(old_records, new_records)
+        print(f"\n🔀 对比结果: 新增 {len(diff.added)} 个点位，消除 {len(diff.removed)} 个，"
+              f"数量变化 {len(diff.changed)} 个，不变 {diff.unchanged} 个")
         
-        # 设置列宽
-        ws.column_dimensions['A'].width = 15
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 20
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 15
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.output_path = self._resolve_output_dir(output_dir) / f"虫害对比_{timestamp}.xlsx"
+        canvas = SheetCanvas()
+        self._draw_diff_sheet(canvas, diff, old_label, new_label)
+        writer = OpenpyxlExcelWriter(self.output_path, write_only=True)
+        writer.add_canvas_sheet("报告对比", canvas)
+        writer.close()
+        print(f"✅ 对比结果已保存: {self.output_path}")
+        return True
+    
+    def query_history(self, history_db, filters, group_by=(), top=None, csv_path=None, xlsx_path=None):
+        """查询历史库中的记录，输出到终端，或写入 CSV / xlsx 文件
+
+        Args:
+            history_db: SQLite 历史库路径
+            filters: QueryFilters
+            group_by: 分组维度（QUERY_DIMENSIONS 的键），为空时逐条输出记录
+            top: 只取数量最多的前 top 行
+            csv_path, xlsx_path: 输出文件路径；都为 None 时打印到终端（最多 QUERY_PRINT_ROWS 行）
+        """
+        import csv
+        import sqlite3
         
-        # 保存文件
+        if not Path(history_db).expanduser().is_file():
+            print(f"❌ 历史库不存在: {history_db}")
+            return False
+        
+        start = time.perf_counter()
+        try:
+            store = HistoryStore(history_db)
+            try:
+                headers, rows = store.query(filters, group_by, top)
+                rows = list(rows)
+            finally:
+                store.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ 查询历史库失败: {str(e)}")
+            return False
+        elapsed = time.perf_counter() - start
+        
+        if csv_path is None and xlsx_path is None:
+            for line in format_table(headers, rows[:QUERY_PRINT_ROWS]):
+                print(line)
+            if len(rows) > QUERY_PRINT_ROWS:
+                print(f"... 另有 {len(rows) - QUERY_PRINT_ROWS} 行未显示（用 --csv 或 --xlsx 输出全部行）")
+        if csv_path is not None:
+            csv_path = Path(csv_path).expanduser()
+            csv_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+                writer.writerows(rows)
+            print(f"✅ 查询结果已保存: {csv_path}")
+        if xlsx_path is not None:
+            xlsx_path = Path(xlsx_path).expanduser()
+            xlsx_path.parent.mkdir(parents=True, exist_ok=True)
+            writer = OpenpyxlExcelWriter(xlsx_path, write_only=True)
+            writer.add_data_sheet("查询结果", rows, header=headers,
+                                  column_widths={_column_letter(col): 15 for col in range(1, len(headers) + 1)})
+            writer.close()
+            self.output_path = xlsx_path
+            print(f"✅ 查询结果已保存: {xlsx_path}")
+        print(f"🔎 查询到 {len(rows)} 行（耗时 {elapsed:.3f} 秒）")
+        return True
+    
+    def _resolve_output_dir(self, output_dir):
+        """输出目录（None 时为桌面），不存在时创建"""
         if output_dir is None:
             output_dir = Path.home() / "Desktop"
         else:
             output_dir = Path(output_dir)
-        
         output_dir.mkdir(parents=True, exist_ok=True)
+        return output_dir
+    
+    def create_excel(self, output_dir=None, filename=None, write_only=False, with_report=False,
+                     engine='openpyxl', with_pivot=False, history_db=None):
+        """创建Excel文件
+
+        Args:
+            output_dir: 输出目录（如果为None则使用桌面）
+            filename: 输出文件名（如果为None则按时间戳命名）
+            write_only: 是否使用流式（write-only）工作簿，逐行写出预设好样式的单元格，
+                不在内存中保留全部单元格对象，适合数万行以上的数据
+            with_report: 是否同时生成"虫害分析"工作表；统计直接基于内存中的记录，
+                数据表和分析报告一次写入文件，无需保存后再读回
+            engine: Excel 写出引擎（EXCEL_ENGINES 中的 'openpyxl' 或 'xlsxwriter'）
+            with_pivot: 是否同时生成"虫害透视"工作表（建筑物×虫害类型矩阵、楼层和部门统计）
+            history_db: SQLite 历史库路径；不为None时同时生成"趋势"工作表（跨报告的时间序列），
+                并在分析报告中列出数量明显高于自身历史基线的"异常点位"
+        """
+        if not self.pest_data:
+            print("❌ 没有数据可以导出")
+            return False
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"虫害情况报告_{timestamp}.xlsx"
+        print("\n📊 正在生成Excel文件...")
+        
+        output_dir = self._resolve_output_dir(output_dir)
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"虫害情况报告_{timestamp}.xlsx"
         self.output_path = output_dir / filename
         
-        wb.save(self.output_path)
+        try:
+            writer = EXCEL_ENGINES[engine](self.output_path, write_only=write_only)
+        except ImportError as e:
+            print(f"❌ Excel引擎 {engine} 不可用: {str(e)}")
+            return False
+        
+        if self.metadata is not None:
+            writer.set_metadata(self.metadata)
+        
+        # 分析报告和透视表排在数据表之前，共用同一个统计立方体，先绘制到草稿上再写出
+        cube = RollupCube.from_records(self.pest_data) if with_report or with_pivot else None
+        if with_report:
+            anomalies = None
+            anomaly_note = None
+            if history_db is not None:
+                anomalies = self.detect_anomalies(history_db)
+                anomaly_note = self.anomaly_skip_reason
+            print("📈 正在生成分析报告...")
+            canvas = SheetCanvas()
+            self._draw_analysis_report(canvas, cube, self.metadata, anomalies, anomaly_note)
+            writer.add_canvas_sheet("虫害分析", canvas)
+        if with_pivot:
+            canvas = SheetCanvas()
+            self._draw_pivot_sheet(canvas, cube)
+            writer.add_canvas_sheet("虫害透视", canvas)
+        with_trend = False
+        if history_db is not None:
+            canvas = self._trend_canvas(history_db)
+            if canvas is not None:
+                writer.add_canvas_sheet("趋势", canvas)
+                with_trend = True
+        
+        # 数据表逐行写出，同时记录每行摘要
+        self.row_digests = digests = []
+        
+        def rows():
+            for record in self.pest_data:
+                values = record.astuple()
+                digests.append(row_digest(values))
+                yield values
+        
+        writer.add_data_sheet("虫害情况", rows())
+        writer.close()
         print(f"✅ Excel文件已保存: {self.output_path}")
+        if with_report:
+            print("✅ 分析报告已添加到工作表: 虫害分析")
+        if with_pivot:
+            print("✅ 透视表已添加到工作表: 虫害透视")
+        if with_trend:
+            print("✅ 趋势已添加到工作表: 趋势")
         return True
     
-    def generate_analysis_report(self):
-        """生成分析报告作为新的工作表"""
+    def generate_analysis_report(self, with_pivot=False):
+        """为已保存的Excel文件生成分析报告工作表
+
+        用于给已有文件补充分析报告：重新打开文件、添加"虫害分析"工作表并再次保存。
+        完整流程中改由 create_excel(with_report=True) 一次写出数据表和分析报告。
+
+        Args:
+            with_pivot: 是否同时添加"虫害透视"工作表
+        """
         if not self.output_path or not self.output_path.exists():
             print("❌ Excel文件不存在，无法生成报告")
             return False
         
+        from openpyxl import load_workbook
+        
         print("\n📈 正在生成分析报告...")
         
-        # 读取Excel文件
-        wb = load_workbook(self.output_path)
-        df = pd.read_excel(self.output_path, sheet_name='虫害情况')
+        # 读取Excel文件（内存中已有提取结果时直接使用，不再从文件解析数据表）
+        wb = register_named_styles(load_workbook(self.output_path))
+        if self.pest_data:
+            records = self.pest_data
+        else:
+            records = self._records_from_sheet(wb['虫害情况'])
         
-        # 创建分析报告工作表
-        if "虫害分析" in wb.sheetnames:
-            del wb["虫害分析"]
-        ws_report = wb.create_sheet("虫害分析", 0)
-        
-        # 计算统计数据
-        total_records = len(df)
-        total_pests = df['发现虫害活动'].sum()
-        avg_density = total_pests / total_records if total_records > 0 else 0
-        max_single = df['发现虫害活动'].max()
-        
-        # 虫害类型统计
-        pest_type_stats = df.groupby('虫害类型').agg({
-            '虫害类型': 'count',
-            '发现虫害活动': 'sum'
-        }).rename(columns={'虫害类型': '记录数', '发现虫害活动': '总数量'})
-        pest_type_stats['占比'] = (pest_type_stats['总数量'] / total_pests * 100).round(1)
-        pest_type_stats = pest_type_stats.sort_values('总数量', ascending=False)
-        
-        # 建筑物统计
-        building_stats = df.groupby('建筑物').agg({
-            '建筑物': 'count',
-            '发现虫害活动': 'sum'
-        }).rename(columns={'建筑物': '记录数', '发现虫害活动': '总数量'})
-        building_stats['占比'] = (building_stats['总数量'] / total_pests * 100).round(1)
-        building_stats = building_stats.sort_values('总数量', ascending=False)
-        
-        # TOP 10高危区域
-        top10 = df.nlargest(10, '发现虫害活动')
-        
-        # 开始绘制报告
-        self._draw_overview_section(ws_report, total_records, total_pests, avg_density, max_single)
-        self._draw_pest_type_stats(ws_report, pest_type_stats, 10)
-        self._draw_building_stats(ws_report, building_stats, 18 + len(pest_type_stats))
-        self._draw_top10_section(ws_report, top10, 26 + len(pest_type_stats) + len(building_stats))
+        # 创建分析报告工作表（及透视表）
+        cube = RollupCube.from_records(records)
+        sheets = [("虫害分析", lambda canvas, cube: self._draw_analysis_report(canvas, cube, self.metadata))]
+        if with_pivot:
+            sheets.append(("虫害透视", self._draw_pivot_sheet))
+        for index, (title, draw) in enumerate(sheets):
+            if title in wb.sheetnames:
+                del wb[title]
+            canvas = SheetCanvas()
+            draw(canvas, cube)
+            OpenpyxlExcelWriter.draw_canvas(wb.create_sheet(title, index), canvas)
         
         # 保存文件
         wb.save(self.output_path)
-        print(f"✅ 分析报告已添加到工作表: 虫害分析")
+        print("✅ 分析报告已添加到工作表: 虫害分析")
+        if with_pivot:
+            print("✅ 透视表已添加到工作表: 虫害透视")
         return True
     
-    def _draw_overview_section(self, ws, total_records, total_pests, avg_density, max_single):
+    def _draw_analysis_report(self, canvas, cube, metadata=None, anomalies=None, anomaly_note=None):
+        """从统计立方体（RollupCube）取各部分统计，把分析报告绘制到 SheetCanvas 上
+
+        metadata 为单份报告的 ReportMetadata，不为 None 时在标题下方显示报告信息；
+        anomalies 为 detect_anomalies 的结果，不为 None 时在 TOP10 之后绘制异常点位表；
+        检测被跳过时 anomaly_note 为跳过原因，异常点位部分只写该原因。
+        """
+        stats = cube.report_stats()
+        self._draw_overview_section(canvas, stats.total_records, stats.total_pests,
+                                    stats.avg_density, stats.max_single, metadata)
+        self._draw_pest_type_stats(canvas, stats.pest_types, 10)
+        self._draw_building_stats(canvas, stats.buildings, 18 + len(stats.pest_types))
+        top_row = 26 + len(stats.pest_types) + len(stats.buildings)
+        self._draw_top10_section(canvas, stats.top, top_row)
+        if anomalies is not None or anomaly_note is not None:
+            self._draw_anomaly_section(canvas, anomalies or [], top_row + len(stats.top) + 4, anomaly_note)
+    
+    @staticmethod
+    def _records_from_sheet(ws):
+        """从"虫害情况"数据表读回记录（跳过表头和数量为空的行）"""
+        records = []
+        for row in ws.iter_rows(min_row=2, max_col=len(PEST_FIELDS), values_only=True):
+            *texts, count = row
+            if count is None:
+                continue
+            records.append(PestRecord(*('' if value is None else str(value) for value in texts), count))
+        return records
+    
+    def _draw_overview_section(self, canvas, total_records, total_pests, avg_density, max_single,
+                               metadata=None):
         """绘制数据概览部分"""
         # 标题
-        ws.merge_cells('A1:G2')
-        title_cell = ws['A1']
-        title_cell.value = "虫害情况数据概览"
-        title_cell.font = Font(size=16, bold=True)
-        title_cell.alignment = Alignment(horizontal='left', vertical='center')
+        canvas.merge('A1:G2')
+        canvas.write(1, 1, "虫害情况数据概览", STYLE_TITLE)
+        
+        # 报告信息
+        labeled = metadata.labeled() if metadata is not None else []
+        if labeled:
+            canvas.merge('A3:G3')
+            canvas.write(3, 1, "    ".join(f"{label}: {value}" for label, value in labeled), STYLE_CARD_LABEL)
         
         # 概览卡片
         overview_data = [
@@ -300,231 +3090,442 @@ class PestReportExtractor:
             col = i * 2 + 1
             
             # 标签
-            label_cell = ws.cell(row=row, column=col)
-            label_cell.value = label
-            label_cell.font = Font(size=11, bold=True)
-            label_cell.alignment = Alignment(horizontal='left', vertical='center')
-            
-            # 值
-            value_cell = ws.cell(row=row+1, column=col)
-            value_cell.value = value
-            value_cell.font = Font(size=13, bold=True)
-            value_cell.alignment = Alignment(horizontal='left', vertical='center')
+            canvas.write(row, col, label, STYLE_CARD_LABEL)
             
-            # 如果是最大单点，高亮显示
-            if '⚠️' in label:
-                value_cell.fill = PatternFill(start_color="FFF3CD", end_color="FFF3CD", fill_type="solid")
+            # 值（如果是最大单点，高亮显示）
+            canvas.write(row + 1, col, value,
+                         STYLE_CARD_VALUE_HIGHLIGHT if '⚠️' in label else STYLE_CARD_VALUE)
         
         # 设置列宽
-        for col in range(1, 9):
-            ws.column_dimensions[get_column_letter(col)].width = 15
+        for letter in "ABCDEFGH":
+            canvas.set_width(letter, 15)
     
-    def _draw_pest_type_stats(self, ws, pest_type_stats, start_row):
-        """绘制虫害类型统计表"""
+    def _draw_stats_table(self, canvas, title, key_header, stats, start_row):
+        """绘制"记录数 / 总数量 / 占比"统计表（虫害类型统计、建筑物统计共用）
+
+        stats 为按总数量降序的 GroupStat 列表。
+        """
         # 小标题
         row = start_row
-        ws.merge_cells(f'A{row}:D{row}')
-        subtitle_cell = ws[f'A{row}']
-        subtitle_cell.value = "虫害类型统计"
-        subtitle_cell.font = Font(size=13, bold=True)
-        subtitle_cell.alignment = Alignment(horizontal='left', vertical='center')
-        subtitle_cell.fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+        canvas.merge(f'A{row}:D{row}')
+        canvas.write(row, 1, title, STYLE_SECTION_TITLE)
         
         # 表头
         row += 1
-        headers = ['虫害类型', '记录数', '总数量（只）', '占比']
+        headers = [key_header, '记录数', '总数量（只）', '占比']
         for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, size=11)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+            canvas.write(row, col, header, STYLE_HEADER)
         
         # 数据行
-        for pest_type, data in pest_type_stats.iterrows():
+        for stat in stats:
             row += 1
-            values = [pest_type, int(data['记录数']), int(data['总数量']), f"{data['占比']}%"]
+            values = [stat.key, stat.records, stat.total, f"{stat.share}%"]
             for col, value in enumerate(values, 1):
-                cell = ws.cell(row=row, column=col)
-                cell.value = value
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
+                canvas.write(row, col, value, STYLE_BODY)
+    
+    def _draw_pest_type_stats(self, canvas, pest_type_stats, start_row):
+        """绘制虫害类型统计表"""
+        self._draw_stats_table(canvas, "虫害类型统计", '虫害类型', pest_type_stats, start_row)
     
-    def _draw_building_stats(self, ws, building_stats, start_row):
+    def _draw_building_stats(self, canvas, building_stats, start_row):
         """绘制建筑物统计表"""
-        # 小标题
+        self._draw_stats_table(canvas, "建筑物虫害统计", '建筑物', building_stats, start_row)
+    
+    def _draw_pivot_sheet(self, canvas, cube):
+        """绘制透视工作表：建筑物 × 虫害类型数量矩阵，以及楼层、部门统计表"""
+        buildings, pest_types, matrix = cube.pivot('building', 'pest_type')
+        last_letter = _column_letter(len(pest_types) + 2)
+        
+        # 标题
+        canvas.merge(f'A1:{last_letter}2')
+        canvas.write(1, 1, "虫害分布透视", STYLE_TITLE)
+        
+        # 建筑物 × 虫害类型矩阵（含行、列合计）
+        row = 4
+        canvas.merge(f'A{row}:{last_letter}{row}')
+        canvas.write(row, 1, "建筑物 × 虫害类型（数量）", STYLE_SECTION_TITLE)
+        row += 1
+        for col, header in enumerate(['建筑物'] + pest_types + ['合计'], 1):
+            canvas.write(row, col, header, STYLE_HEADER)
+        for building in buildings:
+            row += 1
+            values = [matrix.get((building, pest_type), 0) for pest_type in pest_types]
+            for col, value in enumerate([building] + values + [sum(values)], 1):
+                canvas.write(row, col, value, STYLE_BODY)
+        row += 1
+        column_totals = [sum(matrix.get((building, pest_type), 0) for building in buildings)
+                         for pest_type in pest_types]
+        for col, value in enumerate(['合计'] + column_totals + [cube.total_pests], 1):
+            canvas.write(row, col, value, STYLE_BODY_HIGHLIGHT)
+        
+        # 楼层、部门统计
+        row += 3
+        floor_stats = cube.group_stats('floor')
+        self._draw_stats_table(canvas, "楼层虫害统计", '楼层', floor_stats, row)
+        row += len(floor_stats) + 4
+        self._draw_stats_table(canvas, "部门虫害统计", '部门', cube.group_stats('department'), row)
+        
+        # 设置列宽
+        canvas.set_width('A', 15)
+        for col in range(2, len(pest_types) + 3):
+            canvas.set_width(_column_letter(col), 12)
+    
+    def _trend_canvas(self, history_db):
+        """从历史库的 series 表读取最近几期的时间序列，绘制趋势工作表；读取失败时返回 None"""
+        import sqlite3
+        
+        try:
+            store = HistoryStore(history_db)
+            try:
+                trends = [(title, key_header, store.series(dimension))
+                          for dimension, title, key_header in (
+                              ('building', "建筑物虫害趋势", '建筑物'),
+                              ('pest_type', "虫害类型趋势", '虫害类型'),
+                              ('point', f"监测点位趋势（前{TREND_TOP_KEYS}）", '监测点位'),
+                          )]
+            finally:
+                store.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 读取历史库趋势失败，跳过趋势工作表: {str(e)}")
+            return None
+        
+        # 点位键显示为"建筑物 楼层 部门 监测点位（虫害类型）"
+        title, key_header, (dates, series) = trends[-1]
+        trends[-1] = (title, key_header, (dates, {format_point_key(key): points for key, points in series.items()}))
+        canvas = SheetCanvas()
+        self._draw_trend_sheet(canvas, trends)
+        return canvas
+    
+    def _draw_trend_sheet(self, canvas, trends):
+        """绘制趋势工作表：每个维度一张 键 × 报告日期 的数量表，末列为较上一期的变化
+
+        trends 为 [(小标题, 键列表头, (报告日期列表, {键: {报告日期: (记录数, 总数量)}}))]，
+        各维度的报告日期相同；每个维度按最近一期数量降序只显示前 TREND_TOP_KEYS 个键，
+        数量增加的变化值高亮显示。
+        """
+        dates = trends[0][2][0]
+        last_letter = _column_letter(len(dates) + 2)
+        
+        # 标题
+        canvas.merge(f'A1:{last_letter}2')
+        canvas.write(1, 1, f"虫害趋势（最近 {len(dates)} 期报告）", STYLE_TITLE)
+        
+        row = 4
+        for title, key_header, (_, series) in trends:
+            canvas.merge(f'A{row}:{last_letter}{row}')
+            canvas.write(row, 1, title, STYLE_SECTION_TITLE)
+            row += 1
+            for col, header in enumerate([key_header] + dates + ['较上期'], 1):
+                canvas.write(row, col, header, STYLE_HEADER)
+            
+            totals = {key: [points.get(date, (0, 0))[1] for date in dates] for key, points in series.items()}
+            keys = sorted(totals, key=lambda key: (-totals[key][-1], key))[:TREND_TOP_KEYS]
+            for key in keys:
+                row += 1
+                values = totals[key]
+                change = values[-1] - values[-2] if len(values) > 1 else None
+                for col, value in enumerate([key] + values, 1):
+                    canvas.write(row, col, value, STYLE_BODY)
+                canvas.write(row, len(values) + 2, '-' if change is None else f"{change:+d}",
+                             STYLE_BODY_HIGHLIGHT if change and change > 0 else STYLE_BODY)
+            row += 3
+        
+        # 设置列宽（点位键较长）
+        canvas.set_width('A', 32)
+        for col in range(2, len(dates) + 3):
+            canvas.set_width(_column_letter(col), 12)
+    
+    def _draw_diff_sheet(self, canvas, diff, old_label, new_label):
+        """绘制报告对比工作表：概要，以及新增点位、消除点位、数量变化三张表
+
+        新增点位和数量增加的行高亮显示。
+        """
+        point_headers = ['建筑物', '楼层', '部门', '监测点位', '虫害类型']
+        
+        # 标题和对比的两份报告
+        canvas.merge('A1:H2')
+        canvas.write(1, 1, "虫害报告对比", STYLE_TITLE)
+        for row, label, value in ((3, "旧报告", old_label), (4, "新报告", new_label)):
+            canvas.merge(f'A{row}:H{row}')
+            canvas.write(row, 1, f"{label}: {value}", STYLE_CARD_LABEL)
+        
+        # 概要
+        increased = sum(1 for _, old, new in diff.changed if new > old)
+        cards = [
+            ("新增点位", len(diff.added), STYLE_CARD_VALUE_HIGHLIGHT),
+            ("消除点位", len(diff.removed), STYLE_CARD_VALUE),
+            ("数量增加", increased, STYLE_CARD_VALUE_HIGHLIGHT),
+            ("数量减少", len(diff.changed) - increased, STYLE_CARD_VALUE),
+            ("数量不变", diff.unchanged, STYLE_CARD_VALUE),
+        ]
+        for col, (label, value, style) in enumerate(cards, 1):
+            canvas.write(6, col, label, STYLE_CARD_LABEL)
+            canvas.write(7, col, value, style)
+        
+        sections = [
+            ("新增点位（旧报告中没有）", point_headers + ['数量'],
+             [(list(key) + [count], STYLE_BODY_HIGHLIGHT) for key, count in diff.added]),
+            ("消除点位（新报告中没有）", point_headers + ['旧数量'],
+             [(list(key) + [count], STYLE_BODY) for key, count in diff.removed]),
+            ("数量变化", point_headers + ['旧数量', '新数量', '增减'],
+             [(list(key) + [old, new, f"{new - old:+d}"], STYLE_BODY_HIGHLIGHT if new > old else STYLE_BODY)
+              for key, old, new in diff.changed]),
+        ]
+        row = 9
+        for title, headers, rows in sections:
+            canvas.merge(f'A{row}:H{row}')
+            canvas.write(row, 1, f"{title} - {len(rows)} 个", STYLE_SECTION_TITLE)
+            row += 1
+            for col, header in enumerate(headers, 1):
+                canvas.write(row, col, header, STYLE_HEADER)
+            for values, style in rows:
+                row += 1
+                for col, value in enumerate(values, 1):
+                    canvas.write(row, col, value, style)
+            row += 3
+        
+        # 设置列宽
+        for letter, width in zip('ABCDEFGH', (12, 10, 15, 20, 12, 10, 10, 10)):
+            canvas.set_width(letter, width)
+    
+    def _draw_top10_section(self, canvas, top_records, start_row):
+        """绘制高危区域TOP10表（top_records 为按数量降序的记录）"""
+        # 标题
         row = start_row
-        ws.merge_cells(f'A{row}:D{row}')
-        subtitle_cell = ws[f'A{row}']
-        subtitle_cell.value = "建筑物虫害统计"
-        subtitle_cell.font = Font(size=13, bold=True)
-        subtitle_cell.alignment = Alignment(horizontal='left', vertical='center')
-        subtitle_cell.fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+        canvas.merge(f'A{row}:G{row}')
+        canvas.write(row, 1, "高危区域分析 - TOP 10", STYLE_SECTION_TITLE_LARGE)
         
         # 表头
         row += 1
-        headers = ['建筑物', '记录数', '总数量（只）', '占比']
+        headers = ['排名', '建筑物', '楼层', '部门', '监测点位', '虫害类型', '数量']
         for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, size=11)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+            canvas.write(row, col, header, STYLE_HEADER_ACCENT)
         
         # 数据行
-        for building, data in building_stats.iterrows():
+        for record in top_records:
             row += 1
-            values = [building, int(data['记录数']), int(data['总数量']), f"{data['占比']}%"]
+            rank = row - start_row - 1
+            values = [rank] + list(record.astuple())
+            
+            # 前三名高亮
+            style = STYLE_BODY_HIGHLIGHT if rank <= 3 else STYLE_BODY
             for col, value in enumerate(values, 1):
-                cell = ws.cell(row=row, column=col)
-                cell.value = value
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
+                canvas.write(row, col, value, style)
+        
+        # 设置列宽
+        canvas.set_width('A', 8)
+        canvas.set_width('E', 18)
+        canvas.set_width('G', 10)
     
-    def _draw_top10_section(self, ws, top10_df, start_row):
-        """绘制高危区域TOP10表"""
+    def _draw_anomaly_section(self, canvas, anomalies, start_row, note=None):
+        """绘制异常点位表（anomalies 为按分数降序的 AnomalyPoint 列表），异常行整行高亮
+
+        note 不为 None 时表示未进行检测，只写出该说明，不写"未发现异常点位"。
+        """
         # 标题
         row = start_row
-        ws.merge_cells(f'A{row}:G{row}')
-        title_cell = ws[f'A{row}']
-        title_cell.value = "高危区域分析 - TOP 10"
-        title_cell.font = Font(size=14, bold=True)
-        title_cell.alignment = Alignment(horizontal='left', vertical='center')
-        title_cell.fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+        canvas.merge(f'A{row}:H{row}')
+        canvas.write(row, 1, "异常点位 - 数量明显高于历史基线", STYLE_SECTION_TITLE_LARGE)
+        
+        if note is not None:
+            canvas.merge(f'A{row + 1}:H{row + 1}')
+            canvas.write(row + 1, 1, note, STYLE_BODY)
+            return
         
         # 表头
         row += 1
-        headers = ['排名', '建筑物', '楼层', '部门', '监测点位', '虫害类型', '数量']
+        headers = ['建筑物', '楼层', '部门', '监测点位', '虫害类型', '数量', '历史中位数', '异常分数']
         for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, size=11)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.font = Font(bold=True, size=11, color="FFFFFF")
-            cell.border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+            canvas.write(row, col, header, STYLE_HEADER_ACCENT)
         
         # 数据行
-        for idx, record in top10_df.iterrows():
+        if not anomalies:
             row += 1
-            rank = row - start_row - 1
-            values = [
-                rank,
-                record['建筑物'],
-                record['楼层'],
-                record['部门'],
-                record['检查/发现监测点位'],
-                record['虫害类型'],
-                int(record['发现虫害活动'])
-            ]
-            
+            canvas.merge(f'A{row}:H{row}')
+            canvas.write(row, 1, "未发现异常点位", STYLE_BODY)
+        for anomaly in anomalies[:ANOMALY_MAX_ROWS]:
+            row += 1
+            values = list(anomaly.record.astuple()) + [round(anomaly.baseline, 1), round(anomaly.score, 1)]
             for col, value in enumerate(values, 1):
-                cell = ws.cell(row=row, column=col)
-                cell.value = value
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-                cell.border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                
-                # 前三名高亮
-                if rank <= 3:
-                    cell.fill = PatternFill(start_color="FFF3CD", end_color="FFF3CD", fill_type="solid")
+                canvas.write(row, col, value, STYLE_BODY_HIGHLIGHT)
+        if len(anomalies) > ANOMALY_MAX_ROWS:
+            row += 1
+            canvas.merge(f'A{row}:H{row}')
+            canvas.write(row, 1, f"另有 {len(anomalies) - ANOMALY_MAX_ROWS} 个异常点位未列出", STYLE_BODY)
         
         # 设置列宽
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['E'].width = 18
-        ws.column_dimensions['G'].width = 10
+        canvas.set_width('H', 12)
     
-    def verify_data(self):
-        """验证生成的Excel数据"""
+    def verify_data(self, mode='digest'):
+        """验证生成的Excel数据
+
+        Args:
+            mode: 验证方式
+                'full'   - 用 pandas 读回整张数据表，逐条逐字段比较
+                'digest' - 用只读工作簿流式读取数据表，逐行比较写入时计算的行摘要，
+                           摘要不一致的行再逐字段比较
+                'sample' - 同样流式读取，但只抽查 VERIFY_SAMPLE_SIZE 行的摘要
+                'off'    - 跳过验证
+        """
+        if mode == 'off':
+            print("\n⏭️  跳过数据验证")
+            return True
+        
         if not self.output_path or not self.output_path.exists():
             print("❌ Excel文件不存在，无法验证")
             return False
         
+        if mode != 'full':
+            return self._verify_streaming(sample=mode == 'sample')
+        
+        import pandas as pd
+        
         print("\n🔍 开始验证数据...")
         
         # 读取生成的Excel
         df = pd.read_excel(self.output_path, sheet_name='虫害情况')
         
+        # 缺失的列补为空列，字段不匹配时仍能统计（报告中会先指出字段不匹配）
+        frame = df.reindex(columns=PEST_FIELDS)
+        mismatches = []
+        excel_rows = df.itertuples(index=False, name=None)
+        for i, (original, excel_row) in enumerate(zip(self.pest_data, excel_rows), 1):
+            for key, original_value, excel_value in zip(PEST_FIELDS, original.astuple(), excel_row):
+                if str(original_value) != str(excel_value):
+                    mismatches.append({
+                        'row': i,
+                        'field': key,
+                        'original': original_value,
+                        'excel': excel_value
+                    })
+        
+        return self._report_verification(
+            len(df), df.columns.tolist(), frame.isnull().sum().tolist(), mismatches,
+            frame['建筑物'].value_counts().items(), frame['虫害类型'].value_counts().items(),
+            frame['发现虫害活动'].sum(), "逐条数据验证"
+        )
+    
+    def _verify_streaming(self, sample=False):
+        """流式验证：只读模式逐行读取数据表，按行摘要比对
+
+        一次遍历同时完成计数、空值统计、摘要比对和分布统计，不构建 DataFrame。
+        行摘要优先使用写入时记录的 row_digests（缺失时按内存中的记录现算）；
+        摘要不一致的行逐字段比较，报告到具体行和字段。
+        """
+        import random
+        from collections import Counter
+        from openpyxl import load_workbook
+        
+        print(f"\n🔍 开始验证数据（{'抽样' if sample else '行摘要'}）...")
+        
+        digests = self.row_digests
+        if len(digests) != len(self.pest_data):
+            digests = [row_digest(record.astuple()) for record in self.pest_data]
+        
+        checked = None
+        if sample and len(self.pest_data) > VERIFY_SAMPLE_SIZE:
+            checked = set(random.Random(len(self.pest_data)).sample(range(len(self.pest_data)),
+                                                                    VERIFY_SAMPLE_SIZE))
+        
+        row_count = 0
+        null_counts = [0] * len(PEST_FIELDS)
+        mismatches = []
+        building_counts = Counter()
+        pest_type_counts = Counter()
+        total_pests = 0
+        
+        wb = load_workbook(self.output_path, read_only=True)
+        try:
+            ws = wb['虫害情况']
+            # 流式工作簿不写 <dimension>，只读模式会为求尺寸先额外解析一遍整张表；
+            # 重置尺寸后直接按实际存在的行读取
+            ws.reset_dimensions()
+            rows = ws.iter_rows(values_only=True)
+            actual_columns = list(next(rows, ()))
+            for index, row in enumerate(rows):
+                # 只读模式下行末的空单元格可能被省略，补齐到字段数
+                if len(row) < len(PEST_FIELDS):
+                    row = row + (None,) * (len(PEST_FIELDS) - len(row))
+                row_count += 1
+                for col, value in enumerate(row):
+                    if value is None:
+                        null_counts[col] += 1
+                building, _, _, _, pest_type, count = row[:len(PEST_FIELDS)]
+                building_counts[building] += 1
+                pest_type_counts[pest_type] += 1
+                if isinstance(count, (int, float)):
+                    total_pests += count
+                
+                if index >= len(digests) or (checked is not None and index not in checked):
+                    continue
+                if row_digest(row[:len(PEST_FIELDS)]) != digests[index]:
+                    original = self.pest_data[index]
+                    for key, original_value, excel_value in zip(PEST_FIELDS, original.astuple(), row):
+                        if str(original_value) != str(excel_value):
+                            mismatches.append({
+                                'row': index + 1,
+                                'field': key,
+                                'original': original_value,
+                                'excel': excel_value
+                            })
+        finally:
+            wb.close()
+        
+        if checked is None:
+            check_title = "逐条数据验证（行摘要）"
+        else:
+            check_title = f"抽样数据验证（抽查 {len(checked)} 条）"
+        return self._report_verification(
+            row_count, actual_columns, null_counts, mismatches,
+            building_counts.most_common(), pest_type_counts.most_common(), total_pests, check_title
+        )
+    
+    def _report_verification(self, row_count, actual_columns, null_counts, mismatches,
+                             building_counts, pest_type_counts, total_pests, check_title):
+        """打印数据验证的五项结果（两种验证方式共用），数量或字段不一致时返回 False
+
+        Args:
+            row_count: 数据表中的记录行数
+            actual_columns: 数据表的表头
+            null_counts: 与 PEST_FIELDS 对应的各列空值数
+            mismatches: 不匹配的字段，[{'row', 'field', 'original', 'excel'}]
+            building_counts / pest_type_counts: 按条数降序的 (值, 条数)
+            total_pests: 虫害活动总数
+            check_title: 第4项的标题
+        """
         # 验证1: 记录数量
-        print(f"\n1️⃣ 记录数量验证:")
+        print("\n1️⃣ 记录数量验证:")
         print(f"   提取的原始数据: {len(self.pest_data)} 条")
-        print(f"   Excel文件中数据: {len(df)} 条")
-        if len(self.pest_data) == len(df):
+        print(f"   Excel文件中数据: {row_count} 条")
+        if len(self.pest_data) == row_count:
             print("   ✅ 数量一致")
         else:
             print("   ❌ 数量不一致")
             return False
         
         # 验证2: 字段完整性
-        print(f"\n2️⃣ 字段完整性验证:")
-        expected_columns = ["建筑物", "楼层", "部门", "检查/发现监测点位", "虫害类型", "发现虫害活动"]
-        actual_columns = df.columns.tolist()
-        if expected_columns == actual_columns:
+        print("\n2️⃣ 字段完整性验证:")
+        if actual_columns == PEST_FIELDS:
             print("   ✅ 所有字段完整")
         else:
-            print(f"   ❌ 字段不匹配")
-            print(f"   期望: {expected_columns}")
+            print("   ❌ 字段不匹配")
+            print(f"   期望: {PEST_FIELDS}")
             print(f"   实际: {actual_columns}")
             return False
         
         # 验证3: 数据完整性（无空值）
-        print(f"\n3️⃣ 数据完整性验证:")
-        null_counts = df.isnull().sum()
-        if null_counts.sum() == 0:
+        print("\n3️⃣ 数据完整性验证:")
+        if sum(null_counts) == 0:
             print("   ✅ 无空值数据")
         else:
             print("   ⚠️ 发现空值:")
-            for col, count in null_counts[null_counts > 0].items():
-                print(f"   {col}: {count} 个空值")
+            for col, count in zip(PEST_FIELDS, null_counts):
+                if count:
+                    print(f"   {col}: {count} 个空值")
         
         # 验证4: 逐条对比
-        print(f"\n4️⃣ 逐条数据验证:")
-        all_match = True
-        mismatches = []
-        
-        for i, (original, excel_row) in enumerate(zip(self.pest_data, df.to_dict('records')), 1):
-            for key in original.keys():
-                if str(original[key]) != str(excel_row[key]):
-                    all_match = False
-                    mismatches.append({
-                        'row': i,
-                        'field': key,
-                        'original': original[key],
-                        'excel': excel_row[key]
-                    })
-        
-        if all_match:
+        print(f"\n4️⃣ {check_title}:")
+        if not mismatches:
             print("   ✅ 所有记录验证通过")
         else:
             print(f"   ❌ 发现 {len(mismatches)} 处不匹配:")
@@ -534,21 +3535,24 @@ class PestReportExtractor:
                 print(f"      ...还有 {len(mismatches)-5} 处不匹配")
         
         # 验证5: 统计信息
-        print(f"\n5️⃣ 数据统计验证:")
-        print(f"   建筑物分布:")
-        for building, count in df['建筑物'].value_counts().items():
+        print("\n5️⃣ 数据统计验证:")
+        print("   建筑物分布:")
+        for building, count in building_counts:
             print(f"   - {building}: {count} 条")
         
-        print(f"\n   虫害类型分布:")
-        for pest_type, count in df['虫害类型'].value_counts().items():
+        print("\n   虫害类型分布:")
+        for pest_type, count in pest_type_counts:
             print(f"   - {pest_type}: {count} 次")
         
-        print(f"\n   虫害活动总数: {df['发现虫害活动'].sum()}")
+        print(f"\n   虫害活动总数: {total_pests}")
         
-        print(f"\n✅ 数据验证完成！")
+        print("\n✅ 数据验证完成！")
         return True
     
-    def run(self, pdf_path=None, output_dir=None, auto_open=False, generate_report=True):
+    def run(self, pdf_path=None, output_dir=None, auto_open=False, generate_report=True,
+            streaming=True, locate=True, workers=1, backend='text', resume=False,
+            write_only=False, verify='digest', formats=('xlsx',), excel_engine='openpyxl',
+            generate_pivot=False, history_db=None, append_to=None):
         """运行完整流程
         
         Args:
@@ -556,6 +3560,18 @@ class PestReportExtractor:
             output_dir: 输出目录（如果为None则使用桌面）
             auto_open: 是否自动打开生成的文件
             generate_report: 是否生成分析报告
+            streaming: 是否逐页流式提取虫害情况部分
+            locate: 是否先预扫描定位虫害情况所在页码
+            workers: 并行排版页面的进程数
+            backend: 页面文本提取后端（'text' 或 'words'）
+            resume: 是否从上次中断的页级断点继续提取
+            write_only: 是否用流式（write-only）工作簿写出数据表
+            verify: 数据验证方式（'full'、'digest'、'sample' 或 'off'）
+            formats: 输出格式（EXPORT_FORMATS 的子集），csv/jsonl/parquet 在提取时逐条写出
+            excel_engine: Excel 写出引擎（'openpyxl' 或 'xlsxwriter'）
+            generate_pivot: 是否生成透视工作表
+            history_db: SQLite 历史库路径（为None时不写入历史库）
+            append_to: 总表工作簿路径（为None时不追加到总表）
         """
         print("=" * 60)
         print("🐛 虫害情况数据提取工具 v2.0")
@@ -577,36 +3593,74 @@ class PestReportExtractor:
         
         self.pdf_path = pdf_path
         
-        # 2. 提取数据
+        # 各格式共用同一个文件名（不含扩展名）
+        stem = f"虫害情况报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        exporters = self.open_exporters(formats, output_dir, stem)
+        if exporters is None:
+            return False
+        
+        # 2. 提取数据（CSV/JSONL/Parquet 随解析逐条写出）
         print("\n📊 步骤2: 提取虫害数据")
-        if not self.extract_pest_data_from_pdf(pdf_path):
+        try:
+            extracted = self.extract_pest_data_from_pdf(pdf_path, streaming=streaming, locate=locate,
+                                                        workers=workers, backend=backend,
+                                                        resume=resume, sinks=exporters)
+        except BaseException:
+            self.close_exporters(exporters, success=False)
+            raise
+        self.close_exporters(exporters, success=extracted)
+        if not extracted:
+            return False
+        
+        if history_db is not None and not self.save_to_history(history_db):
             return False
         
+        if append_to is not None and not self.append_to_master(append_to, with_pivot=generate_pivot):
+            return False
+        
+        if 'xlsx' not in formats:
+            self.discard_checkpoint()
+            print("\n" + "=" * 60)
+            print("✅ 所有步骤完成！")
+            for exporter in exporters:
+                print(f"📁 {exporter.label}文件: {exporter.path}")
+            print("=" * 60)
+            return True
+        
         # 3. 生成Excel
         print("\n💾 步骤3: 生成Excel文件")
-        if not self.create_excel(output_dir):
+        # 分析报告（默认生成）与数据表一起基于内存中的记录一次写入
+        if not self.create_excel(output_dir, filename=f"{stem}.xlsx", write_only=write_only,
+                                 with_report=generate_report, engine=excel_engine,
+                                 with_pivot=generate_pivot, history_db=history_db):
             return False
+        self.discard_checkpoint()
         
         # 4. 生成分析报告（默认生成）
         print("\n📈 步骤4: 生成分析报告")
         if generate_report:
-            self.generate_analysis_report()
+            print("   ✅ 已随Excel文件一并生成")
         else:
             print("   ⏭️  跳过分析报告生成")
         
         # 5. 验证数据
         print(f"\n🔍 步骤5: 验证数据")
-        self.verify_data()
+        self.verify_data(verify)
         
         print("\n" + "=" * 60)
         print("✅ 所有步骤完成！")
         print(f"📁 文件位置: {self.output_path}")
+        for exporter in exporters:
+            print(f"📁 {exporter.label}文件: {exporter.path}")
         if generate_report:
             print("📊 分析报告已包含在Excel文件中")
         print("=" * 60)
         
         # 询问是否打开文件（仅GUI模式）
         if HAS_GUI and not auto_open and pdf_path is None:
+            import tkinter as tk
+            from tkinter import messagebox
+            
             root = tk.Tk()
             root.withdraw()
             root.lift()
@@ -640,6 +3694,198 @@ class PestReportExtractor:
             print(f"⚠️ 无法自动打开文件: {e}")
 
 
+def _warm_up_batch_worker():
+    """批量模式进程池初始化：每个工作进程只导入一次重量级依赖"""
+    import pdfplumber  # noqa: F401
+    import openpyxl  # noqa: F401
+
+
+def _process_batch_file(pdf_path, output_dir, generate_report=True, keep_records=False,
+                        cache_dir=None, cache_max_mb=None, backend='text', resume=False,
+                        write_only=False, verify='digest', formats=('xlsx',),
+                        excel_engine='openpyxl', generate_pivot=False, history_db=None, stem=None):
+    """批量模式工作函数：处理单个PDF并返回状态摘要
+
+    每个PDF生成独立的工作簿（以 stem 命名，见 batch_output_stems；为 None 时按PDF文件名），
+    进度输出被收集起来，只在失败时取最后一条错误信息放入摘要。cache_max_mb 为 None 时不使用提取缓存。
+    """
+    start = time.perf_counter()
+    cache = None
+    if cache_max_mb is not None:
+        cache = ExtractionCache(cache_dir, max_bytes=cache_max_mb * 1024 * 1024)
+    extractor = PestReportExtractor(cache=cache)
+    log = io.StringIO()
+    status = "成功"
+    
+    try:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            if stem is None:
+                stem = f"虫害情况报告_{Path(pdf_path).stem}"
+            exporters = extractor.open_exporters(formats, output_dir, stem)
+            if exporters is None:
+                status = "导出失败"
+            else:
+                extracted = False
+                try:
+                    extracted = extractor.extract_pest_data_from_pdf(pdf_path, backend=backend,
+                                                                     resume=resume, sinks=exporters)
+                finally:
+                    extractor.close_exporters(exporters, success=extracted)
+                if not extracted:
+                    status = "提取失败"
+                elif history_db is not None and not extractor.save_to_history(history_db):
+                    status = "入库失败"
+                elif 'xlsx' not in formats:
+                    extractor.discard_checkpoint()
+                elif not extractor.create_excel(output_dir, filename=f"{stem}.xlsx",
+                                                write_only=write_only, with_report=generate_report,
+                                                engine=excel_engine, with_pivot=generate_pivot,
+                                                history_db=history_db):
+                    status = "导出失败"
+                else:
+                    extractor.discard_checkpoint()
+                    if not extractor.verify_data(verify):
+                        status = "验证失败"
+    except Exception as e:
+        status = f"出错: {e}"
+    
+    error = ""
+    if status != "成功":
+        errors = [line.strip() for line in log.getvalue().splitlines() if line.strip().startswith("❌")]
+        error = errors[-1] if errors else ""
+    
+    return {
+        'pdf': str(pdf_path),
+        'status': status,
+        'error': error,
+        'records': len(extractor.pest_data),
+        'elapsed': time.perf_counter() - start,
+        'output': str(extractor.output_path) if extractor.output_path else "",
+        'metadata': extractor.metadata,
+        'pest_data': list(extractor.pest_data) if keep_records and status == "成功" else [],
+    }
+
+
+def collect_batch_pdfs(pdf_dir, pattern="*.pdf"):
+    """按glob模式收集目录下的PDF文件（按文件名排序）"""
+    return sorted(path for path in Path(pdf_dir).expanduser().glob(pattern) if path.is_file())
+
+
+def batch_output_stems(pdf_paths):
+    """批量模式各PDF的输出文件名（不含扩展名），与 pdf_paths 顺序一致
+
+    以全部PDF所在目录的公共父目录为基准，把子目录层级用 _ 拼进文件名，递归匹配
+    （如 --glob "**/*.pdf"）时不同子目录下的同名PDF不会写到同一个文件；
+    拼接后仍然重名（不区分大小写）时追加序号并提示。
+    """
+    paths = [Path(pdf_path) for pdf_path in pdf_paths]
+    if not paths:
+        return []
+    base = Path(os.path.commonpath([str(path.parent) for path in paths]))
+    stems = []
+    seen = set()
+    for path in paths:
+        stem = "虫害情况报告_" + "_".join(path.relative_to(base).with_suffix('').parts)
+        candidate = stem
+        suffix = 2
+        while candidate.casefold() in seen:
+            candidate = f"{stem}_{suffix}"
+            suffix += 1
+        if candidate != stem:
+            print(f"⚠️ 输出文件名重复，{path} 改为输出到 {candidate}")
+        seen.add(candidate.casefold())
+        stems.append(candidate)
+    return stems
+
+
+def run_batch(pdf_paths, output_dir=None, workers=1, generate_report=True, consolidate=False,
+              cache_dir=None, cache_max_mb=None, backend='text', resume=False, write_only=False,
+              verify='digest', formats=('xlsx',), excel_engine='openpyxl', generate_pivot=False,
+              history_db=None, append_to=None):
+    """批量处理多个PDF
+
+    文件分发到进程池中处理，工作进程启动时预先导入依赖，之后复用处理多个文件。
+    每个PDF生成独立工作簿（文件名见 batch_output_stems）；consolidate 为 True 时额外生成一个汇总工作簿；
+    append_to 不为 None 时把成功提取的记录按文件顺序一次追加到该总表。
+    cache_max_mb 不为 None 时各工作进程共用 cache_dir 下的提取缓存。
+
+    Returns:
+        每个文件的处理摘要列表（与 pdf_paths 顺序一致）
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    if output_dir is None:
+        output_dir = Path.home() / "Desktop"
+    output_dir = Path(output_dir).expanduser()
+    
+    print("=" * 60)
+    print(f"🐛 批量处理 {len(pdf_paths)} 个PDF文件（{workers} 个进程）")
+    print("=" * 60)
+    
+    batch_start = time.perf_counter()
+    stems = batch_output_stems(pdf_paths)
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_warm_up_batch_worker) as executor:
+        futures = [
+            executor.submit(_process_batch_file, str(pdf_path), str(output_dir), generate_report,
+                            consolidate or append_to is not None, cache_dir, cache_max_mb,
+                            backend, resume, write_only,
+                            verify, formats, excel_engine, generate_pivot, history_db, stem)
+            for pdf_path, stem in zip(pdf_paths, stems)
+        ]
+        for future in futures:
+            result = future.result()
+            mark = "✅" if result['status'] == "成功" else "❌"
+            print(f"{mark} {Path(result['pdf']).name}: {result['status']} "
+                  f"({result['records']} 条, {result['elapsed']:.2f}s)")
+            results.append(result)
+    
+    if append_to is not None:
+        reports = [(result['pdf'], file_digest(result['pdf']), result['pest_data'])
+                   for result in results if result['status'] == "成功"]
+        if reports:
+            PestReportExtractor().append_to_master(append_to, reports, with_pivot=generate_pivot)
+        else:
+            print("⚠️ 没有成功提取的数据，总表保持不变")
+    
+    if consolidate:
+        consolidated = PestReportExtractor()
+        for result in results:
+            consolidated.pest_data.extend(result.pop('pest_data'))
+        if consolidated.pest_data:
+            stem = f"虫害情况汇总_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            if 'xlsx' in formats:
+                consolidated.create_excel(output_dir, filename=f"{stem}.xlsx",
+                                          write_only=write_only, with_report=generate_report,
+                                          engine=excel_engine, with_pivot=generate_pivot)
+            consolidated.export_records(formats, output_dir, stem)
+        else:
+            print("⚠️ 没有成功提取的数据，跳过汇总工作簿")
+    
+    _print_batch_summary(results, time.perf_counter() - batch_start)
+    return results
+
+
+def _print_batch_summary(results, wall_time):
+    """打印批量处理的汇总表"""
+    print("\n" + "=" * 60)
+    print("📋 批量处理汇总")
+    print("=" * 60)
+    print(f"{'文件':<32} {'状态':<8} {'记录数':>6} {'耗时':>8}")
+    for result in results:
+        print(f"{Path(result['pdf']).name:<32} {result['status']:<8} "
+              f"{result['records']:>6} {result['elapsed']:>7.2f}s")
+        if result['error']:
+            print(f"    {result['error']}")
+    
+    succeeded = sum(1 for result in results if result['status'] == "成功")
+    total_records = sum(result['records'] for result in results)
+    total_elapsed = sum(result['elapsed'] for result in results)
+    print("-" * 60)
+    print(f"成功 {succeeded}/{len(results)} 个文件，共 {total_records} 条记录，"
+          f"累计处理耗时 {total_elapsed:.2f}s，总耗时 {wall_time:.2f}s")
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -658,18 +3904,177 @@ def main():
 
   命令行模式（指定输出目录并自动打开）：
     python pest_report_extractor.py --pdf report.pdf --output ~/Desktop --report --open
+
+  批量模式（处理目录下所有PDF，4个进程，并生成汇总工作簿）：
+    python pest_report_extractor.py --pdf-dir ./reports --workers 4 --report --consolidate
+
+  对比两份报告（PDF，或历史库中的报告ID/报告编号）：
+    python pest_report_extractor.py diff 九月.pdf 十月.pdf --output ~/Desktop
+    python pest_report_extractor.py diff SR-2025-0031 SR-2025-0042 --history-db history.db
+
+  查询历史库（A座 3-5 层 2025 年第三季度的鼠类记录；今年数量最多的 20 个点位）：
+    python pest_report_extractor.py query --history-db history.db --building A座 --floor 3-5 \\
+        --pest-type 鼠 --period 2025Q3
+    python pest_report_extractor.py query --history-db history.db --period 2025 \\
+        --group-by location --top 20 --xlsx top20.xlsx
         """
     )
+    subparsers = parser.add_subparsers(dest='command', metavar='{diff,query}')
+    
+    # 子命令的选项缺省时不覆盖主命令中的同名选项（default=SUPPRESS），放在子命令前后均可
+    diff_parser = subparsers.add_parser('diff', help='按点位对比两份报告：新增、消除和数量变化')
+    diff_parser.add_argument('old', metavar='OLD', help='旧报告：PDF文件路径，或历史库中的报告ID/报告编号')
+    diff_parser.add_argument('new', metavar='NEW', help='新报告：PDF文件路径，或历史库中的报告ID/报告编号')
+    diff_parser.add_argument('--output', type=str, default=argparse.SUPPRESS, help='输出目录（默认为桌面）')
+    diff_parser.add_argument('--history-db', type=str, metavar='DB', default=argparse.SUPPRESS,
+                             help='按报告ID/报告编号对比时读取的 SQLite 历史库')
+    diff_parser.add_argument('--open', action='store_true', default=argparse.SUPPRESS,
+                             help='生成后自动打开Excel文件')
+    diff_parser.add_argument('--no-cache', action='store_true', default=argparse.SUPPRESS,
+                             help='不使用提取缓存')
+    diff_parser.add_argument('--cache-dir', type=str, default=argparse.SUPPRESS,
+                             help='提取缓存目录（默认 ~/.cache/pest_report_extractor）')
+    
+    query_parser = subparsers.add_parser('query', help='查询历史库中的记录：筛选、分组、前N名，输出到终端/CSV/xlsx')
+    query_parser.add_argument('--history-db', type=str, metavar='DB', default=argparse.SUPPRESS,
+                              help='要查询的 SQLite 历史库（必填）')
+    query_parser.add_argument('--building', nargs='+', dest='buildings', metavar='NAME', help='建筑物（可多个）')
+    query_parser.add_argument('--floor', type=parse_floor_range, dest='floors', metavar='RANGE',
+                              help='楼层范围，如 3-5、B2-1、3')
+    query_parser.add_argument('--department', nargs='+', dest='departments', metavar='NAME', help='部门（可多个）')
+    query_parser.add_argument('--location', nargs='+', dest='locations', metavar='NAME',
+                              help='监测点位（可多个）')
+    query_parser.add_argument('--pest-type', nargs='+', dest='pest_types', metavar='NAME',
+                              help='虫害类型（可多个）')
+    query_parser.add_argument('--customer', type=str, help='客户名称')
+    query_parser.add_argument('--period', type=parse_period, help='报告日期所在时间段：2025、2025Q3 或 2025-10')
+    query_parser.add_argument('--since', type=parse_report_date, metavar='DATE',
+                              help='报告日期不早于该日期（YYYY-MM-DD，优先于 --period）')
+    query_parser.add_argument('--until', type=parse_report_date, metavar='DATE',
+                              help='报告日期不晚于该日期（YYYY-MM-DD，优先于 --period）')
+    query_parser.add_argument('--group-by', nargs='+', choices=list(QUERY_DIMENSIONS), default=[],
+                              metavar='DIM', help=f"分组维度（可多个）：{'、'.join(QUERY_DIMENSIONS)}")
+    query_parser.add_argument('--top', type=int, metavar='N', help='按数量降序只取前N行')
+    query_parser.add_argument('--csv', type=str, dest='csv_path', metavar='FILE', help='把结果写入CSV文件')
+    query_parser.add_argument('--xlsx', type=str, dest='xlsx_path', metavar='FILE', help='把结果写入xlsx文件')
     
     parser.add_argument('--pdf', type=str, help='PDF文件路径')
+    parser.add_argument('--pdf-dir', type=str, help='批量模式：处理该目录下的PDF文件')
+    parser.add_argument('--glob', type=str, default='*.pdf',
+                        help='批量模式下匹配PDF的glob模式（默认 *.pdf，可用 **/*.pdf 递归）')
+    parser.add_argument('--consolidate', action='store_true',
+                        help='批量模式下额外生成一个汇总所有记录的工作簿')
     parser.add_argument('--output', type=str, help='输出目录（默认为桌面）')
     parser.add_argument('--open', action='store_true', help='生成后自动打开Excel文件')
     parser.add_argument('--report', action='store_true', help='生成数据分析报告')
+    parser.add_argument('--pivot', action='store_true',
+                        help='生成透视工作表（建筑物×虫害类型矩阵、楼层和部门统计）')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='排版全部页面后再查找虫害情况部分（默认逐页流式提取）')
+    parser.add_argument('--no-locate', action='store_true',
+                        help='不做页码预定位，从第一页开始逐页排版')
+    parser.add_argument('--locate-only', action='store_true',
+                        help='仅输出虫害情况所在的页码范围，不提取数据')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行进程数（默认1）；批量模式下为同时处理的文件数')
+    parser.add_argument('--backend', choices=sorted(PAGE_BACKENDS), default='text',
+                        help='页面文本提取后端：text 为整页排版（默认），words 为按单词坐标重建文本行')
+    parser.add_argument('--resume', action='store_true',
+                        help='从上次中断处继续提取（使用PDF旁的 .pest-checkpoint 断点文件）')
+    parser.add_argument('--write-only', action='store_true',
+                        help='用流式（write-only）工作簿写出数据表，降低大数据量时的内存和耗时')
+    parser.add_argument('--format', nargs='+', choices=EXPORT_FORMATS, default=['xlsx'],
+                        dest='formats', metavar='FORMAT',
+                        help='输出格式，可同时指定多个：xlsx（默认）、csv、jsonl、parquet；'
+                             'csv/jsonl/parquet 在解析时逐条写出')
+    parser.add_argument('--excel-engine', choices=sorted(EXCEL_ENGINES), default='openpyxl',
+                        help='Excel 写出引擎：openpyxl（默认）或 xlsxwriter（constant_memory 模式，'
+                             '内存占用与行数无关）')
+    parser.add_argument('--verify', choices=VERIFY_MODES, default='digest',
+                        help='数据验证方式：full 为 pandas 全量逐字段比较，digest 为流式行摘要比对（默认），'
+                             f'sample 为抽查 {VERIFY_SAMPLE_SIZE} 行，off 为跳过验证')
+    parser.add_argument('--history-db', type=str, metavar='DB',
+                        help='把提取结果写入该 SQLite 历史库（不存在时自动创建），'
+                             '并在Excel中生成跨报告的"趋势"工作表')
+    parser.add_argument('--append-to', type=str, metavar='XLSX',
+                        help='把提取结果追加到该总表工作簿并刷新其分析工作表（不存在时创建）')
+    parser.add_argument('--add-report', type=str, metavar='XLSX',
+                        help='为已有的Excel文件（含"虫害情况"工作表）补充分析报告工作表')
+    parser.add_argument('--no-cache', action='store_true', help='不使用提取缓存')
+    parser.add_argument('--cache-dir', type=str,
+                        help='提取缓存目录（默认 ~/.cache/pest_report_extractor）')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f'提取缓存大小上限，超出后淘汰最久未使用的条目（默认 {DEFAULT_CACHE_MAX_MB}MB）')
     
     args = parser.parse_args()
     
     try:
-        extractor = PestReportExtractor()
+        cache_max_mb = None if args.no_cache else args.cache_max_mb
+        cache = None
+        if cache_max_mb is not None:
+            cache = ExtractionCache(args.cache_dir, max_bytes=cache_max_mb * 1024 * 1024)
+        extractor = PestReportExtractor(cache=cache)
+        
+        if args.command == 'diff':
+            if not extractor.diff_reports(args.old, args.new, output_dir=args.output,
+                                          history_db=args.history_db):
+                sys.exit(1)
+            if args.open:
+                extractor._open_file(extractor.output_path)
+            return
+        
+        if args.command == 'query':
+            if args.history_db is None:
+                print("❌ 错误：query 需要指定 --history-db")
+                sys.exit(1)
+            since, until = args.period or (None, None)
+            filters = QueryFilters(
+                buildings=args.buildings,
+                floors=args.floors,
+                departments=args.departments,
+                locations=args.locations,
+                pest_types=args.pest_types,
+                customer=args.customer,
+                since=args.since or since,
+                until=args.until or until
+            )
+            if not extractor.query_history(args.history_db, filters, group_by=args.group_by, top=args.top,
+                                           csv_path=args.csv_path, xlsx_path=args.xlsx_path):
+                sys.exit(1)
+            return
+        
+        if args.add_report:
+            extractor.output_path = Path(args.add_report).expanduser()
+            if not extractor.generate_analysis_report(with_pivot=args.pivot):
+                sys.exit(1)
+            return
+        
+        if args.pdf_dir:
+            pdf_paths = collect_batch_pdfs(args.pdf_dir, args.glob)
+            if not pdf_paths:
+                print(f"❌ 目录中没有匹配 {args.glob} 的PDF文件: {args.pdf_dir}")
+                sys.exit(1)
+            results = run_batch(
+                pdf_paths,
+                output_dir=args.output,
+                workers=args.workers,
+                generate_report=args.report,
+                consolidate=args.consolidate,
+                cache_dir=args.cache_dir,
+                cache_max_mb=cache_max_mb,
+                backend=args.backend,
+                resume=args.resume,
+                write_only=args.write_only,
+                verify=args.verify,
+                formats=args.formats,
+                excel_engine=args.excel_engine,
+                generate_pivot=args.pivot,
+                history_db=args.history_db,
+                append_to=args.append_to
+            )
+            if any(result['status'] != "成功" for result in results):
+                sys.exit(1)
+            return
         
         # 如果没有提供PDF参数且没有GUI，则提示用法
         if args.pdf is None and not HAS_GUI:
@@ -680,6 +4085,17 @@ def main():
             print("  python pest_report_extractor.py --pdf report.pdf --output ~/Desktop --report")
             return
         
+        if args.locate_only:
+            if args.pdf is None:
+                print("❌ 错误：--locate-only 需要同时指定 --pdf")
+                sys.exit(1)
+            section_range = extractor.locate_pest_section(args.pdf)
+            if section_range is None:
+                print(f"❌ 未定位到虫害情况: {args.pdf}")
+                sys.exit(1)
+            print(f"虫害情况页码范围: {section_range.start_page + 1}-{section_range.end_page + 1}")
+            return
+        
         # 如果没有指定 --report 参数，使用默认值 True
         # 如果明确指定了 --report，则使用指定的值
         generate_report = True if args.pdf is None else args.report
@@ -688,7 +4104,19 @@ def main():
             pdf_path=args.pdf,
             output_dir=args.output,
             auto_open=args.open,
-            generate_report=generate_report
+            generate_report=generate_report,
+            streaming=not args.no_stream,
+            locate=not args.no_locate,
+            workers=args.workers,
+            backend=args.backend,
+            resume=args.resume,
+            write_only=args.write_only,
+            verify=args.verify,
+            formats=args.formats,
+            excel_engine=args.excel_engine,
+            generate_pivot=args.pivot,
+            history_db=args.history_db,
+            append_to=args.append_to
         )
         
         if not success:
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""测试公共夹具：把仓库根目录加入导入路径，并提供合成的多页虫害报告PDF"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _make_report_pdf(path, pages=12, pest_pages=(3, 8), seed=1):
+    """生成一份多页报告：首页为报告头，虫害情况跨越多页，其余页为无关内容"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    from reportlab.pdfgen import canvas
+
+    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    rnd = random.Random(seed)
+    pdf = canvas.Canvas(str(path))
+    for page in range(pages):
+        lines = []
+        if page == 0:
+            lines += ["服务报告", "报告编号: SR-2025-0042", "客户名称: 星光购物中心", "服务日期: 2025-10-15"]
+        if page == pest_pages[0]:
+            lines.append("虫害情况")
+        if pest_pages[0] <= page <= pest_pages[1]:
+            for _ in range(12):
+                pest_type = rnd.choice(["绿化飞虫", "鼠", "蟑螂", "苍蝇"])
+                lines.append(f"{pest_type} 发现虫害活动 - {rnd.randint(1, 30)}")
+                lines.append(f"建筑物: {rnd.choice('ABC')}座, 楼层: {rnd.randint(1, 6)}F, "
+                             f"部门: {rnd.choice(['厨房', '仓库', '大堂'])}, "
+                             f"检查/发现监测点位: 粘板-{rnd.randint(1, 99)}")
+        else:
+            lines += [f"其他内容 第{page}页 行{i}" for i in range(40)]
+        if page == pest_pages[1]:
+            lines += ["服务总结", "本月服务正常"]
+
+        pdf.setFont('STSong-Light', 10)
+        y = 800
+        for line in lines:
+            pdf.drawString(40, y, line)
+            y -= 14
+            if y < 40:
+                break
+        pdf.showPage()
+    pdf.save()
+
+
+@pytest.fixture(scope='session')
+def report_pdf(tmp_path_factory):
+    """虫害情况跨 6 页的 12 页报告"""
+    pytest.importorskip('reportlab')
+    path = tmp_path_factory.mktemp('pdf') / 'report.pdf'
+    _make_report_pdf(path)
+    return path
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""异常点位检测按点位汇总本期数量，与历史库中的点位数量口径一致"""
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import pest_report_extractor as pre  # noqa: E402
+
+
+def _extractor(records):
+    extractor = pre.PestReportExtractor()
+    extractor.metadata = pre.ReportMetadata(None, None, "2025-06-01")
+    extractor.pest_data = records
+    return extractor
+
+
+def test_repeated_point_is_summed_and_reported_once(tmp_path):
+    db_path = tmp_path / "history.db"
+    store = pre.HistoryStore(db_path)
+    quiet = pre.PestRecord("A座", "3F", "厨房", "粘鼠板-12", "鼠", 2)
+    other = pre.PestRecord("B座", "1F", "仓库", "粘鼠板-1", "蟑螂", 1)
+    for month in range(1, 5):
+        # 历史每期同一点位两条记录，各 2 只，点位合计 4 只
+        store.ingest([quiet, quiet, other], f"r{month}.pdf", f"hash{month}", f"2025-0{month}-01")
+    store.close()
+
+    # 本期两条各 4 只，合计 8 只，与单条 8 只的结果相同
+    split = _extractor([pre.PestRecord(*quiet.astuple()[:5], 4)] * 2 + [other])
+    single = _extractor([pre.PestRecord(*quiet.astuple()[:5], 8), other])
+    anomalies = split.detect_anomalies(db_path)
+    assert anomalies == single.detect_anomalies(db_path)
+    assert [anomaly.record.astuple() for anomaly in anomalies] == [("A座", "3F", "厨房", "粘鼠板-12", "鼠", 8)]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""批量模式的输出文件名：不同子目录下的同名PDF不能写到同一个文件"""
+
+import pest_report_extractor as pre
+
+
+def test_output_stems_are_unique(tmp_path):
+    paths = [tmp_path / "top.pdf", tmp_path / "x" / "r.pdf", tmp_path / "x_r.pdf",
+             tmp_path / "y" / "r.pdf", tmp_path / "y" / "R.pdf"]
+    stems = pre.batch_output_stems(paths)
+    assert stems == ["虫害情况报告_top", "虫害情况报告_x_r", "虫害情况报告_x_r_2",
+                     "虫害情况报告_y_r", "虫害情况报告_y_R_2"]
+
+
+def test_flat_directory_keeps_file_names(tmp_path):
+    stems = pre.batch_output_stems([tmp_path / "a.pdf", tmp_path / "b.pdf"])
+    assert stems == ["虫害情况报告_a", "虫害情况报告_b"]
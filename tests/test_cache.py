@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""提取缓存超出大小上限时只淘汰自己的条目"""
+
+import os
+
+import pest_report_extractor as pre
+
+
+def test_evict_keeps_foreign_files(tmp_path):
+    foreign = tmp_path / "user_settings.json"
+    foreign.write_text('{"theme": "dark"}' * 100, encoding='utf-8')
+    os.utime(foreign, (0, 0))
+    old_entry = tmp_path / f"{'0' * 64}.text.v2.json"
+    old_entry.write_text('{}' * 100, encoding='utf-8')
+    os.utime(old_entry, (0, 0))
+
+    cache = pre.ExtractionCache(tmp_path, max_bytes=1)
+    cache.put('ab' * 32, {'records': []})
+
+    assert foreign.exists()
+    assert not old_entry.exists()
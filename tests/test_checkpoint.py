@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""页级断点：最后一行只写了一半时，恢复后追加的页和记录仍然可以读回"""
+
+import shutil
+
+import pytest
+
+pytest.importorskip('pdfplumber')
+
+import pest_report_extractor as pre  # noqa: E402
+
+
+def _extract(pdf_path, resume):
+    extractor = pre.PestReportExtractor()
+    assert extractor.extract_pest_data_from_pdf(str(pdf_path), streaming=False, locate=False,
+                                                resume=resume)
+    return extractor
+
+
+def _load(pdf_path):
+    checkpoint = pre.PageCheckpoint(pdf_path, pre.file_digest(pdf_path))
+    assert checkpoint.load()
+    return checkpoint
+
+
+def test_resume_after_torn_line(report_pdf, tmp_path):
+    pdf_path = tmp_path / "report.pdf"
+    shutil.copy(report_pdf, pdf_path)
+    expected = _extract(pdf_path, resume=False)
+    checkpoint_path = pdf_path.with_name(pdf_path.name + pre.PageCheckpoint.SUFFIX)
+
+    # 保留表头和前两页，第三页只写了一半（进程在写入时被杀）
+    lines = checkpoint_path.read_bytes().splitlines(keepends=True)
+    checkpoint_path.write_bytes(b"".join(lines[:3]) + lines[3][:len(lines[3]) // 2])
+    assert len(_load(pdf_path).pages) == 2
+
+    resumed = _extract(pdf_path, resume=True)
+    assert resumed.pages_laid_out == expected.pages_laid_out - 2
+    assert resumed.pest_data == expected.pest_data
+
+    checkpoint = _load(pdf_path)
+    assert len(checkpoint.pages) == expected.pages_laid_out
+    assert checkpoint.records == expected.pest_data
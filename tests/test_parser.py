@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""虫害记录解析：建筑物详情和监测点位的值折行时都能拼接完整"""
+
+import pest_report_extractor as pre
+
+
+def _parse(text):
+    rejects = []
+    return list(pre.iter_pest_records(text, rejects)), rejects
+
+
+def test_location_value_wrapped():
+    records, rejects = _parse(
+        "鼠 发现虫害活动 - 3\n"
+        "建筑物: A座, 楼层: 3F, 部门: 厨房, 检查/发现监测点位: 粘鼠板-\n"
+        "12\n"
+        "蟑螂 发现虫害活动 - 2\n"
+        "建筑物: B座, 楼层: 1F, 部门: 仓库, 检查/发现监测点位: 粘板-7\n"
+    )
+    assert records == [pre.PestRecord("A座", "3F", "厨房", "粘鼠板-12", "鼠", 3),
+                       pre.PestRecord("B座", "1F", "仓库", "粘板-7", "蟑螂", 2)]
+    assert rejects == []
+
+
+def test_detail_wrapped_before_label():
+    records, rejects = _parse(
+        "苍蝇 发现虫害活动 - 1\n"
+        "建筑物: C座, 楼层: 2F, 部门: 大堂,\n"
+        "检查/发现监测点位: 灭蝇灯-\n"
+        "4\n"
+        "第 3 页\n"
+    )
+    assert records == [pre.PestRecord("C座", "2F", "大堂", "灭蝇灯-4", "苍蝇", 1)]
+    assert rejects == []
+
+
+def test_header_without_detail_is_rejected():
+    records, rejects = _parse("鼠 发现虫害活动 - 3\n其他 内容\n其他 内容\n其他 内容\n")
+    assert records == []
+    assert rejects == [(1, "鼠 发现虫害活动 - 3")]
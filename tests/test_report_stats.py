@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""单次遍历聚合器（aggregate_records / RollupCube）与原 pandas 统计结果必须完全一致"""
+
+import random
+
+import pytest
+
+pytest.importorskip('pandas')
+
+import pest_benchmark as bench  # noqa: E402
+import pest_report_extractor as pre  # noqa: E402
+
+
+def _assert_same_stats(records):
+    expected = bench._pandas_report_stats(records)
+    actual = bench._aggregated_report_stats(records)
+    for name, a, b in zip(bench._REPORT_STATS_NAMES, expected, actual):
+        assert a == b, f"{name}: pandas={a} 聚合器={b}"
+
+
+@pytest.mark.parametrize('records', [
+    [pre.PestRecord("A座", "1F", "厨房", "粘鼠板-1", "鼠", 7)],
+    [pre.PestRecord("A座", "1F", "厨房", f"粘鼠板-{i}", "鼠", 0) for i in range(3)],
+    [pre.PestRecord(building, "2F", "仓库", f"粘鼠板-{i}", pest_type, 5)
+     for i, (building, pest_type) in enumerate([("B座", "蟑螂"), ("A座", "鼠"), ("A座", "蟑螂"), ("B座", "鼠")] * 4)],
+], ids=['single', 'all-zero', 'ties'])
+def test_fixed_cases(records):
+    _assert_same_stats(records)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3, 4])
+def test_random_cases(seed):
+    rnd = random.Random(seed)
+    for _ in range(60):
+        _assert_same_stats(bench._random_report_case(rnd))
+
+
+@pytest.mark.parametrize('seed', [0, 7])
+def test_cube_rollups_match_section_scans(seed):
+    records = [pre.PestRecord.from_dict(record) for record in bench.synthetic_records(5000, seed)]
+    assert bench._cube_sections(records) == bench._per_section_scans(records)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""串行与多进程排版的提取结果必须完全一致（含记录顺序）"""
+
+import pytest
+
+pytest.importorskip('pdfplumber')
+
+import pest_report_extractor as pre  # noqa: E402
+
+
+def _extract(pdf_path, workers, **options):
+    extractor = pre.PestReportExtractor()
+    assert extractor.extract_pest_data_from_pdf(str(pdf_path), workers=workers, checkpoint=False, **options)
+    return [record.astuple() for record in extractor.pest_data]
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'streaming': False, 'locate': False},
+    {'backend': 'words'},
+], ids=['locate', 'full-scan', 'words'])
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_matches_serial(report_pdf, workers, options):
+    serial = _extract(report_pdf, 1, **options)
+    assert len(serial) == 72
+    assert _extract(report_pdf, workers, **options) == serial